@@ -0,0 +1,349 @@
+#!/usr/bin/env python3
+"""
+Dense year x month x category x subcategory aggregate of the transactions.
+
+One pass over transactions-bnp.json (after categorize.py) fills three NumPy
+arrays of shape (years, 12, categories, subcategories): income and expenses
+in cents (positive and negative amounts summed apart, so both gross flows and
+the net are exact) and row counts. Subcategory slot 0 holds rows without a
+subcategory; cancelled rows are left out, as on the statistics page.
+
+Every statistics view is then a slice and a sum over the cube:
+yearly_overview, category_breakdown, subcategory_breakdown,
+category_monthly_heatmap and category_year_comparison return the same
+shapes as their namesakes in statistics-actions.ts (category names stand in
+for ids). The cube saves to a compressed .npz; `build --views` precomputes
+every view for the whole history into one JSON file.
+
+Usage: python3 prisma/aggregate_cube.py build [--data-dir DIR] [--output FILE] [--views FILE]
+       python3 prisma/aggregate_cube.py query VIEW --year Y [--month M] [--cube FILE]
+"""
+
+import argparse
+import json
+import os
+
+import numpy as np
+
+from fuzzy_index import fold
+from months import euros, sum_cents
+
+DATA_DIR = os.path.join(os.path.dirname(__file__), "data")
+CUBE_FILE = "aggregate-cube.npz"
+VIEWS_FILE = "statistics-views.json"
+
+AXES = ("year", "month", "category", "subcategory")
+MEASURES = ("income", "expenses", "net", "count")
+DEFAULT_COLOR = "#6b7280"   # src/lib/formatters.ts
+# toLocaleDateString("fr-FR", { month: "short" })
+MONTH_LABELS = ("janv.", "févr.", "mars", "avr.", "mai", "juin",
+                "juil.", "août", "sept.", "oct.", "nov.", "déc.")
+
+
+def _by_name(name: str) -> str:
+    # Close to localeCompare(..., "fr"): accents and case only break ties
+    return (fold(name), name)
+
+
+class AggregateCube:
+    """Sums and counts indexed by (year, month, category, subcategory slot)."""
+
+    def __init__(self, years, categories, subcategories, income, expenses, count, colors=None):
+        self.years = list(years)
+        self.categories = list(categories)
+        self.subcategories = [list(subs) for subs in subcategories]   # [c][0] == ""
+        self.colors = dict(colors or {})
+        self.income = income
+        self.expenses = expenses
+        self.count = count
+        self._year_idx = {y: i for i, y in enumerate(self.years)}
+        self._cat_idx = {c: i for i, c in enumerate(self.categories)}
+        self._sub_idx = [{s: i for i, s in enumerate(subs)} for subs in self.subcategories]
+
+    @classmethod
+    def build(cls, transactions, categories=()) -> "AggregateCube":
+        """Aggregate in one pass; categories (categories.json) fixes order and colors."""
+        years = sorted({tx["year"] for tx in transactions})
+        cat_names = [c["name"] for c in categories]
+        subs = {c["name"]: [""] + sorted(c["subcategories"]) for c in categories}
+        colors = {c["name"]: c.get("color") for c in categories}
+        year_idx = {y: i for i, y in enumerate(years)}
+        cat_idx = {c: i for i, c in enumerate(cat_names)}
+        sub_idx = {c: {s: i for i, s in enumerate(subs[c])} for c in cat_names}
+
+        flat, cents = [], []
+        for tx in transactions:
+            if tx.get("status") == "CANCELLED":
+                continue
+            cat = tx.get("category") or "Non catégorisé"
+            if cat not in cat_idx:
+                cat_idx[cat] = len(cat_names)
+                cat_names.append(cat)
+                subs[cat] = [""]
+                sub_idx[cat] = {"": 0}
+            sub = tx.get("subcategory") or ""
+            if sub not in sub_idx[cat]:
+                sub_idx[cat][sub] = len(subs[cat])
+                subs[cat].append(sub)
+            flat.append((year_idx[tx["year"]], tx["month"] - 1, cat_idx[cat], sub_idx[cat][sub]))
+            cents.append(round(tx["amount"] * 100))
+
+        shape = (len(years), 12, len(cat_names), max((len(s) for s in subs.values()), default=1))
+        size = int(np.prod(shape))
+        if flat:
+            index = np.ravel_multi_index(np.array(flat, dtype=np.int64).T, shape)
+        else:
+            index = np.zeros(0, dtype=np.int64)
+        amounts = np.array(cents, dtype=np.int64)
+        positive = amounts > 0
+
+        def total(mask):
+            return sum_cents(index[mask], amounts[mask], size).reshape(shape)
+
+        return cls(
+            years, cat_names, [subs[c] for c in cat_names],
+            total(positive), total(~positive),
+            np.bincount(index, minlength=size).astype(np.int64).reshape(shape),
+            colors,
+        )
+
+    # --- Slicing ---
+
+    def select(self, measure="net", year=None, months=None, category=None, subcategory=None):
+        """Slice one measure: (array, names of its remaining axes).
+
+        Sums are in cents. months is a month number or an inclusive
+        (first, last) range, which keeps the month axis. A subcategory
+        ("" for rows without one) needs its category.
+        """
+        if measure not in MEASURES:
+            raise ValueError(f"unknown measure {measure!r} (expected one of {', '.join(MEASURES)})")
+        arrays = [self.income, self.expenses] if measure == "net" else [getattr(self, measure)]
+        index = []
+        axes = []
+        if year is None:
+            index.append(slice(None))
+            axes.append("year")
+        elif year in self._year_idx:
+            index.append(self._year_idx[year])
+        else:
+            # A year without data reads as zeros (e.g. the year before the first)
+            arrays = [np.zeros((1,) + arrays[0].shape[1:], dtype=np.int64)]
+            index.append(0)
+        if months is None:
+            index.append(slice(None))
+            axes.append("month")
+        elif isinstance(months, tuple):
+            index.append(slice(months[0] - 1, months[1]))
+            axes.append("month")
+        else:
+            index.append(months - 1)
+        if category is None:
+            if subcategory is not None:
+                raise ValueError("a subcategory needs its category")
+            index.append(slice(None))
+            axes.append("category")
+        else:
+            index.append(self._cat_idx[category])
+        if subcategory is None:
+            index.append(slice(None))
+            axes.append("subcategory")
+        else:
+            index.append(self._sub_idx[self._cat_idx[category]][subcategory])
+        index = tuple(index)
+        return sum(array[index] for array in arrays), tuple(axes)
+
+    def rollup(self, measure="net", by=(), **filters):
+        """Sum a slice over every axis not in by (kept in AXES order)."""
+        array, axes = self.select(measure, **filters)
+        summed = tuple(i for i, axis in enumerate(axes) if axis not in by)
+        return array.sum(axis=summed) if summed else array
+
+    # --- statistics-actions.ts views ---
+
+    def _color(self, category):
+        return self.colors.get(category) or DEFAULT_COLOR
+
+    def yearly_overview(self, year: int) -> list:
+        income = self.rollup("income", by=("month",), year=year)
+        expenses = self.rollup("expenses", by=("month",), year=year)
+        return [
+            {"month": m + 1, "monthLabel": MONTH_LABELS[m],
+             "income": euros(income[m]), "expenses": abs(euros(expenses[m]))}
+            for m in range(12)
+        ]
+
+    def category_breakdown(self, year: int, month: int) -> list:
+        """Year-to-date spending per category (positive = spent)."""
+        net = self.rollup(by=("category",), year=year, months=(1, month))
+        counts = self.rollup("count", by=("category",), year=year, months=(1, month))
+        rows = [{"category": cat, "color": self._color(cat), "amount": -euros(net[c])}
+                for c, cat in enumerate(self.categories) if counts[c]]
+        return sorted(rows, key=lambda r: -r["amount"])
+
+    def subcategory_breakdown(self, year: int, month: int) -> dict:
+        net, _ = self.select(year=year, months=(1, month))
+        net = net.sum(axis=0)
+        counts = self.select("count", year=year, months=(1, month))[0].sum(axis=0)
+        items = []
+        used = []
+        for c, cat in enumerate(self.categories):
+            for s, sub in enumerate(self.subcategories[c]):
+                if s and counts[c, s]:
+                    items.append({"categoryId": cat, "subCategory": sub,
+                                  "color": self._color(cat), "amount": -euros(net[c, s])})
+            if counts[c, 1:].any():
+                used.append({"id": cat, "name": cat, "color": self._color(cat)})
+        return {"items": items, "categories": sorted(used, key=lambda c: _by_name(c["name"]))}
+
+    def category_monthly_heatmap(self, year: int) -> dict:
+        net, _ = self.select(year=year)                    # (month, category, subcategory)
+        counts = self.select("count", year=year)[0]
+        by_cat = net.sum(axis=2)
+        cat_counts = counts.sum(axis=2)
+        data, sub_data, used = {}, {}, []
+        for c, cat in enumerate(self.categories):
+            months = np.flatnonzero(cat_counts[:, c])
+            if not len(months):
+                continue
+            used.append({"id": cat, "name": cat, "color": self._color(cat)})
+            data[cat] = {int(m) + 1: abs(euros(by_cat[m, c])) for m in months}
+            subs = {}
+            for s, sub in enumerate(self.subcategories[c]):
+                sub_months = np.flatnonzero(counts[:, c, s]) if s else ()
+                if len(sub_months):
+                    subs[sub] = {int(m) + 1: abs(euros(net[m, c, s])) for m in sub_months}
+            if subs:
+                sub_data[cat] = {
+                    "subCategories": [{"id": s, "name": s} for s in sorted(subs, key=_by_name)],
+                    "data": subs,
+                }
+        return {"categories": sorted(used, key=lambda c: _by_name(c["name"])),
+                "data": data, "subCategoryData": sub_data}
+
+    def category_year_comparison(self, year: int, month: int) -> dict:
+        this_month = -self.rollup(by=("category",), year=year, months=month) / 100
+        this_year = -self.rollup(by=("category",), year=year, months=(1, month)) / 100
+        prev_year = -self.rollup(by=("category",), year=year - 1) / 100
+        seen = (self.rollup("count", by=("category",), year=year, months=(1, month))
+                + self.rollup("count", by=("category",), year=year - 1))
+
+        month_abs = np.abs(this_month).sum()
+        year_abs = np.abs(this_year).sum()
+        rows = []
+        for c in np.flatnonzero(seen):
+            cat = self.categories[c]
+            current_period_avg = this_year[c] / month
+            prev_avg = prev_year[c] / 12
+            if prev_avg == 0:
+                diff = 100.0 if current_period_avg != 0 else 0.0
+            else:
+                diff = (current_period_avg - prev_avg) / abs(prev_avg) * 100
+            rows.append({
+                "category": cat,
+                "color": self._color(cat),
+                "currentMonth": round(float(this_month[c]), 2),
+                "currentAvg": float(this_year[c] / 12),
+                "yearlyTotal": round(float(this_year[c]), 2),
+                "percentOfMonthTotal": float(abs(this_month[c]) / month_abs * 100) if month_abs else 0.0,
+                "percentOfYearTotal": float(abs(this_year[c]) / year_abs * 100) if year_abs else 0.0,
+                "prevYearAvg": float(prev_avg),
+                "diffPercent": float(diff),
+            })
+        rows.sort(key=lambda r: _by_name(r["category"]))
+        totals = {
+            "currentMonth": round(float(this_month[this_month > 0].sum()), 2),
+            "yearlyTotal": round(float(this_year[this_year > 0].sum()), 2),
+            "prevYearTotal": round(float(prev_year[prev_year > 0].sum()), 2),
+        }
+        return {"rows": rows, "totals": totals, "month": month}
+
+    def views(self) -> dict:
+        """Every view for every year (and month, where the view takes one)."""
+        return {
+            str(year): {
+                "yearlyOverview": self.yearly_overview(year),
+                "categoryMonthlyHeatmap": self.category_monthly_heatmap(year),
+                "categoryBreakdown": {m: self.category_breakdown(year, m) for m in range(1, 13)},
+                "subCategoryBreakdown": {m: self.subcategory_breakdown(year, m) for m in range(1, 13)},
+                "categoryYearComparison": {m: self.category_year_comparison(year, m)
+                                           for m in range(1, 13)},
+            }
+            for year in self.years
+        }
+
+    # --- Persistence ---
+
+    def save(self, path: str):
+        width = self.income.shape[3]
+        np.savez_compressed(
+            path,
+            years=np.array(self.years, dtype=np.int32),
+            categories=np.array(self.categories, dtype=str),
+            colors=np.array([self.colors.get(c) or "" for c in self.categories], dtype=str),
+            subcategories=np.array([subs + [""] * (width - len(subs)) for subs in self.subcategories],
+                                   dtype=str).reshape(len(self.categories), width),
+            subcategory_counts=np.array([len(subs) for subs in self.subcategories], dtype=np.int32),
+            income=self.income,
+            expenses=self.expenses,
+            count=self.count,
+        )
+
+    @classmethod
+    def load(cls, path: str) -> "AggregateCube":
+        with np.load(path, allow_pickle=False) as data:
+            categories = data["categories"].tolist()
+            subcategories = [row[:n] for row, n in zip(data["subcategories"].tolist(),
+                                                      data["subcategory_counts"].tolist())]
+            colors = {c: color for c, color in zip(categories, data["colors"].tolist()) if color}
+            return cls(data["years"].tolist(), categories, subcategories,
+                       data["income"], data["expenses"], data["count"], colors)
+
+
+VIEWS = {
+    "overview": lambda cube, year, month: cube.yearly_overview(year),
+    "breakdown": lambda cube, year, month: cube.category_breakdown(year, month),
+    "subcategories": lambda cube, year, month: cube.subcategory_breakdown(year, month),
+    "heatmap": lambda cube, year, month: cube.category_monthly_heatmap(year),
+    "comparison": lambda cube, year, month: cube.category_year_comparison(year, month),
+}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Build or query the statistics aggregate cube.")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    build = sub.add_parser("build", help="aggregate transactions-bnp.json into a cube")
+    build.add_argument("--data-dir", default=DATA_DIR)
+    build.add_argument("--output", help=f"cube file (default: DATA_DIR/{CUBE_FILE})")
+    build.add_argument("--views", help="also write every view for every year as JSON")
+
+    query = sub.add_parser("query", help="print one view from a saved cube")
+    query.add_argument("view", choices=sorted(VIEWS))
+    query.add_argument("--year", type=int, required=True)
+    query.add_argument("--month", type=int, default=12)
+    query.add_argument("--cube", default=os.path.join(DATA_DIR, CUBE_FILE))
+    args = parser.parse_args(argv)
+
+    if args.command == "build":
+        with open(os.path.join(args.data_dir, "transactions-bnp.json"), "r", encoding="utf-8") as f:
+            transactions = json.load(f)
+        with open(os.path.join(args.data_dir, "categories.json"), "r", encoding="utf-8") as f:
+            categories = json.load(f)
+        cube = AggregateCube.build(transactions, categories)
+        output = args.output or os.path.join(args.data_dir, CUBE_FILE)
+        cube.save(output)
+        print(f"  Written {output} ({len(cube.years)} years x 12 months x "
+              f"{len(cube.categories)} categories x {cube.income.shape[3]} subcategory slots, "
+              f"{int(cube.count.sum())} transactions)")
+        if args.views:
+            with open(args.views, "w", encoding="utf-8") as f:
+                json.dump(cube.views(), f, ensure_ascii=False, indent=2)
+            print(f"  Written {args.views}")
+    else:
+        cube = AggregateCube.load(args.cube)
+        print(json.dumps(VIEWS[args.view](cube, args.year, args.month), ensure_ascii=False, indent=2))
+
+
+if __name__ == "__main__":
+    main()
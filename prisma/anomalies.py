@@ -0,0 +1,294 @@
+#!/usr/bin/env python3
+"""
+Streaming anomaly detection per (category, subcategory).
+
+For every pair the detector keeps, in constant memory:
+
+- Welford running mean/variance of the row magnitudes;
+- a log-bucketed quantile sketch of their magnitudes (DDSketch: any quantile
+  within ALPHA relative error, from a few hundred counters at most);
+- Welford statistics of its monthly totals.
+
+categorize.py --anomalies feeds each record to observe() as it streams
+through categorisation. A row is scored against the statistics of the rows
+before it, then added: it is an outlier when its magnitude is above the 99th
+percentile and far from the median in interquartile ranges. A month is a
+spike when its total is far above the pair's previous monthly totals; those
+are scored once the stream ends, from one running total per pair and month.
+
+The latest month of the data is still being filled in: its rows are scored
+and reported, but only the months before it are folded into the state.
+The state persists as JSON with the last month folded in, so a later run
+skips the rows of those months and scores the open month again, complete
+or further along, with the newer ones.
+
+Usage: python3 prisma/anomalies.py [--data-dir DIR]  (categorize.py --anomalies runs it inline)
+"""
+
+import argparse
+import json
+import math
+import os
+from collections import defaultdict
+
+DATA_DIR = os.path.join(os.path.dirname(__file__), "data")
+STATE_FILE = "anomaly-state.json"
+REPORT_FILE = "anomalies.json"
+
+ALPHA = 0.02                # sketch relative accuracy
+MIN_HISTORY = 20            # rows seen before a pair's rows are scored
+MIN_MONTHS = 6              # months seen before a pair's months are scored
+OUTLIER_IQRS = 6.0          # robust z-score (median / IQR) above which a row is an outlier
+SPIKE_Z = 3.0               # z-score of a monthly total above which it is a spike
+
+
+class Welford:
+    """Running mean and variance."""
+
+    __slots__ = ("n", "mean", "m2")
+
+    def __init__(self, n=0, mean=0.0, m2=0.0):
+        self.n = n
+        self.mean = mean
+        self.m2 = m2
+
+    def add(self, x: float):
+        self.n += 1
+        delta = x - self.mean
+        self.mean += delta / self.n
+        self.m2 += delta * (x - self.mean)
+
+    @property
+    def std(self) -> float:
+        return math.sqrt(self.m2 / (self.n - 1)) if self.n > 1 else 0.0
+
+    def to_list(self) -> list:
+        return [self.n, self.mean, self.m2]
+
+
+class QuantileSketch:
+    """Log-bucketed histogram of magnitudes with relative-error quantiles.
+
+    Bucket k holds values in (gamma^(k-1), gamma^k]; its midpoint answers
+    any quantile landing in it, within alpha of the true value.
+    """
+
+    def __init__(self, alpha: float = ALPHA, bins=None, zeros: int = 0):
+        self.alpha = alpha
+        self.gamma = (1 + alpha) / (1 - alpha)
+        self.log_gamma = math.log(self.gamma)
+        self.bins = defaultdict(int, bins or {})
+        self.zeros = zeros
+        self.n = zeros + sum(self.bins.values())
+
+    def add(self, x: float):
+        x = abs(x)
+        self.n += 1
+        if x < 0.005:
+            self.zeros += 1
+        else:
+            self.bins[math.ceil(math.log(x) / self.log_gamma)] += 1
+
+    def quantiles(self, qs) -> list:
+        """Values at the sorted quantiles qs, in one walk over the buckets."""
+        result = []
+        ranks = iter([q * (self.n - 1) for q in qs])
+        rank = next(ranks, None)
+        seen = self.zeros
+        while rank is not None and rank < seen:
+            result.append(0.0)
+            rank = next(ranks, None)
+        for k in sorted(self.bins):
+            seen += self.bins[k]
+            while rank is not None and rank < seen:
+                result.append(2 * self.gamma ** k / (self.gamma + 1))
+                rank = next(ranks, None)
+        return result
+
+    def to_dict(self) -> dict:
+        return {"alpha": self.alpha, "zeros": self.zeros,
+                "bins": {str(k): v for k, v in sorted(self.bins.items())}}
+
+    @classmethod
+    def from_dict(cls, data) -> "QuantileSketch":
+        return cls(data["alpha"], {int(k): v for k, v in data["bins"].items()}, data["zeros"])
+
+
+class _PairState:
+    __slots__ = ("amounts", "sketch", "monthly", "cached", "refresh_at")
+
+    def __init__(self, amounts=None, sketch=None, monthly=None):
+        self.amounts = amounts or Welford()
+        self.sketch = sketch or QuantileSketch()
+        self.monthly = monthly or Welford()
+        self.cached = None          # (q25, q50, q75, q99)
+        self.refresh_at = 0
+
+    def thresholds(self):
+        # Quantiles move slowly: recompute after each 10% growth, not per row
+        if self.sketch.n >= self.refresh_at:
+            self.cached = self.sketch.quantiles((0.25, 0.5, 0.75, 0.99))
+            self.refresh_at = self.sketch.n + max(1, self.sketch.n // 10)
+        return self.cached
+
+
+def _month(ordinal: int) -> tuple:
+    return ordinal // 12, ordinal % 12 + 1
+
+
+class AnomalyDetector:
+    """Online per-pair statistics; observe() every record, then finish()."""
+
+    def __init__(self, state=None):
+        state = state or {}
+        self.through = state.get("through")          # last month ordinal folded in
+        self.pairs = {}
+        for key, data in state.get("pairs", {}).items():
+            self.pairs[key] = _PairState(Welford(*data["amounts"]),
+                                         QuantileSketch.from_dict(data["sketch"]),
+                                         Welford(*data["monthly"]))
+        self.month_totals = defaultdict(float)       # (pair, month ordinal) -> total
+        self.latest = None                           # latest month ordinal seen
+        self.pending = []                            # (pair, magnitude) of its rows
+        self.outliers = []
+        self.skipped = 0
+
+    @classmethod
+    def load(cls, path: str) -> "AnomalyDetector":
+        if not os.path.exists(path):
+            return cls()
+        with open(path, "r", encoding="utf-8") as f:
+            return cls(json.load(f))
+
+    def save(self, path: str):
+        state = {
+            "through": self.through,
+            "pairs": {key: {"amounts": pair.amounts.to_list(), "sketch": pair.sketch.to_dict(),
+                            "monthly": pair.monthly.to_list()}
+                      for key, pair in sorted(self.pairs.items())},
+        }
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(state, f, ensure_ascii=False)
+
+    def observe(self, tx):
+        """Score one categorised record, then fold it into its pair's statistics."""
+        if tx.get("status") == "CANCELLED":
+            return
+        ordinal = tx["year"] * 12 + tx["month"] - 1
+        if self.through is not None and ordinal <= self.through:
+            self.skipped += 1
+            return
+        cat, sub = tx.get("category", "Non catégorisé"), tx.get("subcategory")
+        key = f"{cat}/{sub or ''}"
+        pair = self.pairs.get(key)
+        if pair is None:
+            pair = self.pairs[key] = _PairState()
+
+        amount = tx["amount"]
+        magnitude = abs(amount)
+        if pair.sketch.n >= MIN_HISTORY:
+            q25, q50, q75, q99 = pair.thresholds()
+            spread = (q75 - q25) / 1.349 or pair.amounts.std or 1.0
+            score = (magnitude - q50) / spread
+            if magnitude > q99 and score > OUTLIER_IQRS:
+                self.outliers.append({
+                    "year": tx["year"], "month": tx["month"], "date": tx.get("date"),
+                    "label": tx["label"], "amount": amount,
+                    "category": cat, "subcategory": sub,
+                    "score": round(score, 1), "median": round(q50, 2), "p99": round(q99, 2),
+                })
+        # The latest month so far may be the open one: hold its rows back
+        if self.latest is None or ordinal > self.latest:
+            for held, held_magnitude in self.pending:
+                self._fold(held, held_magnitude)
+            self.pending = []
+            self.latest = ordinal
+        if ordinal == self.latest:
+            self.pending.append((pair, magnitude))
+        else:
+            self._fold(pair, magnitude)
+        self.month_totals[(key, ordinal)] += amount
+
+    @staticmethod
+    def _fold(pair, magnitude):
+        pair.amounts.add(magnitude)
+        pair.sketch.add(magnitude)
+
+    def finish(self) -> dict:
+        """Score the new months in order, fold in all but the open one and return the report."""
+        by_pair = defaultdict(list)
+        for (key, ordinal), total in self.month_totals.items():
+            by_pair[key].append((ordinal, total))
+
+        spikes = []
+        for key, months in by_pair.items():
+            monthly = self.pairs[key].monthly
+            for ordinal, total in sorted(months):
+                # Magnitudes: a pair is either mostly spending or mostly income
+                size = abs(total)
+                if monthly.n >= MIN_MONTHS and monthly.std:
+                    z = (size - monthly.mean) / monthly.std
+                    if z > SPIKE_Z:
+                        cat, sub = key.split("/", 1)
+                        year, month = _month(ordinal)
+                        spikes.append({
+                            "year": year, "month": month, "category": cat,
+                            "subcategory": sub or None, "total": round(total, 2),
+                            "usual": round(monthly.mean, 2), "z": round(z, 1),
+                        })
+                if ordinal != self.latest:
+                    monthly.add(size)
+
+        if self.latest is not None:
+            self.through = self.latest - 1
+        self.month_totals.clear()
+        self.pending = []
+        spikes.sort(key=lambda s: (s["year"], s["month"], -s["z"]))
+        self.outliers.sort(key=lambda o: -o["score"])
+        return {"through": None if self.through is None else "%d-%02d" % _month(self.through),
+                "open": None if self.latest is None else "%d-%02d" % _month(self.latest),
+                "outliers": self.outliers, "spikes": spikes}
+
+
+def write_report(report: dict, path: str):
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+
+
+def print_report(report: dict, skipped: int = 0, limit: int = 10):
+    print(f"\nAnomalies: {len(report['outliers'])} unusual amounts, "
+          f"{len(report['spikes'])} monthly spikes"
+          + (f" ({skipped} rows of months already scored skipped)" if skipped else ""))
+    for o in report["outliers"][:limit]:
+        sub = f" / {o['subcategory']}" if o["subcategory"] else ""
+        print(f"  {o['year']}-{o['month']:02d}  {o['amount']:10.2f}  {o['label']}  "
+              f"({o['category']}{sub}, usually {o['median']:.2f})")
+    for s in report["spikes"][:limit]:
+        sub = f" / {s['subcategory']}" if s["subcategory"] else ""
+        print(f"  {s['year']}-{s['month']:02d}  {s['category']}{sub}: {s['total']:.2f} "
+              f"(usually {s['usual']:.2f} either way, z={s['z']})")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Score categorised transactions for anomalies.")
+    parser.add_argument("--data-dir", default=DATA_DIR)
+    args = parser.parse_args(argv)
+
+    # categorize imports this module: import it back only when run on our own
+    from categorize import iter_json_array
+
+    state_path = os.path.join(args.data_dir, STATE_FILE)
+    detector = AnomalyDetector.load(state_path)
+    with open(os.path.join(args.data_dir, "transactions-bnp.json"), "r", encoding="utf-8") as f:
+        for tx in iter_json_array(f):
+            detector.observe(tx)
+    report = detector.finish()
+    detector.save(state_path)
+    report_path = os.path.join(args.data_dir, REPORT_FILE)
+    write_report(report, report_path)
+    print_report(report, detector.skipped)
+    print(f"\n  Written {report_path}")
+
+
+if __name__ == "__main__":
+    main()
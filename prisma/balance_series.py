@@ -0,0 +1,211 @@
+#!/usr/bin/env python3
+"""
+Month-by-month balance series with O(1) carry-over lookups.
+
+getCarryOver (src/lib/monthly-balance.ts) sums every earlier monthly_balances
+row on each call, backfillAllMonthlyBalances recomputes month by month and
+the savings page re-aggregates the Economies rows per year. This computes the
+whole history in one vectorised pass over the transactions, with every month
+from the first to the last laid out contiguously:
+
+- forecast: the month's net amount (COMPLETED, PENDING and PLANNED rows);
+- committed: sum over budgeted categories of max(0, budget - net spend),
+  when budgets are given (budget-suggestions.json rows, see
+  budget_calibration.py); otherwise 0;
+- surplus: forecast - committed, as recomputeMonthlyBalance stores it;
+- carry-over: the exclusive prefix sum of surplus, i.e. getCarryOver;
+- savings: the running balance of the Economies rows per subcategory (money
+  moved to savings is a negative amount on the account, so the balance is
+  the negated running sum), and their total.
+
+The table is columnar JSON in integer cents, so sums are exact and any
+month's values are one index away.
+
+Usage: python3 prisma/balance_series.py build [--data-dir DIR] [--budgets FILE] [--output FILE]
+       python3 prisma/balance_series.py lookup --year Y --month M [--series FILE]
+"""
+
+import argparse
+import json
+import os
+
+import numpy as np
+
+from months import euros, month_name, sum_cents
+
+DATA_DIR = os.path.join(os.path.dirname(__file__), "data")
+SERIES_FILE = "balance-series.json"
+
+# recomputeMonthlyBalance's status filter
+STATUSES = ("COMPLETED", "PENDING", "PLANNED")
+SAVINGS_CATEGORY = "Economies"
+
+
+class BalanceSeries:
+    """Per-month columns in cents from month ordinal first (year * 12 + month - 1)."""
+
+    COLUMNS = ("forecast", "committed", "surplus", "carryOver", "savingsTotal")
+
+    def __init__(self, first: int, columns: dict, savings: dict):
+        self.first = first
+        self.columns = {name: np.asarray(columns[name], dtype=np.int64) for name in self.COLUMNS}
+        self.savings = {sub: np.asarray(values, dtype=np.int64) for sub, values in savings.items()}
+        self.months = len(self.columns["forecast"])
+
+    @classmethod
+    def build(cls, transactions, budgets=()) -> "BalanceSeries":
+        """One pass: bincounts per month, then prefix sums."""
+        rows = [tx for tx in transactions if tx.get("status") in STATUSES]
+        if not rows:
+            empty = {name: [] for name in cls.COLUMNS}
+            return cls(0, empty, {})
+        ordinals = np.array([tx["year"] * 12 + tx["month"] - 1 for tx in rows], dtype=np.int64)
+        cents = np.array([round(tx["amount"] * 100) for tx in rows], dtype=np.int64)
+        first = int(ordinals.min())
+        offsets = ordinals - first
+        months = int(offsets.max()) + 1
+
+        def monthly(mask, index=offsets, size=months):
+            return sum_cents(index[mask], cents[mask], size)
+
+        everything = np.ones(len(rows), dtype=bool)
+        forecast = monthly(everything)
+
+        committed = np.zeros(months, dtype=np.int64)
+        budgets = [b for b in budgets if first <= b["year"] * 12 + b["month"] - 1 < first + months]
+        if budgets:
+            names = sorted({b["category"] for b in budgets})
+            code = {name: i for i, name in enumerate(names)}
+            category = np.array([code.get(tx.get("category") or "Non catégorisé", -1) for tx in rows])
+            budgeted = category >= 0
+            net = monthly(budgeted, category * months + offsets, len(names) * months)
+            spent = np.maximum(-net, 0).reshape(len(names), months)
+            amounts = np.zeros((len(names), months), dtype=np.int64)
+            for b in budgets:
+                offset = b["year"] * 12 + b["month"] - 1 - first
+                amounts[code[b["category"]], offset] = round(b["amount"] * 100)
+            committed = np.maximum(amounts - spent, 0).sum(axis=0)
+
+        surplus = forecast - committed
+        carry_over = np.concatenate(([0], np.cumsum(surplus)[:-1]))
+
+        is_savings = np.array([tx.get("category") == SAVINGS_CATEGORY for tx in rows])
+        subs = sorted({tx.get("subcategory") or "" for tx, saved in zip(rows, is_savings) if saved})
+        savings = {}
+        if subs:
+            code = {sub: i for i, sub in enumerate(subs)}
+            sub_index = np.array([code.get(tx.get("subcategory") or "", 0) for tx in rows])
+            flows = monthly(is_savings, sub_index * months + offsets, len(subs) * months)
+            balances = -np.cumsum(flows.reshape(len(subs), months), axis=1)
+            savings = dict(zip(subs, balances))
+        savings_total = sum(savings.values()) if savings else np.zeros(months, dtype=np.int64)
+
+        return cls(first, {"forecast": forecast, "committed": committed, "surplus": surplus,
+                           "carryOver": carry_over, "savingsTotal": savings_total}, savings)
+
+    def _offset(self, year: int, month: int) -> int:
+        return year * 12 + month - 1 - self.first
+
+    def carry_over(self, year: int, month: int) -> float:
+        """Sum of the surplus of every month before (year, month), in euros."""
+        i = self._offset(year, month)
+        if i <= 0 or not self.months:
+            return 0.0
+        if i >= self.months:
+            last = self.months - 1
+            return euros(self.columns["carryOver"][last] + self.columns["surplus"][last])
+        return euros(self.columns["carryOver"][i])
+
+    def savings_balance(self, year: int, month: int, subcategory: str = None) -> float:
+        """Economies balance at the end of (year, month), for one subcategory or in total."""
+        column = self.columns["savingsTotal"] if subcategory is None else self.savings.get(subcategory)
+        i = min(self._offset(year, month), self.months - 1)
+        if column is None or i < 0:
+            return 0.0
+        return euros(column[i])
+
+    def month(self, year: int, month: int) -> dict:
+        """Every value of one month, in euros."""
+        i = self._offset(year, month)
+        if not 0 <= i < self.months:
+            return {"year": year, "month": month, "forecast": 0.0, "committed": 0.0, "surplus": 0.0,
+                    "carryOver": self.carry_over(year, month),
+                    "savings": self.savings_balance(year, month),
+                    "savingsBySubcategory": {sub: self.savings_balance(year, month, sub)
+                                             for sub in self.savings}}
+        return {
+            "year": year, "month": month,
+            "forecast": euros(self.columns["forecast"][i]),
+            "committed": euros(self.columns["committed"][i]),
+            "surplus": euros(self.columns["surplus"][i]),
+            "carryOver": euros(self.columns["carryOver"][i]),
+            "savings": euros(self.columns["savingsTotal"][i]),
+            "savingsBySubcategory": {sub: euros(values[i]) for sub, values in self.savings.items()},
+        }
+
+    # --- Persistence ---
+
+    def to_dict(self) -> dict:
+        return {
+            "unit": "cents",
+            "first": month_name(self.first) if self.months else None,
+            "months": self.months,
+            **{name: values.tolist() for name, values in self.columns.items()},
+            "savings": {sub: values.tolist() for sub, values in self.savings.items()},
+        }
+
+    @classmethod
+    def from_dict(cls, data) -> "BalanceSeries":
+        first = 0
+        if data["first"]:
+            year, month = map(int, data["first"].split("-"))
+            first = year * 12 + month - 1
+        return cls(first, data, data["savings"])
+
+    def save(self, path: str):
+        # Columns on one line each: a compact table rather than one number per line
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(self.to_dict(), f, ensure_ascii=False, separators=(",", ":"))
+
+    @classmethod
+    def load(cls, path: str) -> "BalanceSeries":
+        with open(path, "r", encoding="utf-8") as f:
+            return cls.from_dict(json.load(f))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Build or query the monthly balance series.")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    build = sub.add_parser("build", help="compute the series from transactions-bnp.json")
+    build.add_argument("--data-dir", default=DATA_DIR)
+    build.add_argument("--budgets", help="budget rows for the committed column "
+                                         "(budget-suggestions.json from budget_calibration.py)")
+    build.add_argument("--output", help=f"series file (default: DATA_DIR/{SERIES_FILE})")
+
+    lookup = sub.add_parser("lookup", help="print one month from a saved series")
+    lookup.add_argument("--year", type=int, required=True)
+    lookup.add_argument("--month", type=int, required=True)
+    lookup.add_argument("--series", default=os.path.join(DATA_DIR, SERIES_FILE))
+    args = parser.parse_args(argv)
+
+    if args.command == "build":
+        with open(os.path.join(args.data_dir, "transactions-bnp.json"), "r", encoding="utf-8") as f:
+            transactions = json.load(f)
+        budgets = ()
+        if args.budgets:
+            with open(args.budgets, "r", encoding="utf-8") as f:
+                budgets = json.load(f)["budgets"]
+        series = BalanceSeries.build(transactions, budgets)
+        output = args.output or os.path.join(args.data_dir, SERIES_FILE)
+        series.save(output)
+        total = series.carry_over(9999, 12)
+        print(f"  Written {output} ({series.months} months, carry-over to date {total:.2f}, "
+              f"{len(series.savings)} savings subcategories)")
+    else:
+        series = BalanceSeries.load(args.series)
+        print(json.dumps(series.month(args.year, args.month), ensure_ascii=False, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,255 @@
+#!/usr/bin/env python3
+"""
+Benchmark categorize.py on synthetic label corpora.
+
+Generates labels that hit each rule tier (exact, prefix, contains), total
+misses and long bank-style descriptions, then measures labels/sec per corpus
+kind, per tier and end to end, plus the rule compile cost. Results are
+written as JSON; pass --baseline with an earlier result to flag throughput
+regressions (exit code 1). Each rate is the median of --repeats timed
+passes, reported with its spread (max - min over median) so a comparison
+can tell noise from a real slowdown.
+
+Usage: python3 prisma/benchmark-categorize.py [--sizes 10000,100000]
+           [--mix exact=40,prefix=25,contains=15,miss=10,long=10]
+           [--extra-rules N] [--output FILE] [--baseline FILE] [--tolerance 0.25]
+"""
+
+import argparse
+import json
+import platform
+import random
+import statistics
+import string
+import sys
+import time
+
+import categorize
+
+DEFAULT_MIX = "exact=40,prefix=25,contains=15,miss=10,long=10"
+KINDS = ("exact", "prefix", "contains", "miss", "long")
+
+FILLER_WORDS = [
+    "gare", "soir", "avec", "paris", "week-end", "lundi", "appart", "bis",
+    "retour", "semaine", "perso", "pote", "centre", "nord", "sud", "rue",
+]
+BANK_PREFIXES = ["PRLV SEPA", "CB", "VIR SEPA RECU", "PAIEMENT PAR CARTE", "FACTURE CARTE DU"]
+
+
+def parse_mix(text: str) -> dict:
+    mix = {}
+    for part in text.split(","):
+        kind, _, weight = part.partition("=")
+        if kind not in KINDS:
+            raise ValueError(f"unknown corpus kind {kind!r} (expected one of {', '.join(KINDS)})")
+        mix[kind] = float(weight)
+    return mix
+
+
+def _gibberish(rng, length: int) -> str:
+    return "".join(rng.choice(string.ascii_lowercase) for _ in range(length))
+
+
+def _vary_case(rng, text: str) -> str:
+    return rng.choice([text, text.capitalize(), text.upper()])
+
+
+def make_label(rng, kind: str) -> str:
+    """Generate one label aimed at the given corpus kind."""
+    if kind == "exact":
+        return rng.choice(list(categorize.EXACT_RULES))
+    if kind == "prefix":
+        prefix = rng.choice(categorize.PREFIX_RULES)[0]
+        return _vary_case(rng, prefix) + rng.choice(["", " ", " " + rng.choice(FILLER_WORDS)])
+    if kind == "contains":
+        pattern = rng.choice(categorize.CONTAINS_RULES)[0]
+        return f"{rng.choice(FILLER_WORDS)} {pattern} {rng.choice(FILLER_WORDS)}"
+    if kind == "miss":
+        return " ".join(_gibberish(rng, rng.randint(4, 9)) for _ in range(rng.randint(1, 3)))
+    # Long bank-style description: reference numbers, dates and a merchant
+    return (f"{rng.choice(BANK_PREFIXES)} {rng.randint(1, 28):02d}/{rng.randint(1, 12):02d} "
+            f"{_gibberish(rng, rng.randint(6, 14)).upper()} {rng.choice(FILLER_WORDS).upper()} "
+            f"REF {rng.randint(10**9, 10**10 - 1)} ID {_gibberish(rng, 12).upper()}")
+
+
+def generate_corpus(size: int, mix: dict, seed: int = 0) -> list:
+    """Return [(kind, label, amount)] with kinds drawn according to mix."""
+    rng = random.Random(seed)
+    kinds = list(mix)
+    weights = [mix[k] for k in kinds]
+    corpus = []
+    for kind in rng.choices(kinds, weights, k=size):
+        amount = round(rng.uniform(-300, 100), 2)
+        corpus.append((kind, make_label(rng, kind), amount))
+    return corpus
+
+
+def synthetic_rules(count: int, seed: int = 0) -> tuple:
+    """count extra exact/prefix/contains rules that the corpora never hit."""
+    rng = random.Random(seed)
+    exact, prefix, contains = {}, [], []
+    for i in range(count):
+        word = "zz" + _gibberish(rng, 8)
+        target = ("Autre", "Autre")
+        if i % 3 == 0:
+            exact[word.capitalize()] = target
+        elif i % 3 == 1:
+            prefix.append((word, *target))
+        else:
+            contains.append((word, *target))
+    return exact, prefix, contains
+
+
+def build_rules(extra_rules: int, profile: bool = False):
+    """Compile the module rule tables, grown by extra_rules synthetic rules."""
+    exact, prefix, contains = synthetic_rules(extra_rules)
+    return categorize.compile_rules(
+        exact={**categorize.EXACT_RULES, **exact},
+        prefix=categorize.PREFIX_RULES + prefix,
+        contains=categorize.CONTAINS_RULES + contains,
+        profile=profile,
+    )
+
+
+def _throughput(rules, items, repeats: int) -> tuple:
+    """Median labels/sec over repeats for matching items [(label, amount)],
+    and the spread of the timed passes as (max - min) / median."""
+    if not items:
+        return None, None
+    match = rules.match
+    rates = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        for label, amount in items:
+            match(label, amount)
+        elapsed = time.perf_counter() - start
+        rates.append(len(items) / elapsed if elapsed else float("inf"))
+    median = statistics.median(rates)
+    return median, (max(rates) - min(rates)) / median if median else 0.0
+
+
+def run_benchmark(size: int, mix: dict, extra_rules: int, repeats: int, seed: int) -> dict:
+    corpus = generate_corpus(size, mix, seed)
+
+    start = time.perf_counter()
+    rules = build_rules(extra_rules)
+    compile_seconds = time.perf_counter() - start
+
+    throughput = {"all": _throughput(rules, [(l, a) for _, l, a in corpus], repeats)}
+    for kind in mix:
+        items = [(l, a) for k, l, a in corpus if k == kind]
+        throughput[kind] = _throughput(rules, items, repeats)
+    throughput = {k: v for k, v in throughput.items() if v[0] is not None}
+
+    # One profiled pass gives the per-tier cost and where each kind really lands
+    profiled = build_rules(extra_rules, profile=True)
+    for _, label, amount in corpus:
+        profiled.match(label, amount)
+    tiers = profiled.profile.report(profiled)["tiers"]
+
+    return {
+        "size": size,
+        "rules": {
+            "exact": len(rules.exact),
+            "prefix": len(rules.prefix),
+            "contains": len(rules.contains),
+            "regex": len(rules.regex),
+        },
+        "compile_seconds": round(compile_seconds, 6),
+        "regex_compile_seconds": round(rules.regex_compile_seconds, 6),
+        "labels_per_second": {k: round(rate) for k, (rate, _) in throughput.items()},
+        "spread": {k: round(spread, 3) for k, (_, spread) in throughput.items()},
+        "tiers": {
+            name: {
+                "calls": t["calls"],
+                "hits": t["hits"],
+                "labels_per_second": round(t["calls"] / t["seconds"]) if t["seconds"] else None,
+            }
+            for name, t in tiers.items()
+        },
+    }
+
+
+def compare_to_baseline(result: dict, baseline: dict, tolerance: float) -> list:
+    """Return human-readable regressions of labels/sec beyond tolerance.
+
+    The allowed drop is widened by the larger spread measured on either
+    side, so a kind whose passes were noisy needs a bigger drop to count.
+    """
+    regressions = []
+    base_runs = {run["size"]: run for run in baseline.get("runs", [])}
+    for run in result["runs"]:
+        base = base_runs.get(run["size"])
+        if base is None:
+            continue
+        for kind, rate in run["labels_per_second"].items():
+            base_rate = base["labels_per_second"].get(kind)
+            if not base_rate:
+                continue
+            spread = max(run.get("spread", {}).get(kind, 0.0),
+                         base.get("spread", {}).get(kind, 0.0))
+            if rate < base_rate * (1 - tolerance - spread):
+                regressions.append(
+                    f"size {run['size']} {kind}: {rate:,} labels/s "
+                    f"vs {base_rate:,} baseline ({rate / base_rate - 1:+.0%}, "
+                    f"allowed -{tolerance + spread:.0%})"
+                )
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark label categorisation.")
+    parser.add_argument("--sizes", default="10000,100000",
+                        help="comma-separated corpus sizes (default: 10000,100000)")
+    parser.add_argument("--mix", default=DEFAULT_MIX,
+                        help=f"corpus kind weights (default: {DEFAULT_MIX})")
+    parser.add_argument("--extra-rules", type=int, default=0,
+                        help="grow the rule tables by N synthetic rules")
+    parser.add_argument("--repeats", type=int, default=7,
+                        help="timing repeats, median kept (default: 7)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="write results JSON to this file")
+    parser.add_argument("--baseline", help="earlier results JSON to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.25,
+                        help="allowed throughput drop vs baseline, on top of the "
+                             "measured spread (default: 0.25)")
+    args = parser.parse_args(argv)
+
+    mix = parse_mix(args.mix)
+    result = {
+        "python": platform.python_version(),
+        "mix": mix,
+        "extra_rules": args.extra_rules,
+        "runs": [],
+    }
+    for size in (int(s) for s in args.sizes.split(",")):
+        run = run_benchmark(size, mix, args.extra_rules, args.repeats, args.seed)
+        result["runs"].append(run)
+        print(f"--- {size} labels (compile {run['compile_seconds'] * 1000:.1f} ms) ---")
+        for kind, rate in run["labels_per_second"].items():
+            print(f"  {kind:10s} {rate:>12,} labels/s  (spread {run['spread'][kind]:.0%})")
+        for name, tier in run["tiers"].items():
+            rate = f"{tier['labels_per_second']:>12,}" if tier["labels_per_second"] else f"{'-':>12}"
+            print(f"  tier {name:8s} {rate} labels/s  ({tier['calls']} calls, {tier['hits']} hits)")
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(result, f, ensure_ascii=False, indent=2)
+        print(f"\nWritten {args.output}")
+
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+        if (baseline.get("mix"), baseline.get("extra_rules")) != (mix, args.extra_rules):
+            print(f"\nWARNING: {args.baseline} was run with a different --mix/--extra-rules")
+        regressions = compare_to_baseline(result, baseline, args.tolerance)
+        if regressions:
+            print(f"\nThroughput regressions vs {args.baseline}:")
+            for line in regressions:
+                print(f"  {line}")
+            sys.exit(1)
+        print(f"\nNo throughput regression vs {args.baseline}")
+
+
+if __name__ == "__main__":
+    main()
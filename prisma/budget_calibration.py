@@ -0,0 +1,211 @@
+#!/usr/bin/env python3
+"""
+Suggest monthly budgets per category from the categorised history.
+
+Every category gets one, except the uncategorised rows and the transfers
+to savings (EXCLUDED), which are not spending.
+
+calibrateBudgets (budget-actions.ts) raises an over-budget category to this
+month's spend, one query per category. This computes suggestions for every
+category and every upcoming month at once from the aggregate cube
+(aggregate_cube.py): the history becomes a (category x month) matrix of net
+spend, as getBudgetsWithSpent counts it (expenses minus refunds, never below
+zero), and every statistic is a vectorised operation over it:
+
+- rolling percentiles: the spend percentiles of every window of WINDOW
+  months (sliding_window_view), the latest of which is the base budget; the
+  earlier ones backtest it (how often a month overran the budget its
+  preceding window gave);
+- seasonality: each calendar month's mean spend over the overall mean,
+  shrunk towards 1 when few years back it;
+- trend: the least-squares slope over the last TREND_WINDOW months,
+  extrapolated from the middle of the base window to the target month and
+  capped at half the base.
+
+suggestion = ceil(base x seasonal factor + trend), in whole euros. Targets
+are the months after the history (--months) or a whole year (--year); a
+target only ever sees the history before the first target month.
+
+Usage: python3 prisma/budget_calibration.py [--data-dir DIR] [--cube FILE]
+           [--months 12 | --year Y] [--window 12] [--percentile 75]
+           [--trend-window 24] [--output FILE]
+"""
+
+import argparse
+import json
+import os
+import time
+
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+
+from aggregate_cube import AggregateCube
+from months import month_name
+
+DATA_DIR = os.path.join(os.path.dirname(__file__), "data")
+OUTPUT_FILE = "budget-suggestions.json"
+
+WINDOW = 12             # months per rolling percentile window
+PERCENTILE = 75         # percentile of the window's monthly spend used as base
+TREND_WINDOW = 24       # months the trend is fitted on
+SEASON_PRIOR = 1.0      # pseudo-years pulling seasonal factors towards 1
+TREND_CAP = 0.5         # trend adjustment at most this share of the base
+
+# Not spending: rows no rule categorised, and money moved to savings
+EXCLUDED = ("Non catégorisé", "Economies")
+
+
+def spend_matrix(cube: AggregateCube):
+    """(spend, first): monthly net spend in euros, shape (categories, months),
+    from month ordinal first (year * 12 + month - 1) to the last month with rows."""
+    net = cube.rollup(by=("year", "month", "category"))              # (years, 12, C) cents
+    counts = cube.rollup("count", by=("year", "month")).ravel()
+    used = np.flatnonzero(counts)
+    if not used.size:
+        return np.zeros((len(cube.categories), 0)), 0
+    # Years without rows are missing from the cube: lay months out contiguously
+    offsets = np.add.outer((np.array(cube.years) - cube.years[0]) * 12, np.arange(12)).ravel()
+    first, last = offsets[used[0]], offsets[used[-1]]
+    spend = np.zeros((len(cube.categories), last - first + 1))
+    months = net.reshape(-1, len(cube.categories))
+    keep = (offsets >= first) & (offsets <= last)
+    spend[:, offsets[keep] - first] = np.maximum(-months[keep], 0).T / 100
+    return spend, cube.years[0] * 12 + first
+
+
+def calibrate(spend, first: int, targets, window: int = WINDOW, percentile: float = PERCENTILE,
+              trend_window: int = TREND_WINDOW) -> dict:
+    """Suggested budgets for the target month ordinals from spend[:, t < targets[0]]."""
+    targets = np.asarray(targets)
+    history = spend[:, :max(0, min(spend.shape[1], targets.min() - first))]
+    n_cats, n_months = history.shape
+    if not n_months:
+        zeros = np.zeros(n_cats)
+        return {"months": 0, "base": zeros, "median": zeros, "p90": zeros, "overrun": zeros,
+                "seasonal": np.ones((n_cats, 12)), "slope": zeros,
+                "budgets": np.zeros((n_cats, len(targets)))}
+    window = min(window, n_months)
+
+    # Rolling percentiles: (3, categories, windows)
+    rolling = np.percentile(sliding_window_view(history, window, axis=1),
+                            (50, percentile, 90), axis=2)
+    median, base, p90 = rolling[:, :, -1]
+    # Backtest: the budget of each window against the month right after it
+    if rolling.shape[2] > 1:
+        actual = history[:, window:]
+        budgeted = rolling[1, :, :-1]
+        active = (actual > 0) | (budgeted > 0)
+        overrun = ((actual > budgeted) & active).sum(axis=1) / np.maximum(active.sum(axis=1), 1)
+    else:
+        overrun = np.zeros(n_cats)
+
+    # Seasonality per calendar month, from the whole history
+    calendar = (first + np.arange(n_months)) % 12
+    per_month = np.bincount(calendar, minlength=12)                   # years backing each month
+    month_means = (history @ np.eye(12)[calendar]) / np.maximum(per_month, 1)
+    overall = history.mean(axis=1, keepdims=True)
+    ratio = np.divide(month_means, overall, out=np.ones_like(month_means), where=overall > 0)
+    seasonal = (per_month * ratio + SEASON_PRIOR) / (per_month + SEASON_PRIOR)
+
+    # Least-squares slope over the last trend_window months
+    fit = history[:, -min(trend_window, n_months):]
+    t = np.arange(fit.shape[1]) - (fit.shape[1] - 1) / 2
+    slope = fit @ t / (t @ t) if fit.shape[1] > 1 else np.zeros(n_cats)
+
+    # The base sits mid-window: extrapolate from there to each target month
+    last = first + n_months - 1
+    horizon = (targets - last) + (window - 1) / 2                    # (targets,)
+    trend = np.clip(np.outer(slope, horizon), -TREND_CAP * base[:, None], TREND_CAP * base[:, None])
+    budgets = np.ceil(np.maximum(base[:, None] * seasonal[:, targets % 12] + trend, 0))
+    return {"months": n_months, "base": base, "median": median, "p90": p90, "overrun": overrun,
+            "seasonal": seasonal, "slope": slope, "budgets": budgets}
+
+
+def suggest_budgets(cube: AggregateCube, targets=None, months: int = 12, window: int = WINDOW,
+                    percentile: float = PERCENTILE, trend_window: int = TREND_WINDOW) -> dict:
+    """Bulk suggestions file: per-category statistics and one row per category and target month.
+
+    targets are month ordinals; by default the months after the history.
+    """
+    spend, first = spend_matrix(cube)
+    if targets is None:
+        targets = range(first + spend.shape[1], first + spend.shape[1] + months)
+    targets = [int(t) for t in targets]
+    result = calibrate(spend, first, targets, window, percentile, trend_window)
+    categories = []
+    budgets = []
+    for c, cat in enumerate(cube.categories):
+        if cat in EXCLUDED or not result["budgets"][c].any():
+            continue
+        categories.append({
+            "category": cat,
+            "median": round(float(result["median"][c]), 2),
+            "base": round(float(result["base"][c]), 2),
+            "p90": round(float(result["p90"][c]), 2),
+            "trendPerMonth": round(float(result["slope"][c]), 2),
+            "overrunRate": round(float(result["overrun"][c]), 3),
+            "seasonal": [round(float(f), 3) for f in result["seasonal"][c]],
+        })
+        for ordinal, amount in zip(targets, result["budgets"][c].tolist()):
+            if amount:
+                budgets.append({"category": cat, "year": ordinal // 12, "month": ordinal % 12 + 1,
+                                "amount": amount})
+    history = result["months"]
+    return {
+        "history": {"from": month_name(first), "through": month_name(first + history - 1),
+                    "months": history},
+        "parameters": {"window": window, "percentile": percentile, "trendWindow": trend_window},
+        "categories": categories,
+        "budgets": budgets,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Suggest monthly budgets from the history.")
+    parser.add_argument("--data-dir", default=DATA_DIR)
+    parser.add_argument("--cube", help="saved aggregate cube (default: build it from DATA_DIR)")
+    target = parser.add_mutually_exclusive_group()
+    target.add_argument("--months", type=int, default=12,
+                        help="months to calibrate after the end of the history (default: 12)")
+    target.add_argument("--year", type=int, help="calibrate every month of this year instead")
+    parser.add_argument("--window", type=int, default=WINDOW,
+                        help=f"months per rolling window (default: {WINDOW})")
+    parser.add_argument("--percentile", type=float, default=PERCENTILE,
+                        help=f"percentile of the window's spend used as base (default: {PERCENTILE})")
+    parser.add_argument("--trend-window", type=int, default=TREND_WINDOW,
+                        help=f"months the trend is fitted on (default: {TREND_WINDOW})")
+    parser.add_argument("--output", help=f"suggestions file (default: DATA_DIR/{OUTPUT_FILE})")
+    args = parser.parse_args(argv)
+    if args.window < 1 or args.trend_window < 1 or args.months < 1:
+        parser.error("--months, --window and --trend-window must be >= 1")
+
+    if args.cube:
+        cube = AggregateCube.load(args.cube)
+    else:
+        with open(os.path.join(args.data_dir, "transactions-bnp.json"), "r", encoding="utf-8") as f:
+            transactions = json.load(f)
+        with open(os.path.join(args.data_dir, "categories.json"), "r", encoding="utf-8") as f:
+            categories = json.load(f)
+        cube = AggregateCube.build(transactions, categories)
+
+    start = time.perf_counter()
+    targets = None if args.year is None else range(args.year * 12, args.year * 12 + 12)
+    result = suggest_budgets(cube, targets, args.months, args.window, args.percentile,
+                             args.trend_window)
+    elapsed = time.perf_counter() - start
+
+    months = 12 if args.year is not None else args.months
+    print(f"Calibrated {len(result['categories'])} categories x {months} months "
+          f"from {result['history']['months']} months of history in {elapsed * 1000:.1f} ms")
+    for c in sorted(result["categories"], key=lambda c: -c["base"])[:15]:
+        print(f"  {c['base']:10.2f}  {c['category']}  (median {c['median']:.2f}, "
+              f"trend {c['trendPerMonth']:+.2f}/month, overran {c['overrunRate']:.0%} of months)")
+
+    output = args.output or os.path.join(args.data_dir, OUTPUT_FILE)
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump(result, f, ensure_ascii=False, indent=2)
+    print(f"\n  Written {output} ({len(result['budgets'])} budgets)")
+
+
+if __name__ == "__main__":
+    main()
@@ -2,17 +2,41 @@
 """
 Categorize uncategorized transactions based on label patterns.
 Reads and updates prisma/data/transactions-bnp.json in place.
+
+Usage: python3 prisma/categorize.py [--jobs N | --stream] [--fuzzy] [--profile]
+                                    [--model FILE [--model-threshold P]] [--overlay FILE]
+                                    [--journal | --replay] [--anomalies] [--sqlite [FILE]]
+                                    [--metrics [FILE] [--trace-memory] [--profile-stage STAGE]]
+                                    [--data-dir DIR]
 """
 
+import argparse
+import hashlib
 import json
+import multiprocessing
 import os
 import re
+import time
+from collections import Counter
+
+import anomalies
+import pipeline_metrics
+from condition_index import ConditionIndex
+from fuzzy_index import DeletionIndex
+from label_clusters import summarise_clusters
+from rule_compiler import live_rules
+from sqlite_store import STORE_FILE, SqliteStore
 
 DATA_DIR = os.path.join(os.path.dirname(__file__), "data")
 
 # Pattern rules: processed in order, first match wins.
 # Each rule: (match_type, pattern, category, subcategory_or_None)
 # match_type: "exact", "startswith", "contains", "regex"
+# Amount/date-conditional rules (CONDITIONAL_RULES) are checked before all of them.
+# An optional fuzzy pass over the exact labels (--fuzzy) runs last, then the
+# optional learned classifier (--model, see ngram_classifier.py), before the
+# amount heuristic. Both are off by default: turning one on recategorises
+# rows the amount heuristic or "Non catégorisé" used to get.
 
 EXACT_RULES = {
     # --- Rentrée ---
@@ -1149,140 +1173,1126 @@ CONTAINS_RULES = [
     ("noel", "Cadeau", "Autre"),
 ]
 
+# Regex rules (searched in label, case-insensitive) - after contains rules.
+# Patterns may use numbered groups but not named ones: they are combined into
+# a single alternation where each rule gets its own named group.
+REGEX_RULES = [
+    # Snacks with an embedded date ("Collation 05/07")
+    (r"^(?:collation|goûter|gouter|snack)\b.*\b\d{1,2}/\d{1,2}\b", "Alimentation", "Resto"),
+]
 
-def categorize_label(label: str, amount: float) -> tuple:
+# Conditional rules: (label, conditions, category, subcategory), checked before
+# every other tier. The label must match exactly (case-insensitive); conditions
+# may hold "min_amount" / "max_amount" (inclusive), "sign" ("+" or "-") and
+# "from" / "until" (ISO dates, inclusive), e.g.
+#   ("loyer", {"min_amount": -900, "max_amount": -700, "from": "2022-01-01"}, "Foyer", "Loyer")
+CONDITIONAL_RULES = []
+
+
+def compile_conditional_rules(rules) -> dict:
+    """Index conditional rules per lowercased label, keeping their order."""
+    by_label = {}
+    for rule in rules:
+        label, conditions, cat, subcat = rule
+        by_label.setdefault(label.lower(), []).append((conditions, (rule, cat, subcat)))
+    return {label: ConditionIndex(entries) for label, entries in by_label.items()}
+
+
+def compile_regex_rules(rules) -> tuple:
+    """Compile regex rules into one alternation with a named group per rule.
+
+    One search() finds the leftmost position where any rule matches, and
+    the lowest-index rule matching there; CompiledRules._match_regex then
+    only looks further right for rules before it. Returns
+    (pattern or None, {group_name: (index, rule)}).
+    """
+    parts = []
+    groups = {}
+    for i, rule in enumerate(rules):
+        pattern = rule[0]
+        if re.compile(pattern).groupindex:
+            raise ValueError(f"regex rule {pattern!r} must not use named groups")
+        name = f"r{i}"
+        parts.append(f"(?P<{name}>(?:{pattern}))")
+        groups[name] = (i, rule)
+    if not parts:
+        return None, groups
+    return re.compile("|".join(parts), re.DOTALL), groups
+
+
+class RuleProfile:
+    """Per-rule hit counts and per-tier call counts and cumulative time."""
+
+    def __init__(self):
+        self.rule_hits = Counter()
+        self.tier_calls = Counter()
+        self.tier_hits = Counter()
+        self.tier_seconds = Counter()
+
+    def wrap(self, name, tier):
+        """Return tier instrumented to record its calls, hits and time."""
+        perf_counter = time.perf_counter
+
+        def profiled(label, lower, amount, date):
+            start = perf_counter()
+            hit = tier(label, lower, amount, date)
+            self.tier_seconds[name] += perf_counter() - start
+            self.tier_calls[name] += 1
+            if hit is not None:
+                self.tier_hits[name] += 1
+                self.rule_hits[hit[0]] += 1
+            return hit
+
+        return profiled
+
+    def reset(self):
+        for counter in (self.rule_hits, self.tier_calls, self.tier_hits, self.tier_seconds):
+            counter.clear()
+
+    def merge(self, other: "RuleProfile"):
+        self.rule_hits.update(other.rule_hits)
+        self.tier_calls.update(other.tier_calls)
+        self.tier_hits.update(other.tier_hits)
+        self.tier_seconds.update(other.tier_seconds)
+
+    def report(self, rules: "CompiledRules") -> dict:
+        """JSON-serialisable report, listing the rules that never fired."""
+        tiers = {}
+        for name, _ in rules.tiers:
+            calls = self.tier_calls[name]
+            seconds = self.tier_seconds[name]
+            tiers[name] = {
+                "calls": calls,
+                "hits": self.tier_hits[name],
+                "seconds": round(seconds, 6),
+                "us_per_call": round(seconds / calls * 1e6, 3) if calls else None,
+            }
+        return {
+            "tiers": tiers,
+            "rule_hits": dict(self.rule_hits.most_common()),
+            "dead_rules": [r for r in rules.rule_ids() if r not in self.rule_hits],
+        }
+
+
+class CompiledRules:
+    """Rule tables indexed for lookup. Build once per process, then reuse.
+
+    With profile=True every tier is wrapped to record hits and timings in
+    self.profile; otherwise the tiers run unwrapped.
+    """
+
+    def __init__(self, exact, prefix, contains, regex=(), fuzzy=False, profile=False,
+                 model=None, model_threshold=0.9, conditional=()):
+        self.conditional_rules = list(conditional)
+        self.conditional = compile_conditional_rules(self.conditional_rules)
+        self.exact = dict(exact)
+        self.regex = list(regex)
+
+        # Prefix/contains rules that can never fire (shadowed, duplicated or
+        # uppercase, see rule_compiler.py) are dropped: only live ones are scanned
+        self.prefix_source = list(prefix)
+        self.contains_source = list(contains)
+        self.prefix, self.prefix_dead = live_rules(self.prefix_source, "prefix")
+        self.contains, self.contains_dead = live_rules(self.contains_source, "contains")
+
+        start = time.perf_counter()
+        self.regex_pattern, self.regex_groups = compile_regex_rules(self.regex)
+        self.regex_compile_seconds = time.perf_counter() - start
+        self.regex_heads = {}   # n -> combined pattern of the first n regex rules
+
+        # Near-miss lookup over accent/case-folded exact keys
+        self.fuzzy = DeletionIndex(self.exact.items()) if fuzzy else None
+
+        # Prefix rules bucketed by first character: a label can only start
+        # with prefixes sharing its first character (or an empty prefix).
+        # Buckets keep the original rule order, so first match still wins.
+        first_chars = {p[0] for p, _, _ in self.prefix if p}
+        self.prefix_index = {
+            ch: [r for r in self.prefix if not r[0] or r[0][0] == ch]
+            for ch in first_chars
+        }
+        self.prefix_default = [r for r in self.prefix if not r[0]]
+
+        # Learned fallback (NgramClassifier); predictions are cached per label
+        # so that prime_model() can score many labels in one batch
+        self.model = model
+        self.model_threshold = model_threshold
+        self._model_cache = {}
+
+        self._build_tiers(profile)
+
+    def _build_tiers(self, profile):
+        self.tiers = [
+            ("conditional", self._match_conditional),
+            ("exact", self._match_exact),
+            ("prefix", self._match_prefix),
+            ("contains", self._match_contains),
+        ]
+        if self.regex_pattern is not None:
+            self.tiers.append(("regex", self._match_regex))
+        if self.fuzzy is not None:
+            self.tiers.append(("fuzzy", self._match_fuzzy))
+        if self.model is not None:
+            self.tiers.append(("model", self._match_model))
+        self.tiers.append(("amount", self._match_amount))
+        self.tiers.append(("default", self._match_default))
+
+        self.profile = RuleProfile() if profile else None
+        if self.profile is not None:
+            self.tiers = [(name, self.profile.wrap(name, tier)) for name, tier in self.tiers]
+
+    def match(self, label: str, amount: float, date: str = None) -> tuple:
+        """Return (rule_id, category, subcategory) for a given label.
+
+        date (ISO) is only used by conditional rules.
+        """
+        lower = label.lower()
+        for _, tier in self.tiers:
+            hit = tier(label, lower, amount, date)
+            if hit is not None:
+                return hit
+
+    def rule_ids(self) -> list:
+        """Ids of every explicit rule, in tier order, as returned by match()."""
+        ids = [f"conditional:{label}#{i}"
+               for label, index in self.conditional.items() for i in range(len(index.values))]
+        ids += [f"exact:{label}" for label in self.exact]
+        ids += [f"prefix:{p}" for p, _, _ in self.prefix]
+        ids += [f"contains:{p}" for p, _, _ in self.contains]
+        ids += [f"regex:{p}" for p, _, _ in self.regex]
+        return list(dict.fromkeys(ids))
+
+    # Tiers, tried in order by match(). Each returns (rule_id, cat, subcat) or None.
+
+    def _match_conditional(self, label, lower, amount, date):
+        index = self.conditional.get(lower)
+        if index is not None:
+            hit = index.lookup(amount, date)
+            if hit is not None:
+                idx, (_, cat, subcat) = hit
+                return (f"conditional:{lower}#{idx}", cat, subcat)
+
+    def _match_exact(self, label, lower, amount, date):
+        hit = self.exact.get(label)
+        if hit is not None:
+            return (f"exact:{label}",) + hit
+
+    def _match_prefix(self, label, lower, amount, date):
+        for prefix, cat, subcat in self.prefix_index.get(lower[:1], self.prefix_default):
+            if lower.startswith(prefix):
+                return (f"prefix:{prefix}", cat, subcat)
+
+    def _match_contains(self, label, lower, amount, date):
+        for pattern, cat, subcat in self.contains:
+            if pattern in lower:
+                return (f"contains:{pattern}", cat, subcat)
+
+    def _match_regex(self, label, lower, amount, date):
+        # All regex rules are scanned by one combined pattern. The first rule
+        # matching anywhere wins: after a hit, only the rules before it are
+        # searched again, right of where the hit starts (nothing earlier
+        # matched to its left). Usually the first search settles it.
+        combined, pos, best = self.regex_pattern, 0, None
+        while combined is not None:
+            m = combined.search(lower, pos)
+            if m is None:
+                break
+            index, best = self.regex_groups[m.lastgroup]
+            combined = self._regex_head(index) if index else None
+            pos = m.start() + 1
+        if best is not None:
+            pattern, cat, subcat = best
+            return (f"regex:{pattern}", cat, subcat)
+
+    def _regex_head(self, n):
+        combined = self.regex_heads.get(n)
+        if combined is None:
+            combined = self.regex_heads[n] = compile_regex_rules(self.regex[:n])[0]
+        return combined
+
+    def _match_fuzzy(self, label, lower, amount, date):
+        # Closest exact key within the edit-distance bound
+        hit = self.fuzzy.lookup(label)
+        if hit is not None:
+            key, (cat, subcat), _ = hit
+            return (f"fuzzy:{key}", cat, subcat)
+
+    def _match_model(self, label, lower, amount, date):
+        if label not in self._model_cache:
+            self.prime_model([label])
+        hit = self._model_cache[label]
+        if hit is not None:
+            cat, subcat, _ = hit
+            return (f"model:{cat}/{subcat or ''}", cat, subcat)
+
+    def prime_model(self, labels, reset: bool = False):
+        """Score labels with the classifier in one batch and cache the results.
+
+        reset drops earlier predictions first, to bound memory when streaming.
+        """
+        if self.model is None:
+            return
+        if reset:
+            self._model_cache.clear()
+        todo = [label for label in dict.fromkeys(labels) if label not in self._model_cache]
+        for label, result in zip(todo, self.model.predict(todo, self.model_threshold)):
+            self._model_cache[label] = result
+
+    def _match_amount(self, label, lower, amount, date):
+        if amount > 0:
+            # Positive amounts are usually income
+            return ("amount:positive", "Rentrée", "Autre")
+
+    def _match_default(self, label, lower, amount, date):
+        return ("default", "Non catégorisé", None)
+
+    def categorize(self, label: str, amount: float, date: str = None) -> tuple:
+        """Return (category, subcategory) for a given label."""
+        return self.match(label, amount, date)[1:]
+
+    def decision_key(self, label: str, amount: float, date: str = None) -> tuple:
+        """Key under which a categorisation decision can be reused.
+
+        Only the label and the sign of the amount matter, unless the label has
+        conditional rules.
+        """
+        if label.lower() in self.conditional:
+            return (label, amount, date)
+        return (label, amount > 0)
+
+
+    def overlay(self, exact=None, prefix=(), contains=(), disable=(), profile=False) -> "RuleOverlay":
+        """Layer per-user rules on top of this rule set, see RuleOverlay."""
+        return RuleOverlay(self, exact, prefix, contains, disable, profile)
+
+
+class RuleOverlay:
+    """Per-user rules layered over a shared base rule set, copy-on-write.
+
+    Overlay rules come first within their tier; disable lists base rule ids
+    ("prefix:maman", "exact:Maman", ...) that no longer apply. The overlay
+    wraps the base CompiledRules: whatever it does not override (the
+    conditional, regex, model, amount and default tiers and their tables)
+    is read from the base. The base's lookup structures are shared, not
+    rebuilt: only the prefix buckets the overlay touches are copied, the
+    exact and fuzzy tiers check the overlay's own small tables before the
+    base ones, and the contains list is only copied when a contains rule is
+    disabled. Disabling a base rule revives the rules it shadowed. Memory
+    per overlay grows with its overrides.
+    """
+
+    def __init__(self, base, exact=None, prefix=(), contains=(), disable=(), profile=False):
+        self.base = base
+        self.overlay_exact = {label: tuple(value) for label, value in (exact or {}).items()}
+        self.overlay_prefix = [tuple(r) for r in prefix]
+        self.overlay_contains = [tuple(r) for r in contains]
+        self.disabled = set(disable)
+        for rule_id in self.disabled:
+            if rule_id.startswith("exact:"):
+                # None masks the base entry without adding one
+                self.overlay_exact.setdefault(rule_id[len("exact:"):], None)
+        self.masked = {label for label, value in self.overlay_exact.items() if value is None}
+
+        self.overlay_fuzzy = None
+        if base.fuzzy is not None:
+            added = [(k, v) for k, v in self.overlay_exact.items() if v is not None]
+            self.overlay_fuzzy = DeletionIndex(added) if added else None
+
+        # Copy-on-write prefix buckets: new dict of references to the base
+        # buckets, replacing only those an overlay rule or a disabled rule touches
+        self.prefix_index = dict(base.prefix_index)
+        self.prefix_default = base.prefix_default
+        touched = {p[:1] for p, _, _ in self.overlay_prefix}
+        touched |= {rule_id[len("prefix:"):][:1] for rule_id in self.disabled
+                    if rule_id.startswith("prefix:")}
+        for ch in touched:
+            own = [r for r in self.overlay_prefix if not r[0] or r[0][:1] == ch]
+            # Rebuilt from the source table: disabling a rule revives those it shadowed
+            kept, _ = live_rules([r for r in base.prefix_source
+                                  if (not r[0] or r[0][:1] == ch)
+                                  and f"prefix:{r[0]}" not in self.disabled], "prefix")
+            if ch:
+                self.prefix_index[ch] = own + kept
+            else:
+                self.prefix_default = own + kept
+        if any(not p for p, _, _ in self.overlay_prefix):
+            # An empty overlay prefix matches every label: prepend it everywhere
+            empty = [r for r in self.overlay_prefix if not r[0]]
+            for ch, bucket in self.prefix_index.items():
+                if ch not in touched:
+                    self.prefix_index[ch] = empty + bucket
+
+        self.base_contains = base.contains
+        if any(rule_id.startswith("contains:") for rule_id in self.disabled):
+            self.base_contains, _ = live_rules(
+                [r for r in base.contains_source
+                 if f"contains:{r[0]}" not in self.disabled], "contains")
+
+        self._build_tiers(profile)
+
+    def __getattr__(self, name):
+        # Only called for attributes the overlay does not set: the base's
+        if name == "base":
+            raise AttributeError(name)
+        return getattr(self.base, name)
+
+    # The tier loop and its helpers run unchanged over the overlay's tiers
+    _build_tiers = CompiledRules._build_tiers
+    match = CompiledRules.match
+    categorize = CompiledRules.categorize
+    rule_ids = CompiledRules.rule_ids
+    _match_prefix = CompiledRules._match_prefix
+
+    @property
+    def exact(self):
+        merged = {k: v for k, v in self.base.exact.items() if f"exact:{k}" not in self.disabled}
+        merged.update({k: v for k, v in self.overlay_exact.items() if v is not None})
+        return merged
+
+    @property
+    def prefix(self):
+        kept, _ = live_rules([r for r in self.base.prefix_source
+                              if f"prefix:{r[0]}" not in self.disabled], "prefix")
+        return self.overlay_prefix + kept
+
+    @property
+    def contains(self):
+        return self.overlay_contains + self.base_contains
+
+    def _match_exact(self, label, lower, amount, date):
+        if label in self.overlay_exact:
+            hit = self.overlay_exact[label]
+            return None if hit is None else (f"exact:{label}",) + hit
+        hit = self.base.exact.get(label)
+        if hit is not None:
+            return (f"exact:{label}",) + hit
+
+    def _match_contains(self, label, lower, amount, date):
+        for pattern, cat, subcat in self.overlay_contains:
+            if pattern in lower:
+                return (f"contains:{pattern}", cat, subcat)
+        for pattern, cat, subcat in self.base_contains:
+            if pattern in lower:
+                return (f"contains:{pattern}", cat, subcat)
+
+    def _match_fuzzy(self, label, lower, amount, date):
+        # The user's own labels win over the shared ones; one set of query
+        # deletions serves both indexes. Masked base keys are skipped, so the
+        # next closest key (a case or accent variant, say) answers instead
+        if self.overlay_fuzzy is not None:
+            hit = self.overlay_fuzzy.lookup(label, fallback=self.fuzzy, exclude=self.masked)
+        else:
+            hit = self.fuzzy.lookup(label, exclude=self.masked)
+        if hit is not None:
+            key, (cat, subcat), _ = hit
+            return (f"fuzzy:{key}", cat, subcat)
+
+
+def load_overlay(path: str) -> dict:
+    """Read a per-user overlay file.
+
+    JSON object with optional keys: "exact" {label: [category, subcategory]},
+    "prefix" and "contains" [[pattern, category, subcategory], ...] and
+    "disable" [rule_id, ...].
+    """
+    with open(path, "r", encoding="utf-8") as f:
+        data = json.load(f)
+    return {
+        "exact": data.get("exact", {}),
+        "prefix": data.get("prefix", []),
+        "contains": data.get("contains", []),
+        "disable": data.get("disable", []),
+    }
+
+
+def compile_rules(exact=None, prefix=None, contains=None, regex=None,
+                  fuzzy=False, profile=False, model=None, model_threshold=0.9,
+                  overlay=None, conditional=None) -> CompiledRules:
+    """Compile rule tables, defaulting to the module-level ones.
+
+    model is an NgramClassifier or the path of a saved one (needs NumPy).
+    overlay is a per-user overlay file (see load_overlay) layered on top;
+    the result is then a RuleOverlay, which answers like CompiledRules.
+    """
+    if isinstance(model, str):
+        from ngram_classifier import NgramClassifier
+        model = NgramClassifier.load(model)
+    rules = CompiledRules(
+        EXACT_RULES if exact is None else exact,
+        PREFIX_RULES if prefix is None else prefix,
+        CONTAINS_RULES if contains is None else contains,
+        REGEX_RULES if regex is None else regex,
+        fuzzy=fuzzy,
+        profile=profile and overlay is None,
+        model=model,
+        model_threshold=model_threshold,
+        conditional=CONDITIONAL_RULES if conditional is None else conditional,
+    )
+    if overlay is not None:
+        rules = rules.overlay(**load_overlay(overlay), profile=profile)
+    return rules
+
+
+_DEFAULT_RULES = None
+
+
+def default_rules() -> CompiledRules:
+    """Return the module-level rule set, compiling it on first use."""
+    global _DEFAULT_RULES
+    if _DEFAULT_RULES is None:
+        _DEFAULT_RULES = compile_rules()
+    return _DEFAULT_RULES
+
+
+def categorize_label(label: str, amount: float, date: str = None) -> tuple:
     """Return (category, subcategory) for a given label."""
-    # 1. Try exact match
-    if label in EXACT_RULES:
-        return EXACT_RULES[label]
-
-    lower = label.lower()
-
-    # 2. Try prefix rules
-    for prefix, cat, subcat in PREFIX_RULES:
-        if lower.startswith(prefix):
-            return (cat, subcat)
-
-    # 3. Try contains rules
-    for pattern, cat, subcat in CONTAINS_RULES:
-        if pattern in lower:
-            return (cat, subcat)
-
-    # 4. Amount-based heuristics for remaining
-    if amount > 0:
-        # Positive amounts are usually income
-        return ("Rentrée", "Autre")
-
-    # Default
-    return ("Non catégorisé", None)
-
-
-def main():
-    tx_path = os.path.join(DATA_DIR, "transactions-bnp.json")
-    cat_path = os.path.join(DATA_DIR, "categories.json")
+    return default_rules().categorize(label, amount, date)
+
+
+def transaction_date(tx) -> str:
+    """ISO date of a transaction, the first of its month when the day is unknown."""
+    if tx.get("date"):
+        return tx["date"]
+    if "year" in tx and "month" in tx:
+        return f"{tx['year']}-{tx['month']:02d}-01"
+    return None
+
+
+def rule_set_version(rules: CompiledRules) -> str:
+    """Short digest of everything that can change a decision of rules."""
+    payload = [
+        rules.conditional_rules,
+        sorted(rules.exact.items()),
+        rules.prefix,
+        rules.contains,
+        rules.regex,
+        rules.fuzzy is not None,
+    ]
+    if rules.model is not None:
+        model_digest = hashlib.sha1()
+        for array in (rules.model.features, rules.model.class_idx, rules.model.counts):
+            model_digest.update(array.tobytes())
+        payload += [rules.model.classes, rules.model_threshold, model_digest.hexdigest()]
+    text = json.dumps(payload, ensure_ascii=False, default=str)
+    return hashlib.sha1(text.encode("utf-8")).hexdigest()[:12]
+
+
+# --- Parallel categorisation (--jobs) ---
+
+_WORKER_RULES = None
+
+
+def _init_worker(rule_options):
+    # Each worker compiles the rule set once, before receiving any shard
+    global _WORKER_RULES
+    _WORKER_RULES = compile_rules(**rule_options)
+
+
+def _categorize_shard(shard):
+    """Worker entry point: categorize a shard of (label, amount, date) items."""
+    rules = _WORKER_RULES
+    if rules.profile is not None:
+        # A worker may receive several shards: report each one's counts once
+        rules.profile.reset()
+    start = time.perf_counter()
+    rules.prime_model([label for label, _, _ in shard])
+    decisions = [rules.match(label, amount, date) for label, amount, date in shard]
+    elapsed = time.perf_counter() - start
+    return os.getpid(), decisions, elapsed, rules.profile
+
+
+def categorize_parallel(items, jobs: int, rule_options=None) -> tuple:
+    """Categorize distinct (label, amount, date) items across a process pool.
+
+    Labels are sharded round-robin so each worker gets a similar mix of
+    cheap (exact) and expensive (contains) labels. rule_options are passed
+    to compile_rules in each worker. Returns the (rule_id, category,
+    subcategory) matches in input order,
+    per-worker stats {pid: (labels, seconds)} and the merged RuleProfile
+    (None unless profiling).
+    """
+    shards = [items[i::jobs] for i in range(jobs)]
+    with multiprocessing.Pool(jobs, initializer=_init_worker,
+                              initargs=(rule_options or {},)) as pool:
+        results = pool.map(_categorize_shard, shards, chunksize=1)
+
+    decisions = [None] * len(items)
+    worker_stats = {}
+    profile = None
+    for shard_idx, (pid, shard_decisions, elapsed, shard_profile) in enumerate(results):
+        # Shard i holds items i, i + jobs, i + 2*jobs, ...
+        decisions[shard_idx::jobs] = shard_decisions
+        labels, seconds = worker_stats.get(pid, (0, 0.0))
+        worker_stats[pid] = (labels + len(shard_decisions), seconds + elapsed)
+        if shard_profile is not None:
+            if profile is None:
+                profile = RuleProfile()
+            profile.merge(shard_profile)
+    return decisions, worker_stats, profile
+
+
+# --- Streaming JSON I/O (--stream) ---
+
+_NUMBER_TAIL = frozenset("0123456789.eE+-")
+
+
+class JsonStreamReader:
+    """Incremental reader over a JSON document read from f in chunks.
+
+    Values are decoded one at a time, so a large array nested anywhere can
+    be walked element by element with only one chunk plus the element being
+    decoded in memory. iter_object() yields keys: the caller consumes each
+    member's value (value(), iter_array() or iter_object()) before the next.
+    """
+
+    def __init__(self, f, chunk_size: int = 1 << 16):
+        self.f = f
+        self.chunk_size = chunk_size
+        self.decoder = json.JSONDecoder()
+        self.buf = ""
+        self.pos = 0
+        self.eof = False
+
+    def _fill(self):
+        more = self.f.read(self.chunk_size)
+        if not more:
+            self.eof = True
+        self.buf = self.buf[self.pos:] + more
+        self.pos = 0
+
+    def _skip(self, chars=" \t\r\n") -> str:
+        """Skip chars and return the next character ("" at the end)."""
+        while True:
+            while self.pos < len(self.buf) and self.buf[self.pos] in chars:
+                self.pos += 1
+            if self.pos < len(self.buf):
+                return self.buf[self.pos]
+            if self.eof:
+                return ""
+            self._fill()
+
+    def value(self):
+        """Decode the next complete value."""
+        self._skip()
+        while True:
+            try:
+                obj, end = self.decoder.raw_decode(self.buf, self.pos)
+            except json.JSONDecodeError:
+                if self.eof:
+                    raise
+                self._fill()
+                continue
+            if not self.eof and (end == len(self.buf) or self.buf[end] in _NUMBER_TAIL):
+                # A number cut at the chunk boundary decodes short ("12" of "123",
+                # "1" of "1.5"): valid JSON never has these right after a value
+                self._fill()
+                continue
+            self.pos = end
+            return obj
+
+    def _open(self, char, kind):
+        if self._skip() != char:
+            raise ValueError(f"expected a JSON {kind}")
+        self.pos += 1
+
+    def iter_array(self):
+        """Yield the elements of the array starting at the current position."""
+        self._open("[", "array")
+        while True:
+            char = self._skip(" \t\r\n,")
+            if not char:
+                raise ValueError("unterminated JSON array")
+            if char == "]":
+                self.pos += 1
+                return
+            yield self.value()
+
+    def iter_object(self):
+        """Yield the keys of the object starting at the current position."""
+        self._open("{", "object")
+        while True:
+            char = self._skip(" \t\r\n,")
+            if not char:
+                raise ValueError("unterminated JSON object")
+            if char == "}":
+                self.pos += 1
+                return
+            key = self.value()
+            if self._skip() != ":":
+                raise ValueError(f"expected ':' after key {key!r}")
+            self.pos += 1
+            yield key
+
+
+def iter_json_array(f, chunk_size: int = 1 << 16):
+    """Yield the elements of a top-level JSON array, reading f incrementally.
+
+    Only one chunk plus the element being decoded is held in memory.
+    """
+    return JsonStreamReader(f, chunk_size).iter_array()
+
+
+class JsonArrayWriter:
+    """Write a JSON array one element at a time.
+
+    Produces the same bytes as json.dump(items, f, ensure_ascii=False, indent=2).
+    """
+
+    def __init__(self, f):
+        self.f = f
+        self.count = 0
+
+    def write(self, item):
+        body = json.dumps(item, ensure_ascii=False, indent=2).replace("\n", "\n  ")
+        self.f.write(("[\n  " if self.count == 0 else ",\n  ") + body)
+        self.count += 1
+
+    def close(self):
+        self.f.write("\n]" if self.count else "[]")
+
+
+# --- Fused per-record pass ---
+
+class CategorizeStats:
+    """Summary counters collected while records flow through process_transaction."""
+
+    def __init__(self, valid_cats, valid_subs):
+        self.valid_cats = valid_cats
+        self.valid_subs = valid_subs
+        self.total = 0
+        self.categorized = 0
+        self.eco_fixed = 0
+        self.new_cats_needed = set()
+        self.new_subs_needed = set()
+        self.cat_counts = Counter()
+        self.uncat_labels = Counter()
+        self.uncat_amounts = Counter()
+
+    @classmethod
+    def for_categories(cls, categories) -> "CategorizeStats":
+        """Stats checked against the category names of categories.json."""
+        valid_subs = {}
+        for c in categories:
+            for s in c["subcategories"]:
+                valid_subs.setdefault(c["name"], set()).add(s)
+        return cls({c["name"] for c in categories}, valid_subs)
 
-    with open(tx_path, "r", encoding="utf-8") as f:
-        transactions = json.load(f)
 
-    with open(cat_path, "r", encoding="utf-8") as f:
-        categories = json.load(f)
+def needs_category(tx) -> bool:
+    """Whether the rules should categorise tx (it has no category of its own)."""
+    return "category" not in tx or tx["category"] == "Non catégorisé"
 
-    # Get valid category names
-    valid_cats = {c["name"] for c in categories}
-    valid_subs = {}
-    for c in categories:
-        for s in c["subcategories"]:
-            valid_subs.setdefault(c["name"], set()).add(s)
 
-    categorized_count = 0
-    uncategorized_labels = set()
-    new_cats_needed = set()
-    new_subs_needed = set()
+def process_transaction(tx, decide, stats: CategorizeStats, decision=None):
+    """Categorize one record, fix its Economies subcategory and count it.
 
-    for tx in transactions:
-        # Skip transactions that already have a non-default category
-        if "category" in tx and tx["category"] != "Non catégorisé":
-            continue
+    decide(label, amount, date) returns (category, subcategory). A decision
+    given by the caller (from the journal) is applied instead, even to a
+    record that already has a category; decide=None leaves records alone.
+    """
+    stats.total += 1
 
-        label = tx["label"]
-        amount = tx["amount"]
-        cat, subcat = categorize_label(label, amount)
+    # Skip transactions that already have a non-default category
+    if decision is None and decide is not None and needs_category(tx):
+        decision = decide(tx["label"], tx["amount"], transaction_date(tx))
+    if decision is not None:
+        cat, subcat = decision
 
         tx["category"] = cat
         if subcat:
             tx["subcategory"] = subcat
         elif "subcategory" in tx:
             del tx["subcategory"]
-        categorized_count += 1
+        stats.categorized += 1
 
         # Track new categories/subcategories
-        if cat not in valid_cats:
-            new_cats_needed.add(cat)
-        if subcat and cat in valid_subs and subcat not in valid_subs.get(cat, set()):
-            new_subs_needed.add((cat, subcat))
-
-    # Write updated transactions
-    with open(tx_path, "w", encoding="utf-8") as f:
-        json.dump(transactions, f, ensure_ascii=False, indent=2)
-
-    # Update categories.json with any new subcategories
-    if new_subs_needed:
-        for c in categories:
-            for cat_name, sub_name in new_subs_needed:
-                if c["name"] == cat_name and sub_name not in c["subcategories"]:
-                    c["subcategories"].append(sub_name)
-                    c["subcategories"].sort()
-        with open(cat_path, "w", encoding="utf-8") as f:
-            json.dump(categories, f, ensure_ascii=False, indent=2)
+        if cat not in stats.valid_cats:
+            stats.new_cats_needed.add(cat)
+        if subcat and cat in stats.valid_subs and subcat not in stats.valid_subs.get(cat, set()):
+            stats.new_subs_needed.add((cat, subcat))
 
     # Auto-assign subcategory for Economies without one
-    eco_fixed = 0
-    for tx in transactions:
-        if tx.get("category") == "Economies" and not tx.get("subcategory"):
-            amount = tx["amount"]
-            if amount < 0:
-                tx["subcategory"] = "Ajout"
-                eco_fixed += 1
-            elif amount > 0:
-                tx["subcategory"] = "Retrait"
-                eco_fixed += 1
-
-    # Write updated transactions (includes Economies subcategory fixes)
-    if eco_fixed:
-        with open(tx_path, "w", encoding="utf-8") as f:
-            json.dump(transactions, f, ensure_ascii=False, indent=2)
+    if tx.get("category") == "Economies" and not tx.get("subcategory"):
+        amount = tx["amount"]
+        if amount < 0:
+            tx["subcategory"] = "Ajout"
+            stats.eco_fixed += 1
+        elif amount > 0:
+            tx["subcategory"] = "Retrait"
+            stats.eco_fixed += 1
+
+    cat = tx.get("category", "???")
+    stats.cat_counts[(cat, tx.get("subcategory", ""))] += 1
+    if cat == "Non catégorisé":
+        stats.uncat_labels[tx["label"]] += 1
+        stats.uncat_amounts[tx["label"]] += tx["amount"]
+
+
+def add_new_subcategories(categories, stats: CategorizeStats) -> bool:
+    """Add the subcategories the rules assigned to categories; True if any was new."""
+    added = False
+    for c in categories:
+        for cat_name, sub_name in stats.new_subs_needed:
+            if c["name"] == cat_name and sub_name not in c["subcategories"]:
+                c["subcategories"].append(sub_name)
+                c["subcategories"].sort()
+                added = True
+    return added
 
-    # Stats
-    print(f"Categorized {categorized_count} transactions")
-    if eco_fixed:
-        print(f"Fixed {eco_fixed} Economies transactions missing subcategory")
-
-    # Check distribution
-    from collections import Counter
-    cat_counts = Counter()
-    still_uncat = 0
-    for tx in transactions:
-        cat = tx.get("category", "???")
-        sub = tx.get("subcategory", "")
-        cat_counts[(cat, sub)] += 1
-        if cat == "Non catégorisé":
-            still_uncat += 1
 
+def print_distribution(stats: CategorizeStats):
+    """Category counts and the labels left uncategorised, clustered."""
+    still_uncat = sum(stats.uncat_labels.values())
     print(f"\nStill uncategorized: {still_uncat}")
     print(f"\nCategory distribution:")
-    for (cat, sub), count in sorted(cat_counts.items()):
+    for (cat, sub), count in sorted(stats.cat_counts.items()):
         label = f"{cat} / {sub}" if sub else cat
         print(f"  {count:5d}  {label}")
 
-    # Show uncategorized labels
+    # Show uncategorized labels, near-duplicates grouped so one rule can cover a cluster
     if still_uncat > 0:
-        uncat_labels = Counter()
-        for tx in transactions:
-            if tx.get("category") == "Non catégorisé":
-                uncat_labels[tx["label"]] += 1
-        print(f"\nUncategorized labels ({len(uncat_labels)} unique):")
-        for label, count in sorted(uncat_labels.items(), key=lambda x: -x[1]):
-            print(f"  {count:3d}x  {label}")
+        clusters = summarise_clusters(stats.uncat_labels, stats.uncat_amounts)
+        print(f"\nUncategorized labels ({len(stats.uncat_labels)} unique, {len(clusters)} clusters):")
+        for representative, count, amount, members in clusters:
+            print(f"  {count:3d}x  {amount:10.2f}  {representative}")
+            if len(members) > 1:
+                others = ", ".join(members[1:6]) + (", ..." if len(members) > 6 else "")
+                print(f"  {'':17s}  + {len(members) - 1} similar: {others}")
+
+
+# --- Decision journal (--journal / --replay) ---
+
+class CategorizeJournal:
+    """Append-only JSON Lines log of categorisation decisions.
+
+    Each decision line holds the record key, the matched rule id, the rule
+    set version and the result. A {"checkpoint": version} line closes every
+    run, stating that all decisions above it hold for that rule set. So on a
+    rerun with the same rules, journaled records are replayed without
+    matching; after a rule change they are re-matched (once per distinct
+    label) and only the decisions that changed are appended. With rules=None
+    (--replay) the matcher never runs.
+    """
+
+    def __init__(self, path: str, version: str = None):
+        self.path = path
+        self.version = version
+        self.entries = {}   # record key -> (rule, category, subcategory)
+        self.verified = False
+        if os.path.exists(path):
+            with open(path, "r", encoding="utf-8") as f:
+                for line in f:
+                    if not line.strip():
+                        continue
+                    entry = json.loads(line)
+                    if "checkpoint" in entry:
+                        self.verified = entry["checkpoint"] == version
+                        continue
+                    self._record(entry["key"], entry["rule"], entry["category"],
+                                 entry["subcategory"])
+                    self.verified = False
+        self._occurrences = Counter()
+        self._matches = {}
+        self._file = None
+        self.new = self.changed = self.unchanged = self.replayed = 0
+
+    def key(self, tx) -> str:
+        """Stable key from the extracted fields, numbered among identical rows."""
+        fields = [tx.get("year"), tx.get("month"), tx.get("date"),
+                  tx["label"], tx["amount"], tx.get("status")]
+        digest = hashlib.blake2b(
+            json.dumps(fields, ensure_ascii=False).encode("utf-8"), digest_size=10).hexdigest()
+        self._occurrences[digest] += 1
+        return f"{digest}-{self._occurrences[digest]}"
+
+    def _match(self, rules, tx) -> tuple:
+        date = transaction_date(tx)
+        cache_key = rules.decision_key(tx["label"], tx["amount"], date)
+        if cache_key not in self._matches:
+            self._matches[cache_key] = rules.match(tx["label"], tx["amount"], date)
+        return self._matches[cache_key]
+
+    def _append(self, key, rule, cat, subcat):
+        if self._file is None:
+            self._file = open(self.path, "a", encoding="utf-8")
+        self._file.write(json.dumps({
+            "key": key, "rule": rule, "version": self.version,
+            "category": cat, "subcategory": subcat,
+        }, ensure_ascii=False) + "\n")
+        self._record(key, rule, cat, subcat)
+
+    def _record(self, key, rule, cat, subcat):
+        self.entries[key] = (rule, cat, subcat)
+
+    def resolve(self, tx, rules):
+        """Match (rule_id, category, subcategory) to apply to tx, or None to leave it."""
+        key = self.key(tx)
+        entry = self.entries.get(key)
+        if entry is None:
+            # Rows with a category of their own (from the sheet) are not journaled
+            if rules is None or not needs_category(tx):
+                return None
+            rule, cat, subcat = self._match(rules, tx)
+            self._append(key, rule, cat, subcat)
+            self.new += 1
+            return (rule, cat, subcat)
+        if rules is None or self.verified:
+            self.replayed += 1
+            return entry
+        match = self._match(rules, tx)
+        if match != entry:
+            self._append(key, *match)
+            self.changed += 1
+        else:
+            self.unchanged += 1
+        return match
+
+    def close(self):
+        if self.version is not None and (self._file is not None or not self.verified):
+            if self._file is None:
+                self._file = open(self.path, "a", encoding="utf-8")
+            self._file.write(json.dumps({"checkpoint": self.version}) + "\n")
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+
+# Records per --stream batch: the classifier tier scores each batch at once
+STREAM_BATCH = 1000
+
+
+def _stream_batch(batch, rules, step, writer):
+    if rules is not None:
+        rules.prime_model([tx["label"] for tx in batch if needs_category(tx)], reset=True)
+    for tx in batch:
+        step(tx)
+        writer.write(tx)
+
+
+def add_rule_arguments(parser):
+    """The rule tier options, shared by the scripts that compile the rules."""
+    parser.add_argument("--fuzzy", action="store_true",
+                        help="enable the fuzzy tier matching near-miss exact labels (changes "
+                             "the category of rows that no rule matched exactly)")
+    parser.add_argument("--model",
+                        help="n-gram classifier (.npz from ngram_classifier.py) used as a fallback tier")
+    parser.add_argument("--model-threshold", type=float, default=0.9,
+                        help="minimum classifier confidence, below which it abstains (default: 0.9)")
+    parser.add_argument("--overlay",
+                        help="per-user rule overlay (JSON) layered on top of the shared rules")
+
+
+def rule_options(args) -> dict:
+    """compile_rules() keyword arguments from the add_rule_arguments() options."""
+    return {
+        "fuzzy": args.fuzzy,
+        "model": args.model,
+        "model_threshold": args.model_threshold,
+        "overlay": args.overlay,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Categorize transactions by label patterns.")
+    parser.add_argument("--jobs", type=int, default=1,
+                        help="number of worker processes (default: 1, no pool)")
+    parser.add_argument("--stream", action="store_true",
+                        help="read and write transactions incrementally in constant memory")
+    add_rule_arguments(parser)
+    parser.add_argument("--profile", action="store_true",
+                        help="record rule hit counts and tier timings to categorize-profile.json")
+    parser.add_argument("--journal", action="store_true",
+                        help="log decisions to categorize-journal.jsonl and only re-match "
+                             "new records, or all journaled ones after a rule change")
+    parser.add_argument("--replay", action="store_true",
+                        help="rebuild categories from categorize-journal.jsonl without matching")
+    parser.add_argument("--anomalies", action="store_true",
+                        help="score amounts and monthly totals per category as records stream "
+                             "through (state in anomaly-state.json, report in anomalies.json)")
+    parser.add_argument("--sqlite", nargs="?", const="", metavar="FILE",
+                        help="also write an indexed SQLite database with rule provenance "
+                             f"(default: DATA_DIR/{STORE_FILE})")
+    pipeline_metrics.add_arguments(parser, "categorize")
+    parser.add_argument("--data-dir", default=DATA_DIR,
+                        help="directory holding transactions-bnp.json and categories.json")
+    args = parser.parse_args(argv)
+    if args.jobs < 1:
+        parser.error("--jobs must be >= 1")
+    if args.stream and args.jobs > 1:
+        parser.error("--stream cannot be combined with --jobs (the pool needs every label up front)")
+    if (args.journal or args.replay) and args.jobs > 1:
+        parser.error("--journal/--replay decide record by record and cannot be combined with --jobs")
+    if args.journal and args.replay:
+        parser.error("--journal and --replay are mutually exclusive")
+    if args.replay and args.profile:
+        parser.error("--replay matches no rules: there is nothing for --profile to record")
+
+    run_start = time.perf_counter()
+    metrics = pipeline_metrics.Metrics.from_args(args)
+    tx_path = os.path.join(args.data_dir, "transactions-bnp.json")
+    cat_path = os.path.join(args.data_dir, "categories.json")
+
+    with open(cat_path, "r", encoding="utf-8") as f:
+        categories = json.load(f)
+
+    options = rule_options(args)
+    # Only with --profile: wrapping every tier would skew the --metrics stage timings
+    options["profile"] = args.profile
+    with metrics.stage("compile_rules"):
+        rules = None if args.replay else compile_rules(**options)
+    stats = CategorizeStats.for_categories(categories)
+    match = rules.match if rules is not None else None
+    parallel_seconds = 0.0
+    worker_stats = {}
+
+    journal = None
+    if args.journal or args.replay:
+        journal = CategorizeJournal(os.path.join(args.data_dir, "categorize-journal.jsonl"),
+                                    None if rules is None else rule_set_version(rules))
+    detector = None
+    if args.anomalies:
+        detector = anomalies.AnomalyDetector.load(os.path.join(args.data_dir, anomalies.STATE_FILE))
+    store = None
+    if args.sqlite is not None:
+        store = SqliteStore(args.sqlite or os.path.join(args.data_dir, STORE_FILE))
+    changed = 0
+
+    def step(tx):
+        nonlocal changed
+        before = (tx.get("category"), tx.get("subcategory"))
+        hit = None
+        if journal is not None:
+            hit = journal.resolve(tx, rules)
+        elif match is not None and needs_category(tx):
+            hit = match(tx["label"], tx["amount"], transaction_date(tx))
+        process_transaction(tx, None, stats, None if hit is None else hit[1:])
+        if (tx.get("category"), tx.get("subcategory")) != before:
+            changed += 1
+        if detector is not None:
+            detector.observe(tx)
+        if store is not None:
+            if hit is not None:
+                store.add(tx, hit[0], "journal" if journal is not None and rules is None else "rule")
+            else:
+                # Set by the sheet or by an earlier run: the file cannot tell
+                store.add(tx)
+
+    if args.stream:
+        # Single fused pass: each record is categorized, fixed up and written
+        # before the next one is read. The output goes to a temporary file
+        # that replaces the original once complete.
+        with metrics.stage("stream") as stage:
+            tmp_path = tx_path + ".tmp"
+            with open(tx_path, "r", encoding="utf-8") as src, \
+                    open(tmp_path, "w", encoding="utf-8") as dst:
+                writer = JsonArrayWriter(dst)
+                batch = []
+                for tx in iter_json_array(src):
+                    batch.append(tx)
+                    if len(batch) == STREAM_BATCH:
+                        _stream_batch(batch, rules, step, writer)
+                        batch = []
+                _stream_batch(batch, rules, step, writer)
+                writer.close()
+            stage["rows"] = stats.total
+        if changed or journal is None:
+            os.replace(tmp_path, tx_path)
+        else:
+            os.remove(tmp_path)
+    else:
+        with metrics.stage("read_json") as stage:
+            with open(tx_path, "r", encoding="utf-8") as f:
+                transactions = json.load(f)
+            stage["rows"] = len(transactions)
+        with metrics.stage("categorize", rows=len(transactions)):
+            if args.jobs == 1 and rules is not None:
+                rules.prime_model([tx["label"] for tx in transactions if needs_category(tx)])
+
+            # With --jobs, decide each distinct label once in a process pool, then
+            # apply the decisions below in original transaction order.
+            if args.jobs > 1:
+                distinct = {}
+                for tx in transactions:
+                    if needs_category(tx):
+                        date = transaction_date(tx)
+                        distinct.setdefault(rules.decision_key(tx["label"], tx["amount"], date),
+                                            (tx["label"], tx["amount"], date))
+                items = list(distinct.values())
+                parallel_start = time.perf_counter()
+                results, worker_stats, worker_profile = categorize_parallel(
+                    items, args.jobs, options)
+                parallel_seconds = time.perf_counter() - parallel_start
+                decisions = dict(zip(distinct, results))
+                if worker_profile is not None:
+                    rules.profile.merge(worker_profile)
+
+                def match(label, amount, date):
+                    return decisions[rules.decision_key(label, amount, date)]
+
+            for tx in transactions:
+                step(tx)
+
+        # Write updated transactions (includes Economies subcategory fixes).
+        # With a journal, an unchanged file is left untouched.
+        if changed or journal is None:
+            with metrics.stage("write_json", rows=len(transactions)):
+                with open(tx_path, "w", encoding="utf-8") as f:
+                    json.dump(transactions, f, ensure_ascii=False, indent=2)
+
+    if journal is not None:
+        journal.close()
+    if store is not None:
+        with metrics.stage("sqlite", rows=store.count):
+            store.close(categories, None if rules is None else rule_set_version(rules))
+
+    # Update categories.json with any new subcategories
+    if add_new_subcategories(categories, stats):
+        with open(cat_path, "w", encoding="utf-8") as f:
+            json.dump(categories, f, ensure_ascii=False, indent=2)
+
+    # Stats
+    print(f"Categorized {stats.categorized} transactions")
+    if stats.eco_fixed:
+        print(f"Fixed {stats.eco_fixed} Economies transactions missing subcategory")
+    if journal is not None:
+        print(f"Journal: {journal.new} new, {journal.changed} changed, "
+              f"{journal.unchanged} unchanged, {journal.replayed} replayed decisions; "
+              f"{changed} records updated" + ("" if changed else " (file not rewritten)"))
+
+    if args.jobs > 1:
+        total_seconds = time.perf_counter() - run_start
+        serial_fraction = 1 - parallel_seconds / total_seconds if total_seconds else 0.0
+        print(f"\nParallel categorisation: {args.jobs} jobs, {len(decisions)} distinct labels")
+        for pid, (labels, seconds) in sorted(worker_stats.items()):
+            rate = labels / seconds if seconds else float("inf")
+            print(f"  worker {pid}: {labels} labels in {seconds:.3f}s ({rate:,.0f} labels/s)")
+        print(f"  pool section: {parallel_seconds:.3f}s of {total_seconds:.3f}s total")
+        print(f"  serial fraction: {serial_fraction:.2f} "
+              f"(Amdahl bound: {1 / serial_fraction if serial_fraction else float('inf'):.1f}x)")
+
+    print_distribution(stats)
+
+    if detector is not None:
+        with metrics.stage("anomalies"):
+            anomaly_report = detector.finish()
+            detector.save(os.path.join(args.data_dir, anomalies.STATE_FILE))
+        anomalies.write_report(anomaly_report, os.path.join(args.data_dir, anomalies.REPORT_FILE))
+        anomalies.print_report(anomaly_report, detector.skipped)
+
+    if args.profile:
+        report = rules.profile.report(rules)
+        # The pool decides each distinct label once; otherwise every record is matched
+        report["counted"] = "distinct labels" if args.jobs > 1 else "transactions"
+        report["regex_compile_seconds"] = round(rules.regex_compile_seconds, 6)
+        profile_path = os.path.join(args.data_dir, "categorize-profile.json")
+        with open(profile_path, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        print(f"\nProfile written to {profile_path} "
+              f"({len(report['dead_rules'])} rules never fired)")
+
+    if rules is not None and rules.profile is not None:
+        metrics.add("tiers", rules.profile.report(rules)["tiers"])
+    metrics.write(args.data_dir, "categorize")
 
 
 if __name__ == "__main__":
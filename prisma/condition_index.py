@@ -0,0 +1,101 @@
+"""
+Sorted-boundary index for rules conditioned on amount and date ranges.
+
+For one label, the boundaries of every rule's amount range and date window
+cut each axis into elementary segments (the boundary points themselves and
+the open intervals between them). All values inside a segment satisfy the
+same set of rules, so the first matching rule is precomputed for every
+(amount segment, date segment) cell. A lookup is then two binary searches
+and a table read: O(log k) for k rules on the label, whatever the order or
+overlap of their predicates.
+"""
+
+from bisect import bisect_left
+
+_UNKNOWN_DATE = -1
+
+
+def _segment(boundaries, value) -> int:
+    """Segment of value: 2*i + 1 on boundaries[i], 2*i between boundaries[i-1] and [i]."""
+    pos = bisect_left(boundaries, value)
+    if pos < len(boundaries) and boundaries[pos] == value:
+        return 2 * pos + 1
+    return 2 * pos
+
+
+def _segment_range(boundaries, lo, lo_open, hi, hi_open) -> range:
+    """Segments covered by the interval between lo and hi (None = unbounded)."""
+    first = 0 if lo is None else _segment(boundaries, lo) + (1 if lo_open else 0)
+    last = 2 * len(boundaries) if hi is None else _segment(boundaries, hi) - (1 if hi_open else 0)
+    return range(first, last + 1)
+
+
+def amount_bounds(conditions: dict) -> tuple:
+    """(lo, lo_open, hi, hi_open) from min_amount/max_amount (inclusive) and sign."""
+    lo, lo_open = conditions.get("min_amount"), False
+    hi, hi_open = conditions.get("max_amount"), False
+    sign = conditions.get("sign")
+    if sign == "+" and (lo is None or lo <= 0):
+        lo, lo_open = 0, True
+    elif sign == "-" and (hi is None or hi >= 0):
+        hi, hi_open = 0, True
+    return lo, lo_open, hi, hi_open
+
+
+def matches(conditions: dict, amount: float, date) -> bool:
+    """Evaluate conditions directly (reference semantics for the index)."""
+    lo, lo_open, hi, hi_open = amount_bounds(conditions)
+    if lo is not None and (amount < lo or (lo_open and amount == lo)):
+        return False
+    if hi is not None and (amount > hi or (hi_open and amount == hi)):
+        return False
+    start, end = conditions.get("from"), conditions.get("until")
+    if start is not None or end is not None:
+        if date is None:
+            return False
+        if start is not None and date < start:
+            return False
+        if end is not None and date > end:
+            return False
+    return True
+
+
+class ConditionIndex:
+    """First matching rule for one label, indexed on amount and date.
+
+    rules is a list of (conditions, value) in priority order; conditions may
+    hold "min_amount", "max_amount", "sign" ("+" or "-"), "from" and "until"
+    (ISO dates, inclusive). A rule with a date window never matches a row
+    whose date is unknown.
+    """
+
+    def __init__(self, rules):
+        self.values = [value for _, value in rules]
+        bounds = [amount_bounds(c) for c, _ in rules]
+        self.amounts = sorted({b for lo, _, hi, _ in bounds for b in (lo, hi) if b is not None})
+        self.dates = sorted({c[k] for c, _ in rules for k in ("from", "until") if c.get(k) is not None})
+
+        n_amount = 2 * len(self.amounts) + 1
+        n_date = 2 * len(self.dates) + 1
+        # One extra column (index -1) for rows without a date
+        self.table = [[None] * (n_date + 1) for _ in range(n_amount)]
+        for idx in range(len(rules) - 1, -1, -1):
+            conditions, _ = rules[idx]
+            lo, lo_open, hi, hi_open = bounds[idx]
+            amount_segments = _segment_range(self.amounts, lo, lo_open, hi, hi_open)
+            start, end = conditions.get("from"), conditions.get("until")
+            date_segments = list(_segment_range(self.dates, start, False, end, False))
+            if start is None and end is None:
+                date_segments.append(_UNKNOWN_DATE)
+            for a in amount_segments:
+                row = self.table[a]
+                for d in date_segments:
+                    row[d] = idx
+
+    def lookup(self, amount: float, date=None):
+        """Return (rule index, value) of the first rule satisfied, or None."""
+        row = self.table[_segment(self.amounts, amount)]
+        idx = row[_UNKNOWN_DATE if date is None else _segment(self.dates, date)]
+        if idx is None:
+            return None
+        return idx, self.values[idx]
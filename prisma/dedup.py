@@ -0,0 +1,107 @@
+"""
+Duplicate rows across the sheets and month blocks of comptes.xlsx.
+
+Month blocks are copied between sheets by hand and the first three blocks
+of "Comptes 2019" are read as 2018, so the same row can be extracted twice.
+extract-excel.py --dedup feeds every extracted row to DuplicateIndex.add()
+with its source cell; each row is fingerprinted into hash indexes as it
+comes, so the whole check is one linear pass:
+
+- exact: same folded label, amount in cents, year, month and date;
+- near, same date: same label, amount and date, filed under another month
+  (a block copied into the wrong sheet or month);
+- near, same month: same label, amount, year and month, but a different or
+  missing date (a row retyped or copied without its date).
+
+Only rows from different month blocks are paired: repeats inside one block
+(two coffees on the same day) are ordinary. Pairs are then counted per pair
+of blocks, so a whole copied block shows up as one overlap.
+"""
+
+from collections import Counter
+
+from fuzzy_index import fold
+
+
+class DuplicateIndex:
+    """Hash indexes of row fingerprints; add() rows, then report()."""
+
+    def __init__(self):
+        self.exact = {}          # fingerprint -> {block: first row}
+        self.same_date = {}
+        self.same_month = {}
+        self.rows = []           # (tx, source)
+        self.block_rows = Counter()
+        self.pairs = []
+
+    def add(self, tx, source):
+        """source: {"sheet", "block", "cell"}, the block being the month's first column."""
+        index = len(self.rows)
+        self.rows.append((tx, source))
+        block = (source["sheet"], source["block"])
+        self.block_rows[block] += 1
+        label = fold(tx["label"])
+        cents = round(tx["amount"] * 100)
+        date = tx.get("date")
+        month = (tx["year"], tx["month"])
+
+        exact = self._pair(self.exact, (label, cents, month, date), block, index, "exact")
+        if date is not None:
+            self._pair(self.same_date, (label, cents, date), block, index, "same-date",
+                       skip=lambda other: self.rows[other][0]["year"] == tx["year"]
+                       and self.rows[other][0]["month"] == tx["month"])
+        if not exact:
+            self._pair(self.same_month, (label, cents, month), block, index, "same-month",
+                       skip=lambda other: self.rows[other][0].get("date") == date)
+
+    def _pair(self, table, key, block, index, kind, skip=None) -> bool:
+        """Pair index with the first row of every other block under key."""
+        blocks = table.get(key)
+        if blocks is None:
+            table[key] = {block: index}
+            return False
+        found = False
+        for other_block, other in blocks.items():
+            if other_block == block or (skip is not None and skip(other)):
+                continue
+            self.pairs.append((kind, other, index))
+            found = True
+        blocks.setdefault(block, index)
+        return found
+
+    def report(self) -> dict:
+        """{"duplicates": [...], "overlaps": [...], "counts": {kind: n}}."""
+        duplicates = []
+        overlaps = Counter()
+        for kind, first, second in self.pairs:
+            (tx_a, src_a), (tx_b, src_b) = self.rows[first], self.rows[second]
+            duplicates.append({"kind": kind, "first": _row(tx_a, src_a), "second": _row(tx_b, src_b)})
+            overlaps[((src_a["sheet"], src_a["block"]), (src_b["sheet"], src_b["block"]))] += 1
+        return {
+            "counts": dict(Counter(kind for kind, _, _ in self.pairs)),
+            "overlaps": [
+                {"first": {"sheet": a[0], "block": a[1]}, "second": {"sheet": b[0], "block": b[1]},
+                 "rows": n, "share": round(n / min(self.block_rows[a], self.block_rows[b]), 3)}
+                for (a, b), n in overlaps.most_common()
+            ],
+            "duplicates": duplicates,
+        }
+
+
+def _row(tx, source) -> dict:
+    return {
+        "sheet": source["sheet"], "cell": source["cell"],
+        "year": tx["year"], "month": tx["month"], "date": tx.get("date"),
+        "label": tx["label"], "amount": tx["amount"],
+    }
+
+
+def print_report(report: dict, limit: int = 10):
+    counts = report["counts"]
+    print("\n--- Duplicates ---")
+    print(f"  {counts.get('exact', 0)} exact, {counts.get('same-date', 0)} same date in another "
+          f"month, {counts.get('same-month', 0)} same month with another date")
+    for overlap in report["overlaps"][:limit]:
+        a, b = overlap["first"], overlap["second"]
+        print(f"  {overlap['rows']:4d} rows ({overlap['share']:.0%})  "
+              f"{a['sheet']} col {a['block']}  <->  {b['sheet']} col {b['block']}")
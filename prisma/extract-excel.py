@@ -3,20 +3,30 @@
 Extract data from comptes.xlsx into JSON files for import into the database.
 Only uses the "Comptes XXXX" sheets (2019-2026).
 
-Usage: python3 prisma/extract-excel.py
+Usage: python3 prisma/extract-excel.py [--dedup]
+                                       [--metrics [FILE]] [--trace-memory] [--profile-stage STAGE]
+       (prisma/pipeline.py extracts and categorises in one process)
 
 Output files in prisma/data/:
   - categories.json
   - transactions-bnp.json
+  - duplicates.json (--dedup: rows found in several sheets or month blocks)
 """
 
+import argparse
 import json
 import os
 import datetime
+import time
 import openpyxl
+from openpyxl.utils import get_column_letter
+
+import pipeline_metrics
+from dedup import DuplicateIndex, print_report
 
 EXCEL_PATH = os.path.expanduser("~/Downloads/comptes.xlsx")
 OUTPUT_DIR = os.path.join(os.path.dirname(__file__), "data")
+DUPLICATES_FILE = "duplicates.json"
 
 PALETTE = [
     "#6366f1", "#22c55e", "#f59e0b", "#ef4444", "#8b5cf6",
@@ -162,10 +172,20 @@ def _get_month_layout(ws, start_col, cols):
     return "simple"
 
 
-def extract_transactions_sheet(ws, sheet_name):
-    """Extract transactions from a Comptes XXXX sheet."""
+def extract_transactions_sheet(ws, sheet_name, timings=None, sources=None):
+    """Extract transactions from a Comptes XXXX sheet.
+
+    timings, when given, receives the months found and the seconds spent
+    detecting the month blocks and their layouts. sources, when given,
+    receives the source cell of each transaction, in the same order.
+    """
     transactions = []
+    start = time.perf_counter()
     month_columns = detect_month_columns(ws)
+    layout_seconds = time.perf_counter() - start
+    if timings is not None:
+        timings["months"] = len(month_columns)
+        timings["layout_seconds"] = layout_seconds
     if not month_columns:
         print(f"  WARNING: No months found in {sheet_name}")
         return transactions
@@ -181,7 +201,9 @@ def extract_transactions_sheet(ws, sheet_name):
         else:
             year = base_year
 
+        start = time.perf_counter()
         layout = _get_month_layout(ws, start_col, cols)
+        layout_seconds += time.perf_counter() - start
 
         for row in range(5, ws.max_row + 1):
             amount_val = ws.cell(row=row, column=start_col).value
@@ -246,7 +268,12 @@ def extract_transactions_sheet(ws, sheet_name):
                 tx["subcategory"] = subcat_str
 
             transactions.append(tx)
+            if sources is not None:
+                block = get_column_letter(start_col)
+                sources.append({"sheet": sheet_name, "block": block, "cell": f"{block}{row}"})
 
+    if timings is not None:
+        timings["layout_seconds"] = layout_seconds
     return transactions
 
 
@@ -284,20 +311,40 @@ def build_categories_from_transactions(transactions):
     return categories
 
 
-def main():
-    os.makedirs(OUTPUT_DIR, exist_ok=True)
-    print(f"Loading {EXCEL_PATH}...")
-    wb = openpyxl.load_workbook(EXCEL_PATH, data_only=True)
+def extract_workbook(wb, sheet_stats=None, duplicates=None):
+    """Transactions of the Comptes 2019-2026 sheets and the categories they use.
 
+    sheet_stats, when given, receives one timing entry per sheet; duplicates,
+    a DuplicateIndex, every row with its source cell.
+    """
     # Extract transactions from Comptes 2019-2026 only
     print("\n--- Extracting BNP transactions ---")
     all_transactions = []
     for year in range(2019, 2027):
         sheet_name = f"Comptes {year}"
         if sheet_name in wb.sheetnames:
-            txs = extract_transactions_sheet(wb[sheet_name], sheet_name)
+            ws = wb[sheet_name]
+            timings = {}
+            sources = [] if duplicates is not None else None
+            start = time.perf_counter()
+            txs = extract_transactions_sheet(ws, sheet_name, timings, sources)
+            seconds = time.perf_counter() - start
             all_transactions.extend(txs)
+            if duplicates is not None:
+                for tx, source in zip(txs, sources):
+                    duplicates.add(tx, source)
             print(f"    {sheet_name}: {len(txs)} transactions")
+            if sheet_stats is not None:
+                sheet_stats.append({
+                    "sheet": sheet_name,
+                    "months": timings["months"],
+                    "sheet_rows": ws.max_row,
+                    "transactions": len(txs),
+                    "seconds": round(seconds, 6),
+                    "layout_seconds": round(timings["layout_seconds"], 6),
+                    "cell_read_seconds": round(seconds - timings["layout_seconds"], 6),
+                    "transactions_per_second": round(len(txs) / seconds) if seconds else None,
+                })
 
     # Build categories from transaction data
     print("\n--- Building categories from transaction data ---")
@@ -306,17 +353,52 @@ def main():
     for cat in categories:
         subs = f" → {cat['subcategories']}" if cat['subcategories'] else ""
         print(f"    {cat['name']}{subs}")
+    return all_transactions, categories
 
-    # Write JSON files
-    def write_json(filename, data):
-        path = os.path.join(OUTPUT_DIR, filename)
-        with open(path, "w", encoding="utf-8") as f:
-            json.dump(data, f, ensure_ascii=False, indent=2)
-        print(f"  Written {path} ({len(data)} entries)")
 
+def write_json(filename, data, output_dir=OUTPUT_DIR):
+    path = os.path.join(output_dir, filename)
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(data, f, ensure_ascii=False, indent=2)
+    print(f"  Written {path} ({len(data)} entries)")
+
+
+def write_duplicates(duplicates, output_dir=OUTPUT_DIR):
+    report = duplicates.report()
+    print_report(report)
+    path = os.path.join(output_dir, DUPLICATES_FILE)
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    print(f"  Written {path} ({len(report['duplicates'])} pairs)")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Extract comptes.xlsx into JSON files.")
+    parser.add_argument("--dedup", action="store_true",
+                        help=f"report rows repeated across sheets or month blocks "
+                             f"(written to {DUPLICATES_FILE})")
+    pipeline_metrics.add_arguments(parser, "extract")
+    args = parser.parse_args(argv)
+    metrics = pipeline_metrics.Metrics.from_args(args)
+
+    os.makedirs(OUTPUT_DIR, exist_ok=True)
+    print(f"Loading {EXCEL_PATH}...")
+    with metrics.stage("load_workbook"):
+        wb = openpyxl.load_workbook(EXCEL_PATH, data_only=True)
+    sheet_stats = []
+    duplicates = DuplicateIndex() if args.dedup else None
+    with metrics.stage("extract") as stage:
+        all_transactions, categories = extract_workbook(wb, sheet_stats, duplicates)
+        stage["rows"] = len(all_transactions)
+    metrics.add("sheets", sheet_stats)
+
+    # Write JSON files
     print("\n--- Writing JSON files ---")
-    write_json("categories.json", categories)
-    write_json("transactions-bnp.json", all_transactions)
+    with metrics.stage("write_json", rows=len(all_transactions)):
+        write_json("categories.json", categories)
+        write_json("transactions-bnp.json", all_transactions)
+    if duplicates is not None:
+        write_duplicates(duplicates, OUTPUT_DIR)
 
     # Summary
     categorized = sum(1 for t in all_transactions if "category" in t)
@@ -334,6 +416,8 @@ def main():
         cat_count = sum(1 for t in all_transactions if t["year"] == y and "category" in t)
         print(f"    {y}: {year_counts[y]} tx ({cat_count} categorized)")
 
+    metrics.write(OUTPUT_DIR, "extract")
+
 
 if __name__ == "__main__":
     main()
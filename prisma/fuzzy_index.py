@@ -0,0 +1,145 @@
+"""
+Fuzzy label lookup for near-miss labels (case, accent and typo variants).
+
+Uses a SymSpell-style deletion dictionary: every key is stored under all the
+strings obtained by deleting up to max_distance characters from it. A query
+only generates its own deletions and looks them up, so the cost of a lookup
+depends on the query length and the edit-distance bound, not on the number
+of keys.
+"""
+
+import unicodedata
+
+
+def fold(text: str) -> str:
+    """Case- and accent-fold a label, collapsing runs of whitespace."""
+    decomposed = unicodedata.normalize("NFKD", text)
+    stripped = "".join(ch for ch in decomposed if not unicodedata.combining(ch))
+    return " ".join(stripped.casefold().split())
+
+
+def max_distance_for(length: int) -> int:
+    """Edit-distance bound for a key of the given length.
+
+    Labels up to 6 characters ("BK", "Spar", "Canal") only match after
+    folding: one typo there already maps ordinary words onto them ("Spa",
+    "Canap", "Intel"). Longer ones allow one edit, and from 11 characters two.
+    """
+    if length <= 6:
+        return 0
+    if length <= 10:
+        return 1
+    return 2
+
+
+def edit_distance(a: str, b: str, limit: int) -> int:
+    """Optimal string alignment distance between a and b, or limit + 1 if above limit."""
+    if abs(len(a) - len(b)) > limit:
+        return limit + 1
+    prev2 = None
+    prev = list(range(len(b) + 1))
+    for i in range(1, len(a) + 1):
+        cur = [i] + [0] * len(b)
+        row_min = i
+        for j in range(1, len(b) + 1):
+            cost = 0 if a[i - 1] == b[j - 1] else 1
+            d = min(prev[j] + 1, cur[j - 1] + 1, prev[j - 1] + cost)
+            if i > 1 and j > 1 and a[i - 1] == b[j - 2] and a[i - 2] == b[j - 1]:
+                d = min(d, prev2[j - 2] + 1)
+            cur[j] = d
+            row_min = min(row_min, d)
+        if row_min > limit:
+            return limit + 1
+        prev2, prev = prev, cur
+    return prev[-1] if prev[-1] <= limit else limit + 1
+
+
+def _deletes(word: str, distance: int) -> set:
+    """All strings obtained by deleting up to `distance` characters from word."""
+    result = {word}
+    frontier = {word}
+    for _ in range(distance):
+        nxt = set()
+        for w in frontier:
+            for i in range(len(w)):
+                nxt.add(w[:i] + w[i + 1:])
+        nxt -= result
+        result |= nxt
+        frontier = nxt
+    return result
+
+
+class DeletionIndex:
+    """Closest-key lookup over a fixed set of folded keys.
+
+    keys is an iterable of (key, value); keys are folded, and keys folding to
+    the same string are all kept. lookup() returns the value of the closest
+    key within its edit-distance bound, ties going to the key inserted first.
+    """
+
+    def __init__(self, keys, max_distance: int = 2):
+        self.max_distance = max_distance
+        self.entries = []       # [(folded_key, original_key, value)], insertion order
+        self.deletes = {}       # deletion string -> [entry index]
+        self.folded = {}        # folded key -> [entry index], insertion order
+        for key, value in keys:
+            folded = fold(key)
+            if not folded:
+                continue
+            idx = len(self.entries)
+            self.folded.setdefault(folded, []).append(idx)
+            self.entries.append((folded, key, value))
+            bound = min(max_distance, max_distance_for(len(folded)))
+            for d in _deletes(folded, bound):
+                self.deletes.setdefault(d, []).append(idx)
+        self.max_key_length = max((len(e[0]) for e in self.entries), default=0)
+
+    def __len__(self):
+        return len(self.entries)
+
+    def lookup(self, label: str, fallback: "DeletionIndex" = None, exclude=()):
+        """Return (original_key, value, distance) for the closest key, or None.
+
+        With a fallback index, it is searched (reusing the query's deletions)
+        only when this index has no key within bound. Original keys in
+        exclude are skipped, so the next closest key answers instead.
+        """
+        query = fold(label)
+        if not query:
+            return None
+        deletes = None
+        for index in (self, fallback):
+            if index is None or len(query) > index.max_key_length + index.max_distance:
+                continue
+            # Case/accent variants of a known key need no edit-distance search
+            for idx in index.folded.get(query, ()):
+                if index.entries[idx][1] not in exclude:
+                    return index.entries[idx][1], index.entries[idx][2], 0
+            if deletes is None:
+                deletes = _deletes(query, max(self.max_distance, getattr(fallback, "max_distance", 0)))
+            hit = index._search(query, deletes, exclude)
+            if hit is not None:
+                return hit
+        return None
+
+    def _search(self, query: str, deletes, exclude=()):
+        best = None
+        seen = set()
+        for d in deletes:
+            for idx in self.deletes.get(d, ()):
+                if idx in seen:
+                    continue
+                seen.add(idx)
+                folded, key, value = self.entries[idx]
+                if key in exclude:
+                    continue
+                limit = min(self.max_distance, max_distance_for(len(folded)))
+                dist = edit_distance(query, folded, limit)
+                if dist > limit:
+                    continue
+                if best is None or (dist, idx) < (best[2], best[0]):
+                    best = (idx, value, dist)
+        if best is None:
+            return None
+        idx, value, dist = best
+        return self.entries[idx][1], value, dist
@@ -0,0 +1,133 @@
+"""
+Group near-duplicate labels with MinHash locality-sensitive hashing.
+
+Each label is folded and shingled into character trigrams, summarised by a
+MinHash signature, and the signature is cut into bands: labels sharing any
+band bucket become merge candidates, checked against their bucket's first
+label. Cost is linear in the number of labels (no pairwise comparison), so
+a report over thousands of uncategorised labels stays fast. Signatures are
+computed with NumPy when it is installed, in pure Python otherwise (same
+values either way).
+"""
+
+import random
+import zlib
+
+from fuzzy_index import fold
+
+try:
+    import numpy as np
+except ImportError:  # optional: only speeds up signatures
+    np = None
+
+# Mersenne prime 2^31 - 1: (a * x + b) stays below 2^64 for 32-bit shingles
+_PRIME = (1 << 31) - 1
+# Shingles hashed per NumPy batch: 8192 x 64 permutations is 4 MB of uint64
+_CHUNK_SHINGLES = 8192
+
+
+def shingles(label: str, k: int = 3) -> set:
+    """Hashed character k-grams of the folded, space-padded label."""
+    text = f" {fold(label)} "
+    if len(text) <= k:
+        return {zlib.crc32(text.encode("utf-8"))}
+    return {zlib.crc32(text[i:i + k].encode("utf-8")) for i in range(len(text) - k + 1)}
+
+
+class MinHasher:
+    """MinHash signatures of num_perm universal hash functions."""
+
+    def __init__(self, num_perm: int = 64, seed: int = 1):
+        rng = random.Random(seed)
+        self.params = [(rng.randrange(1, _PRIME), rng.randrange(0, _PRIME)) for _ in range(num_perm)]
+
+    def signature(self, shingle_set) -> tuple:
+        return tuple(min((a * x + b) % _PRIME for x in shingle_set) for a, b in self.params)
+
+    def signatures(self, shingle_sets) -> list:
+        """Signatures of many shingle sets, vectorised when NumPy is available."""
+        if np is None or not shingle_sets:
+            return [self.signature(s) for s in shingle_sets]
+        a = np.array([p[0] for p in self.params], dtype=np.uint64)
+        b = np.array([p[1] for p in self.params], dtype=np.uint64)
+        result = []
+        # A chunk of sets at a time: the (shingles x num_perm) hash matrix
+        # stays around _CHUNK_SHINGLES rows however many labels there are
+        start = 0
+        while start < len(shingle_sets):
+            stop, rows = start, 0
+            while stop < len(shingle_sets) and (rows < _CHUNK_SHINGLES or stop == start):
+                rows += len(shingle_sets[stop])
+                stop += 1
+            chunk = shingle_sets[start:stop]
+            lengths = [len(s) for s in chunk]
+            flat = np.fromiter((x for s in chunk for x in s), dtype=np.uint64, count=rows)
+            hashed = (flat[:, None] * a[None, :] + b[None, :]) % np.uint64(_PRIME)
+            starts = np.concatenate([[0], np.cumsum(lengths)[:-1]])
+            result.extend(tuple(row) for row in np.minimum.reduceat(hashed, starts, axis=0).tolist())
+            start = stop
+        return result
+
+
+def similarity(sig_a, sig_b) -> float:
+    """Estimated Jaccard similarity of two MinHash signatures."""
+    return sum(a == b for a, b in zip(sig_a, sig_b)) / len(sig_a)
+
+
+def cluster_labels(labels, num_perm: int = 64, bands: int = 16, threshold: float = 0.4) -> list:
+    """Partition labels into clusters of near-duplicates.
+
+    With bands of num_perm // bands rows, pairs above roughly
+    (1 / bands) ** (bands / num_perm) Jaccard similarity are likely to share
+    a bucket; candidates below threshold are not merged. Returns a list of
+    clusters, each a list of labels in input order.
+    """
+    labels = list(dict.fromkeys(labels))
+    if not labels:
+        return []
+    hasher = MinHasher(num_perm)
+    rows = num_perm // bands
+    signatures = hasher.signatures([shingles(label) for label in labels])
+
+    parent = list(range(len(labels)))
+
+    def find(i):
+        while parent[i] != i:
+            parent[i] = parent[parent[i]]
+            i = parent[i]
+        return i
+
+    for band in range(bands):
+        buckets = {}
+        lo, hi = band * rows, (band + 1) * rows
+        for i, sig in enumerate(signatures):
+            first = buckets.setdefault(sig[lo:hi], i)
+            if first != i and similarity(signatures[first], sig) >= threshold:
+                a, b = find(first), find(i)
+                if a != b:
+                    parent[max(a, b)] = min(a, b)
+
+    clusters = {}
+    for i, label in enumerate(labels):
+        clusters.setdefault(find(i), []).append(label)
+    return list(clusters.values())
+
+
+def summarise_clusters(counts, amounts, **options) -> list:
+    """Cluster labels and total their counts and amounts.
+
+    counts and amounts map label -> number of rows / summed amount. Returns
+    [(representative, total_count, total_amount, members)] sorted by total
+    count, the representative being the most frequent (then shortest) label.
+    """
+    summary = []
+    for members in cluster_labels(counts, **options):
+        members.sort(key=lambda label: (-counts[label], len(label), label))
+        summary.append((
+            members[0],
+            sum(counts[label] for label in members),
+            round(sum(amounts.get(label, 0.0) for label in members), 2),
+            members,
+        ))
+    summary.sort(key=lambda c: (-c[1], c[0]))
+    return summary
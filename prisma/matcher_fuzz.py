@@ -0,0 +1,367 @@
+#!/usr/bin/env python3
+"""
+Differential fuzzing of label matchers against the reference first-match rules.
+
+reference_match() is a literal, unoptimised reading of the rule tiers in
+categorize.py: a linear scan per tier, one regex at a time and a brute-force
+fuzzy search. Any faster engine (indexes, automata, caches, overlays...) must
+return exactly the same (rule_id, category, subcategory) for every label.
+check_engine() throws adversarial labels built from the rule tables at a
+candidate and shrinks the first mismatch it finds to a minimal label.
+
+Usage: python3 prisma/matcher_fuzz.py [--engine NAME] [--iterations N] [--seed S]
+"""
+
+import argparse
+import functools
+import random
+import re
+import sys
+import time
+import unicodedata
+
+import categorize
+from condition_index import matches as condition_matches
+from fuzzy_index import edit_distance, fold, max_distance_for
+
+_fold_key = functools.lru_cache(maxsize=None)(fold)
+
+
+def reference_match(label: str, amount: float, date: str = None, exact=None, prefix=None,
+                    contains=None, regex=None, fuzzy=True, conditional=None,
+                    fuzzy_tables=None) -> tuple:
+    """Return (rule_id, category, subcategory) by scanning every rule in order.
+
+    fuzzy_tables are the {label: value} tables the fuzzy tier searches in
+    turn, the first one with a key within bound answering (default: exact).
+    """
+    conditional = categorize.CONDITIONAL_RULES if conditional is None else conditional
+    exact = categorize.EXACT_RULES if exact is None else exact
+    prefix = categorize.PREFIX_RULES if prefix is None else prefix
+    contains = categorize.CONTAINS_RULES if contains is None else contains
+    regex = categorize.REGEX_RULES if regex is None else regex
+
+    lower = label.lower()
+    position = {}
+    for rule_label, conditions, cat, subcat in conditional:
+        key = rule_label.lower()
+        idx = position[key] = position.get(key, -1) + 1
+        if key == lower and condition_matches(conditions, amount, date):
+            return (f"conditional:{key}#{idx}", cat, subcat)
+
+    if label in exact:
+        return (f"exact:{label}",) + tuple(exact[label])
+
+    for pattern, cat, subcat in prefix:
+        if lower.startswith(pattern):
+            return (f"prefix:{pattern}", cat, subcat)
+    for pattern, cat, subcat in contains:
+        if pattern in lower:
+            return (f"contains:{pattern}", cat, subcat)
+    for pattern, cat, subcat in regex:
+        if re.search(pattern, lower, re.DOTALL):
+            return (f"regex:{pattern}", cat, subcat)
+
+    if fuzzy:
+        query = fold(label)
+        for table in fuzzy_tables or (exact,):
+            best = None
+            for key, value in table.items():
+                folded = _fold_key(key)
+                if not folded:
+                    continue
+                limit = min(2, max_distance_for(len(folded)))
+                dist = edit_distance(query, folded, limit) if query else limit + 1
+                if dist <= limit and (best is None or dist < best[0]):
+                    best = (dist, key, value)
+            if best is not None:
+                return (f"fuzzy:{best[1]}",) + tuple(best[2])
+
+    if amount > 0:
+        return ("amount:positive", "Rentrée", "Autre")
+    return ("default", "Non catégorisé", None)
+
+
+# Conditional rules with overlapping amount ranges and date windows on the
+# same label, and labels that exact and prefix rules also match
+SAMPLE_CONDITIONAL = [
+    ("economies", {"sign": "+"}, "Economies", "Retrait"),
+    ("loyer", {"min_amount": -900, "max_amount": -700, "from": "2022-01-01"}, "Foyer", "Loyer"),
+    ("loyer", {"max_amount": -700}, "Foyer", "Autre"),
+    ("courses", {"from": "2019-01-01", "until": "2023-12-31"}, "Alimentation", "Courses"),
+    ("courses", {"sign": "-", "max_amount": -100}, "Alimentation", "Autre"),
+]
+
+
+# --- Adversarial label generation ---
+
+_NOISE = ["", " ", "  ", "x", " gare", " 05/07", " 2x", "é", "'", "-", " CB 1234", "\t"]
+_ACCENTS = {"e": "é", "a": "à", "u": "ù", "o": "ô", "c": "ç", "i": "î"}
+
+
+def _strip_accents(text: str) -> str:
+    decomposed = unicodedata.normalize("NFKD", text)
+    return "".join(ch for ch in decomposed if not unicodedata.combining(ch))
+
+
+def _mutate(rng, text: str) -> str:
+    """Apply one random character edit: insert, delete, substitute or transpose."""
+    if not text:
+        return rng.choice("abcé ")
+    i = rng.randrange(len(text))
+    op = rng.randrange(4)
+    if op == 0:
+        return text[:i] + rng.choice("abcdeéz '0") + text[i:]
+    if op == 1:
+        return text[:i] + text[i + 1:]
+    if op == 2:
+        return text[:i] + rng.choice("aeéiosrt") + text[i + 1:]
+    if i + 1 < len(text):
+        return text[:i] + text[i + 1] + text[i] + text[i + 2:]
+    return text
+
+
+def _vary(rng, text: str) -> str:
+    """Case, accent and whitespace variants of text."""
+    choice = rng.randrange(6)
+    if choice == 0:
+        return text.upper()
+    if choice == 1:
+        return text.capitalize()
+    if choice == 2:
+        return _strip_accents(text)
+    if choice == 3:
+        return "".join(_ACCENTS.get(ch, ch) if rng.random() < 0.3 else ch for ch in text)
+    if choice == 4:
+        return text.replace(" ", "  ")
+    return text
+
+
+class LabelGenerator:
+    """Generate labels aimed at rule boundaries and first-match ordering."""
+
+    def __init__(self, seed: int = 0):
+        self.rng = random.Random(seed)
+        self.exact = list(categorize.EXACT_RULES)
+        self.prefixes = [p for p, _, _ in categorize.PREFIX_RULES]
+        self.contains = [p for p, _, _ in categorize.CONTAINS_RULES]
+        # Prefix pairs where an earlier rule may shadow a later one ("rb " / "rb ...")
+        self.overlapping = [
+            (a, b) for i, a in enumerate(self.prefixes) for b in self.prefixes[i + 1:]
+            if b.startswith(a) or a.startswith(b)
+        ]
+        # Conditional rule labels, and amounts/dates on and around their bounds
+        conditional = categorize.CONDITIONAL_RULES + SAMPLE_CONDITIONAL
+        self.conditional = [label for label, _, _, _ in conditional]
+        bounds = {0.0}
+        dates = {None, "2019-01-01", "2024-06-15"}
+        for _, conditions, _, _ in conditional:
+            for key in ("min_amount", "max_amount"):
+                if conditions.get(key) is not None:
+                    bounds.add(float(conditions[key]))
+            dates.update(conditions.get(k) for k in ("from", "until"))
+        self.amounts = sorted({b + d for b in bounds for d in (-0.01, 0.0, 0.01)} | {-12.5, 42.0})
+        self.dates = [d for d in dates]
+        self.strategies = [
+            self._exact, self._prefix, self._contains, self._overlap,
+            self._combined, self._regexy, self._noise,
+        ]
+        if self.conditional:
+            self.strategies.append(self._conditional)
+
+    def _exact(self, rng):
+        return _vary(rng, rng.choice(self.exact))
+
+    def _prefix(self, rng):
+        p = rng.choice(self.prefixes)
+        cut = rng.choice([len(p), len(p), len(p) - 1, len(p) + 1])
+        return _vary(rng, p[:max(cut, 0)]) + rng.choice(_NOISE)
+
+    def _contains(self, rng):
+        return rng.choice(_NOISE) + rng.choice(self.contains) + rng.choice(_NOISE)
+
+    def _overlap(self, rng):
+        if not self.overlapping:
+            return self._prefix(rng)
+        a, b = rng.choice(self.overlapping)
+        return rng.choice([a, b, b + a, a + rng.choice(_NOISE)])
+
+    def _combined(self, rng):
+        return rng.choice(self.prefixes) + rng.choice(_NOISE) + rng.choice(self.contains)
+
+    def _regexy(self, rng):
+        word = rng.choice(["collation", "goûter", "cb", "carte", "vir", "virement", "snack"])
+        tail = rng.choice([f" {rng.randint(1, 31)}/{rng.randint(1, 12):02d}",
+                           f" *{rng.randint(1000, 9999)}", f" {rng.randint(10**5, 10**9)}",
+                           f"{rng.randint(0, 9999)}", " gare"])
+        return _vary(rng, word) + tail
+
+    def _conditional(self, rng):
+        return _vary(rng, rng.choice(self.conditional))
+
+    def _noise(self, rng):
+        return "".join(rng.choice("abcdeéèfgç '-0123/") for _ in range(rng.randint(0, 12)))
+
+    def __call__(self) -> tuple:
+        rng = self.rng
+        label = rng.choice(self.strategies)(rng)
+        for _ in range(rng.choice([0, 0, 0, 1, 2])):
+            label = _mutate(rng, label)
+        amount = rng.choice(self.amounts)
+        date = rng.choice(self.dates)
+        return label, amount, date
+
+
+# --- Checking and shrinking ---
+
+def shrink(label: str, amount: float, date, fails) -> tuple:
+    """Greedily reduce (label, amount, date) while fails(label, amount, date) stays true."""
+    for candidate in (0.0, -1.0, 1.0):
+        if candidate != amount and fails(label, candidate, date):
+            amount = candidate
+            break
+    if date is not None and fails(label, amount, None):
+        date = None
+
+    changed = True
+    while changed:
+        changed = False
+        # Drop chunks, from half the label down to single characters
+        size = max(len(label) // 2, 1)
+        while size >= 1 and label:
+            i = 0
+            while i < len(label):
+                candidate = label[:i] + label[i + size:]
+                if fails(candidate, amount, date):
+                    label = candidate
+                    changed = True
+                else:
+                    i += size
+            size //= 2
+        # Simplify characters: lowercase, strip accents
+        for simplify in (str.lower, _strip_accents):
+            candidate = simplify(label)
+            if candidate != label and fails(candidate, amount, date):
+                label = candidate
+                changed = True
+    return label, amount, date
+
+
+class Mismatch:
+    """A label on which the candidate and the reference disagree."""
+
+    def __init__(self, label, amount, date, expected, actual, original):
+        self.label = label
+        self.amount = amount
+        self.date = date
+        self.expected = expected
+        self.actual = actual
+        self.original = original
+
+    def __str__(self):
+        return (f"label={self.label!r} amount={self.amount} date={self.date}\n"
+                f"  reference: {self.expected}\n"
+                f"  candidate: {self.actual}\n"
+                f"  (shrunk from {self.original[0]!r}, amount={self.original[1]}, "
+                f"date={self.original[2]})")
+
+
+def check_engine(candidate, reference=reference_match, iterations: int = 100000,
+                 seed: int = 0, generator=None):
+    """Compare candidate(label, amount, date) with reference on generated labels.
+
+    Both callables return (rule_id, category, subcategory). Returns
+    (checked, Mismatch or None); stops at the first mismatch, shrunk.
+    """
+    generator = generator or LabelGenerator(seed)
+    # The reference is slow but pure, and generated labels repeat often
+    expected = {}
+
+    def fails(label, amount, date):
+        key = (label, amount, date)
+        if key not in expected:
+            expected[key] = reference(label, amount, date)
+        return candidate(label, amount, date) != expected[key]
+
+    for i in range(iterations):
+        label, amount, date = generator()
+        if fails(label, amount, date):
+            small = shrink(label, amount, date, fails)
+            return i + 1, Mismatch(*small, reference(*small), candidate(*small),
+                                   (label, amount, date))
+    return iterations, None
+
+
+# Overlay exercising each kind of override: new and masked exact keys (one
+# with a case variant left in the base), a prefix that shadows base ones, a
+# disabled short prefix and contains rule, and a disabled prefix ("jap ")
+# that shadows longer base ones
+SAMPLE_OVERLAY = {
+    "exact": {"Maman": ["Famille", None], "Salle Damien": ["Loisirs", "Sport"]},
+    "prefix": [["courses", "Alimentation", "Courses"], ["r", "Autre", None]],
+    "contains": [["gare", "Transports", None]],
+    "disable": ["prefix:rb ", "prefix:jap ", "exact:Loyer", "contains:paypal",
+                "exact:Caf compte pas"],
+}
+
+
+def _overlay_engine(fuzzy: bool):
+    overlay = categorize.compile_rules(fuzzy=fuzzy).overlay(**SAMPLE_OVERLAY)
+    # The overlay must behave like its own rules followed by the full base
+    # tables, less the disabled rules, scanned in order. Its fuzzy tier tries
+    # the overlay's own labels before the base ones
+    disabled = set(SAMPLE_OVERLAY["disable"])
+    exact = overlay.exact
+    prefix = [tuple(r) for r in SAMPLE_OVERLAY["prefix"]] + [
+        r for r in categorize.PREFIX_RULES if f"prefix:{r[0]}" not in disabled]
+    contains = [tuple(r) for r in SAMPLE_OVERLAY["contains"]] + [
+        r for r in categorize.CONTAINS_RULES if f"contains:{r[0]}" not in disabled]
+    fuzzy_tables = (
+        SAMPLE_OVERLAY["exact"],
+        {k: v for k, v in categorize.EXACT_RULES.items() if f"exact:{k}" not in disabled},
+    )
+    return overlay.match, lambda label, amount, date: reference_match(
+        label, amount, date, exact=exact, prefix=prefix, contains=contains, fuzzy=fuzzy,
+        fuzzy_tables=fuzzy_tables)
+
+
+ENGINES = {
+    "compiled": lambda: (categorize.compile_rules(fuzzy=True).match, reference_match),
+    "compiled-no-fuzzy": lambda: (
+        categorize.compile_rules(fuzzy=False).match,
+        lambda label, amount, date: reference_match(label, amount, date, fuzzy=False),
+    ),
+    "conditional": lambda: (
+        categorize.compile_rules(conditional=SAMPLE_CONDITIONAL).match,
+        lambda label, amount, date: reference_match(label, amount, date, fuzzy=False,
+                                                    conditional=SAMPLE_CONDITIONAL),
+    ),
+    "overlay": lambda: _overlay_engine(fuzzy=True),
+    "overlay-no-fuzzy": lambda: _overlay_engine(fuzzy=False),
+}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Fuzz label matchers against the reference rules.")
+    parser.add_argument("--engine", choices=sorted(ENGINES), action="append",
+                        help="engine to check (repeatable, default: all)")
+    parser.add_argument("--iterations", type=int, default=100000)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args(argv)
+
+    failed = False
+    for name in args.engine or sorted(ENGINES):
+        candidate, reference = ENGINES[name]()
+        start = time.perf_counter()
+        checked, mismatch = check_engine(candidate, reference, args.iterations, args.seed)
+        elapsed = time.perf_counter() - start
+        if mismatch is None:
+            print(f"{name}: {checked} labels match the reference ({elapsed:.1f}s)")
+        else:
+            failed = True
+            print(f"{name}: MISMATCH after {checked} labels\n  {mismatch}")
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
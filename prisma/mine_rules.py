@@ -0,0 +1,198 @@
+#!/usr/bin/env python3
+"""
+Propose new PREFIX_RULES / CONTAINS_RULES entries from categorised history.
+
+Builds a word-level prefix trie and a token index over the lowercased labels,
+each node annotated with category counts, in one pass over the transactions.
+A node is a candidate rule when enough labelled rows reach it (support) and
+most of them share one (category, subcategory) (purity). The rule emitted
+is a plain prefix or substring, which also fires inside longer words ("max"
+on "maxi ...", "here" on "where"), so every candidate found on words is
+recounted over the distinct labels with the rule's own test before it is
+kept. Candidates are ranked by how many currently uncategorised rows (no
+category, and the rules, compiled with the same options as categorize.py,
+fall through to the amount heuristic or "Non catégorisé") they would resolve. A candidate an existing
+rule or a better-ranked candidate would always pre-empt (see
+rule_compiler.live_rules) is dropped.
+
+Usage: python3 prisma/mine_rules.py [--data-dir DIR] [--min-support 3]
+           [--min-purity 0.9] [--min-resolves 1] [--output FILE]
+           [--fuzzy] [--model FILE [--model-threshold P]] [--overlay FILE]
+"""
+
+import argparse
+import json
+import os
+from collections import Counter
+
+import categorize
+from rule_compiler import live_rules
+
+# Contains candidates shorter than this match too much to be useful
+MIN_TOKEN_LENGTH = 4
+
+
+class _Node:
+    __slots__ = ("children", "counts", "uncategorised")
+
+    def __init__(self):
+        self.children = {}
+        self.counts = Counter()     # (category, subcategory) -> labelled rows
+        self.uncategorised = 0      # uncategorised rows reaching this node
+
+
+def _is_uncategorised(rule_id: str) -> bool:
+    return rule_id == "default" or rule_id.startswith("amount:")
+
+
+def _recount(pattern, labels, tier):
+    """Counts and uncategorised rows of the labels the emitted rule would match."""
+    counts = Counter()
+    uncategorised = 0
+    for lower, node in labels.items():
+        if lower.startswith(pattern) if tier == "prefix" else pattern in lower:
+            counts.update(node.counts)
+            uncategorised += node.uncategorised
+    return counts, uncategorised
+
+
+def _candidate(pattern, node_counts, uncategorised, min_support, min_purity):
+    support = sum(node_counts.values())
+    if support < min_support:
+        return None
+    (cat, sub), top = node_counts.most_common(1)[0]
+    purity = top / support
+    if purity < min_purity:
+        return None
+    return {
+        "pattern": pattern,
+        "category": cat,
+        "subcategory": sub,
+        "support": support,
+        "purity": round(purity, 3),
+        "resolves": uncategorised,
+    }
+
+
+def mine_rules(transactions, rules=None, min_support=3, min_purity=0.9, min_resolves=1) -> dict:
+    """Return {"prefix": [...], "contains": [...]} candidates, best first."""
+    rules = rules or categorize.compile_rules()
+    existing_prefixes = [p for p, _, _ in rules.prefix]
+    existing_contains = [p for p, _, _ in rules.contains]
+    rules.prime_model([tx["label"] for tx in transactions if categorize.needs_category(tx)])
+
+    root = _Node()
+    tokens = {}  # token -> _Node (children unused)
+    labels = {}  # lowercased label -> _Node (children unused)
+    for tx in transactions:
+        label = tx["label"]
+        cat = tx.get("category")
+        if cat and cat != "Non catégorisé":
+            target, uncategorised = (cat, tx.get("subcategory")), False
+        else:
+            # Unlabelled: only "to resolve" if the current rules cannot place it
+            target = None
+            uncategorised = _is_uncategorised(
+                rules.match(label, tx["amount"], categorize.transaction_date(tx))[0])
+
+        lower = label.lower()
+        entry = labels.setdefault(lower, _Node())
+        if target:
+            entry.counts[target] += 1
+        entry.uncategorised += uncategorised
+
+        words = lower.split()
+        node = root
+        for word in words:
+            node = node.children.setdefault(word, _Node())
+            if target:
+                node.counts[target] += 1
+            node.uncategorised += uncategorised
+        for word in set(words):
+            if len(word) < MIN_TOKEN_LENGTH:
+                continue
+            entry = tokens.setdefault(word, _Node())
+            if target:
+                entry.counts[target] += 1
+            entry.uncategorised += uncategorised
+
+    # Prefix candidates: shallowest qualifying node on each trie path
+    prefix_candidates = []
+    stack = [(child, word) for word, child in root.children.items()]
+    while stack:
+        node, pattern = stack.pop()
+        shadowed = any(pattern.startswith(p) for p in existing_prefixes)
+        found = None if shadowed else _candidate(
+            pattern, node.counts, node.uncategorised, min_support, min_purity)
+        if found:
+            found = _candidate(pattern, *_recount(pattern, labels, "prefix"),
+                               min_support, min_purity)
+        if found:
+            prefix_candidates.append(found)
+            continue
+        stack.extend((child, f"{pattern} {word}") for word, child in node.children.items())
+
+    # Contains candidates: single tokens no earlier contains pattern already covers
+    contains_candidates = []
+    for word, node in tokens.items():
+        if any(p in word for p in existing_contains):
+            continue
+        found = _candidate(word, node.counts, node.uncategorised, min_support, min_purity)
+        if found:
+            found = _candidate(word, *_recount(word, labels, "contains"),
+                               min_support, min_purity)
+        if found:
+            contains_candidates.append(found)
+
+    def ranked(candidates, existing, tier):
+        kept = [c for c in candidates if c["resolves"] >= min_resolves]
+        kept.sort(key=lambda c: (-c["resolves"], -c["support"], c["pattern"]))
+        # Appended after the existing rules in this order, a candidate covered
+        # by an earlier pattern (existing or candidate) would never fire
+        table = [(p, None, None) for p in existing]
+        table += [(c["pattern"], c["category"], c["subcategory"]) for c in kept]
+        live, _ = live_rules(table, tier)
+        alive = {rule[0] for rule in live[len(existing):]}
+        return [c for c in kept if c["pattern"] in alive]
+
+    return {"prefix": ranked(prefix_candidates, existing_prefixes, "prefix"),
+            "contains": ranked(contains_candidates, existing_contains, "contains")}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Mine prefix/contains rule candidates.")
+    parser.add_argument("--data-dir", default=categorize.DATA_DIR)
+    parser.add_argument("--min-support", type=int, default=3,
+                        help="minimum labelled rows behind a candidate (default: 3)")
+    parser.add_argument("--min-purity", type=float, default=0.9,
+                        help="minimum share of the majority category (default: 0.9)")
+    parser.add_argument("--min-resolves", type=int, default=1,
+                        help="minimum uncategorised rows a candidate must resolve (default: 1)")
+    parser.add_argument("--output", help="also write the candidates as JSON")
+    categorize.add_rule_arguments(parser)
+    args = parser.parse_args(argv)
+
+    with open(os.path.join(args.data_dir, "transactions-bnp.json"), "r", encoding="utf-8") as f:
+        transactions = json.load(f)
+
+    # Resolving means placing rows categorize.py, run with the same options, leaves out
+    rules = categorize.compile_rules(**categorize.rule_options(args))
+    candidates = mine_rules(transactions, rules, min_support=args.min_support,
+                            min_purity=args.min_purity, min_resolves=args.min_resolves)
+
+    for tier, title in (("prefix", "PREFIX_RULES"), ("contains", "CONTAINS_RULES")):
+        print(f"\n# {title} candidates ({len(candidates[tier])})")
+        for c in candidates[tier]:
+            sub = f'"{c["subcategory"]}"' if c["subcategory"] else "None"
+            rule = f'("{c["pattern"]}", "{c["category"]}", {sub}),'
+            print(f"    {rule:60s} # resolves {c['resolves']}, "
+                  f"support {c['support']}, purity {c['purity']:.2f}")
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(candidates, f, ensure_ascii=False, indent=2)
+        print(f"\nWritten {args.output}")
+
+
+if __name__ == "__main__":
+    main()
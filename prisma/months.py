@@ -0,0 +1,24 @@
+"""
+Month ordinals and cent amounts shared by the NumPy statistics modules.
+
+A month ordinal is year * 12 + month - 1, so consecutive months are
+consecutive integers. Amounts are summed as integer cents and only turned
+back into euros for output.
+"""
+
+import numpy as np
+
+
+def month_name(ordinal: int) -> str:
+    """"YYYY-MM" of a month ordinal."""
+    return f"{ordinal // 12}-{ordinal % 12 + 1:02d}"
+
+
+def euros(cents) -> float:
+    return round(int(cents) / 100, 2)
+
+
+def sum_cents(index, cents, size: int) -> np.ndarray:
+    """Integer cents summed per index slot, as an int64 array of length size."""
+    # bincount sums in float64, exact for cents below 2**53
+    return np.rint(np.bincount(index, weights=cents, minlength=size)).astype(np.int64)
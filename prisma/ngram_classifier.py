@@ -0,0 +1,325 @@
+#!/usr/bin/env python3
+"""
+Fallback label classifier trained on already-categorised transactions.
+
+A multinomial naive Bayes model over hashed character n-grams of the folded
+label. The model is stored as a sparse matrix in CSR form (feature hash ->
+per-class counts) in a compressed .npz file, scored in batches with NumPy,
+and can be retrained incrementally because counts are additive.
+
+It learns from the categorised rows of transactions-bnp.json whose category
+can be trusted: those the sheet gave (the later "Comptes" sheets carry
+hand-entered ones) and those an exact, prefix or contains rule decides.
+categorize.py writes its decisions into the same file, so each row is
+re-matched against the rules: a row the rules would categorise differently
+came from the sheet, one they agree with is kept only when the deciding
+rule is explicit. Rows the fallback tiers (fuzzy, regex, the amount
+heuristic) would have filled in are left out, so the model is not trained
+on guesses. The model records a hash of every row it was trained on, and
+train --update only feeds it the rows it has not seen.
+
+Usage: python3 prisma/ngram_classifier.py train [--update] [--data-dir DIR] [--model FILE]
+       python3 prisma/ngram_classifier.py predict LABEL... [--model FILE] [--threshold P]
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import zlib
+
+import numpy as np
+
+from categorize import compile_rules, transaction_date
+from fuzzy_index import fold
+
+DATA_DIR = os.path.join(os.path.dirname(__file__), "data")
+MODEL_FILE = "ngram-model.npz"
+
+# Rule tiers whose decisions are trusted as training labels
+TRAINING_TIERS = ("exact", "prefix", "contains")
+
+
+def label_features(label: str, ngram_range=(2, 4)) -> list:
+    """Hashed character n-grams of the folded, space-padded label."""
+    text = f" {fold(label)} "
+    lo, hi = ngram_range
+    features = []
+    for n in range(lo, hi + 1):
+        for i in range(len(text) - n + 1):
+            features.append(zlib.crc32(text[i:i + n].encode("utf-8")))
+    return features
+
+
+class NgramClassifier:
+    """Naive Bayes over character n-grams, with sparse CSR count storage.
+
+    features: sorted uint32 n-gram hashes seen in training
+    indptr, class_idx, counts: CSR rows, one per feature, of per-class counts
+    class_totals: total n-gram count per class
+    class_docs: number of training labels per class
+    trained_rows: sorted uint64 hashes of the rows trained on (see row_hashes)
+    """
+
+    def __init__(self, classes=(), ngram_range=(2, 4), alpha=0.1):
+        self.classes = [tuple(c) for c in classes]
+        self.ngram_range = tuple(ngram_range)
+        self.alpha = alpha
+        self.features = np.zeros(0, dtype=np.uint32)
+        self.indptr = np.zeros(1, dtype=np.int64)
+        self.class_idx = np.zeros(0, dtype=np.int32)
+        self.counts = np.zeros(0, dtype=np.float32)
+        self.class_totals = np.zeros(len(self.classes), dtype=np.float64)
+        self.class_docs = np.zeros(len(self.classes), dtype=np.float64)
+        self.trained_rows = np.zeros(0, dtype=np.uint64)
+
+    # --- Training ---
+
+    def mark_trained(self, hashes):
+        """Remember rows (row_hashes) as trained on."""
+        self.trained_rows = np.union1d(self.trained_rows, np.asarray(hashes, dtype=np.uint64))
+
+    def untrained(self, hashes) -> np.ndarray:
+        """Mask of the hashes not trained on yet."""
+        return ~np.isin(np.asarray(hashes, dtype=np.uint64), self.trained_rows)
+
+    def partial_fit(self, labels, targets):
+        """Add (label, (category, subcategory)) training pairs to the counts."""
+        index = {c: i for i, c in enumerate(self.classes)}
+        rows_f, rows_c = [], []
+        docs = []
+        for label, target in zip(labels, targets):
+            target = tuple(target)
+            if target not in index:
+                index[target] = len(self.classes)
+                self.classes.append(target)
+            c = index[target]
+            docs.append(c)
+            feats = label_features(label, self.ngram_range)
+            rows_f.extend(feats)
+            rows_c.extend([c] * len(feats))
+
+        n_classes = len(self.classes)
+        self.class_totals = np.pad(self.class_totals, (0, n_classes - len(self.class_totals)))
+        self.class_docs = np.pad(self.class_docs, (0, n_classes - len(self.class_docs)))
+        np.add.at(self.class_docs, np.asarray(docs, dtype=np.int64), 1)
+
+        # Merge old and new (feature, class, count) triplets, summing duplicates
+        old_f = np.repeat(self.features, np.diff(self.indptr)).astype(np.int64)
+        f = np.concatenate([old_f, np.asarray(rows_f, dtype=np.int64)])
+        c = np.concatenate([self.class_idx, np.asarray(rows_c, dtype=np.int32)]).astype(np.int64)
+        w = np.concatenate([self.counts, np.ones(len(rows_f), dtype=np.float32)])
+        keys, inverse = np.unique(f * n_classes + c, return_inverse=True)
+        summed = np.bincount(inverse, weights=w, minlength=len(keys)).astype(np.float32)
+
+        feat_of_key = keys // n_classes
+        self.class_idx = (keys % n_classes).astype(np.int32)
+        self.counts = summed
+        self.features, starts = np.unique(feat_of_key, return_index=True)
+        self.features = self.features.astype(np.uint32)
+        self.indptr = np.append(starts, len(keys)).astype(np.int64)
+        self.class_totals = np.bincount(self.class_idx, weights=self.counts, minlength=n_classes)
+        return self
+
+    # --- Scoring ---
+
+    def _scores(self, labels) -> tuple:
+        """Log-posterior scores (len(labels), len(classes)) and n-gram coverage per label."""
+        n_labels, n_classes = len(labels), len(self.classes)
+
+        # Query n-grams as (label index, feature row), unknown n-grams dropped
+        q_label, q_feat = [], []
+        for i, label in enumerate(labels):
+            feats = label_features(label, self.ngram_range)
+            q_label.extend([i] * len(feats))
+            q_feat.extend(feats)
+        q_label = np.asarray(q_label, dtype=np.int64)
+        q_feat = np.asarray(q_feat, dtype=np.uint32)
+        n_total = np.bincount(q_label, minlength=n_labels)
+        if len(self.features):
+            rows = np.searchsorted(self.features, q_feat)
+            known = rows < len(self.features)
+            known[known] = self.features[rows[known]] == q_feat[known]
+        else:
+            rows = np.zeros(len(q_feat), dtype=np.int64)
+            known = np.zeros(len(q_feat), dtype=bool)
+        q_label, rows = q_label[known], rows[known]
+        n_known = np.bincount(q_label, minlength=n_labels)
+        coverage = np.divide(n_known, n_total, out=np.zeros(n_labels), where=n_total > 0)
+
+        # Every known n-gram contributes log(alpha / denom_c) to each class...
+        vocab = max(len(self.features), 1)
+        base = np.log(self.alpha / (self.class_totals + self.alpha * vocab))
+        prior = np.log((self.class_docs + 1) / (self.class_docs.sum() + n_classes))
+        scores = n_known[:, None] * base[None, :] + prior[None, :]
+
+        # ...plus log((count + alpha) / alpha) for the classes that have seen it
+        starts = self.indptr[rows]
+        lengths = self.indptr[rows + 1] - starts
+        offsets = np.cumsum(lengths) - lengths
+        nnz_pos = np.repeat(starts - offsets, lengths) + np.arange(lengths.sum())
+        nnz_label = np.repeat(q_label, lengths)
+        correction = np.log1p(self.counts[nnz_pos] / self.alpha)
+        flat = nnz_label * n_classes + self.class_idx[nnz_pos]
+        scores += np.bincount(flat, weights=correction, minlength=n_labels * n_classes) \
+            .reshape(n_labels, n_classes)
+        return scores, coverage
+
+    def predict_proba(self, labels) -> np.ndarray:
+        """Posterior probabilities, shape (len(labels), len(classes))."""
+        if not self.classes:
+            return np.zeros((len(labels), 0))
+        scores, _ = self._scores(labels)
+        scores -= scores.max(axis=1, keepdims=True)
+        probs = np.exp(scores)
+        return probs / probs.sum(axis=1, keepdims=True)
+
+    def predict(self, labels, threshold: float = 0.0, min_coverage: float = 0.5) -> list:
+        """[(category, subcategory, confidence) or None] per label.
+
+        None means the model abstains: its best class is below threshold, or
+        less than min_coverage of the label's n-grams were seen in training.
+        """
+        if not labels or not self.classes:
+            return [None] * len(labels)
+        scores, coverage = self._scores(labels)
+        scores -= scores.max(axis=1, keepdims=True)
+        probs = np.exp(scores)
+        probs /= probs.sum(axis=1, keepdims=True)
+        best = probs.argmax(axis=1)
+        results = []
+        for i, c in enumerate(best):
+            confidence = float(probs[i, c])
+            if confidence < threshold or coverage[i] < min_coverage:
+                results.append(None)
+            else:
+                cat, sub = self.classes[c]
+                results.append((cat, sub or None, confidence))
+        return results
+
+    # --- Persistence ---
+
+    def save(self, path: str):
+        np.savez_compressed(
+            path,
+            class_categories=np.array([c for c, _ in self.classes], dtype=str),
+            class_subcategories=np.array([s or "" for _, s in self.classes], dtype=str),
+            ngram_range=np.array(self.ngram_range, dtype=np.int32),
+            alpha=np.array(self.alpha),
+            features=self.features,
+            indptr=self.indptr,
+            class_idx=self.class_idx,
+            counts=self.counts,
+            class_totals=self.class_totals,
+            class_docs=self.class_docs,
+            trained_rows=self.trained_rows,
+        )
+
+    @classmethod
+    def load(cls, path: str) -> "NgramClassifier":
+        with np.load(path, allow_pickle=False) as data:
+            classes = [(c, s or None) for c, s in
+                       zip(data["class_categories"].tolist(), data["class_subcategories"].tolist())]
+            model = cls(classes, tuple(data["ngram_range"].tolist()), float(data["alpha"]))
+            for name in ("features", "indptr", "class_idx", "counts", "class_totals", "class_docs"):
+                setattr(model, name, data[name])
+            # Models saved before rows were tracked have seen nothing on record
+            if "trained_rows" in data:
+                model.trained_rows = data["trained_rows"]
+        return model
+
+
+def row_hashes(transactions) -> np.ndarray:
+    """64-bit hash per row of its extracted fields and category.
+
+    Identical rows are numbered in file order so each gets its own hash; a
+    row whose category changes hashes differently and is trained on again.
+    """
+    occurrences = {}
+    hashes = np.zeros(len(transactions), dtype=np.uint64)
+    for i, tx in enumerate(transactions):
+        fields = [tx.get("year"), tx.get("month"), tx.get("date"), tx["label"], tx["amount"],
+                  tx.get("status"), tx.get("category"), tx.get("subcategory")]
+        text = json.dumps(fields, ensure_ascii=False)
+        occurrences[text] = occurrences.get(text, 0) + 1
+        digest = hashlib.blake2b(f"{text}#{occurrences[text]}".encode("utf-8"), digest_size=8)
+        hashes[i] = int.from_bytes(digest.digest(), "little")
+    return hashes
+
+
+def training_rows(transactions, rules=None) -> tuple:
+    """Labels, (category, subcategory) targets and row indexes of the trusted rows.
+
+    With rules (a CompiledRules without model), a row is trusted when the
+    rules give it another category (the sheet set it), or the same one
+    through one of TRAINING_TIERS. Without rules, every categorised row is.
+    """
+    labels, targets, rows = [], [], []
+    decisions = {}
+    for i, tx in enumerate(transactions):
+        cat = tx.get("category")
+        if not cat or cat == "Non catégorisé":
+            continue
+        if rules is not None:
+            date = transaction_date(tx)
+            key = rules.decision_key(tx["label"], tx["amount"], date)
+            if key not in decisions:
+                decisions[key] = rules.match(tx["label"], tx["amount"], date)
+            rule, rule_cat, _ = decisions[key]
+            if rule_cat == cat and rule.split(":", 1)[0] not in TRAINING_TIERS:
+                continue
+        labels.append(tx["label"])
+        targets.append((cat, tx.get("subcategory")))
+        rows.append(i)
+    return labels, targets, rows
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Train or query the n-gram fallback classifier.")
+    sub = parser.add_subparsers(dest="command", required=True)
+    train = sub.add_parser("train", help="train from categorised rows of transactions-bnp.json")
+    train.add_argument("--update", action="store_true",
+                       help="add to the existing model instead of starting over")
+    train.add_argument("--data-dir", default=DATA_DIR)
+    train.add_argument("--model", help=f"model file (default: DATA_DIR/{MODEL_FILE})")
+    predict = sub.add_parser("predict", help="classify labels")
+    predict.add_argument("labels", nargs="+")
+    predict.add_argument("--model", default=os.path.join(DATA_DIR, MODEL_FILE))
+    predict.add_argument("--threshold", type=float, default=0.0)
+    args = parser.parse_args(argv)
+
+    if args.command == "train":
+        model_path = args.model or os.path.join(args.data_dir, MODEL_FILE)
+        with open(os.path.join(args.data_dir, "transactions-bnp.json"), "r", encoding="utf-8") as f:
+            transactions = json.load(f)
+        # With the fuzzy tier on, whatever it could have filled in is left out
+        labels, targets, rows = training_rows(transactions, compile_rules(fuzzy=True))
+        hashes = row_hashes(transactions)[rows]
+        if args.update and os.path.exists(model_path):
+            model = NgramClassifier.load(model_path)
+            new = model.untrained(hashes)
+            labels = [label for label, keep in zip(labels, new) if keep]
+            targets = [target for target, keep in zip(targets, new) if keep]
+            hashes = hashes[new]
+        else:
+            model = NgramClassifier()
+        if labels:
+            model.partial_fit(labels, targets)
+        model.mark_trained(hashes)
+        model.save(model_path)
+        print(f"Trained on {len(labels)} labels: {len(model.classes)} classes, "
+              f"{len(model.features)} n-grams, {len(model.counts)} non-zero counts "
+              f"({len(model.trained_rows)} rows seen in all)")
+        print(f"  Written {model_path}")
+    else:
+        model = NgramClassifier.load(args.model)
+        for label, result in zip(args.labels, model.predict(args.labels, args.threshold)):
+            if result is None:
+                print(f"  {label!r}: abstain")
+            else:
+                cat, sub, confidence = result
+                print(f"  {label!r}: {cat} / {sub or '-'} ({confidence:.2f})")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,170 @@
+#!/usr/bin/env python3
+"""
+Pair transactions with their counterparts: savings withdrawals with the
+deposits they take back, "Avance ..." lines with their repayment, and
+"Remboursement"/"rbmt" refunds with the expense they refund.
+
+Each kind is a hash join: the rows that can be paid back (deposits,
+advances, expenses) are indexed by absolute amount in cents, each bucket
+sorted by day; every counterpart, in date order, takes the closest earlier
+unpaired row of its bucket within the kind's window. Paired rows are skipped
+with a path-compressed "previous free slot" pointer, so the join stays
+near-linear however many rows share an amount. Rows without a day use the
+first of their month.
+
+Usage: python3 prisma/pair_transactions.py [--data-dir DIR] [--output FILE]
+"""
+
+import argparse
+import json
+import os
+from bisect import bisect_right
+from collections import defaultdict
+from datetime import date
+
+DATA_DIR = os.path.join(os.path.dirname(__file__), "data")
+OUTPUT_FILE = "transaction-pairs.json"
+
+# Days a counterpart may come after the row it pays back
+WINDOWS = {"savings": 366, "advance": 180, "refund": 120}
+
+_REFUND_PREFIXES = ("remboursement", "rembours", "rbmt", "rb ")
+
+
+def is_refund_label(lower: str) -> bool:
+    return lower.startswith(_REFUND_PREFIXES) or " rembours" in lower or " rbmt" in lower
+
+
+def day_of(tx) -> int:
+    if tx.get("date"):
+        return date.fromisoformat(tx["date"]).toordinal()
+    return date(tx["year"], tx["month"], 1).toordinal()
+
+
+def roles(tx, lower):
+    """(kind, side) pairs a row can take: side "out" is paid back by an "in" row."""
+    if tx.get("status") == "CANCELLED" or not tx["amount"]:
+        return ()
+    negative = tx["amount"] < 0
+    if tx.get("category") == "Economies":
+        return (("savings", "out" if negative else "in"),)
+    if lower.startswith("avance"):
+        return (("advance", "out"),) if negative else ()
+    if not negative:
+        found = []
+        if tx.get("category") == "Rentrée" or is_refund_label(lower):
+            found.append(("advance", "in"))
+        if is_refund_label(lower):
+            found.append(("refund", "in"))
+        return tuple(found)
+    if tx.get("category") != "Rentrée":
+        return (("refund", "out"),)
+    return ()
+
+
+class _Bucket:
+    """Rows of one amount sorted by day, with free-slot lookup."""
+
+    __slots__ = ("days", "rows", "free")
+
+    def __init__(self, entries):
+        entries.sort()
+        self.days = [d for d, _ in entries]
+        self.rows = [i for _, i in entries]
+        self.free = list(range(len(entries)))     # free[i] == i while slot i is unpaired
+
+    def _find(self, i):
+        # Closest free slot at or before i (-1 if none), compressing the path
+        root = i
+        while root >= 0 and self.free[root] != root:
+            root = self.free[root]
+        while i >= 0 and self.free[i] != i:
+            self.free[i], i = root, self.free[i]
+        return root
+
+    def take(self, day, window):
+        """Pop the latest unpaired row on or before day, within window days."""
+        slot = self._find(bisect_right(self.days, day) - 1)
+        if slot < 0 or self.days[slot] < day - window:
+            return None
+        self.free[slot] = slot - 1
+        return self.rows[slot]
+
+
+def pair_transactions(transactions) -> dict:
+    """{"pairs": [...], "unpaired": {kind: {"out": n, "in": n}}} in one indexing pass."""
+    outs = defaultdict(lambda: defaultdict(list))    # kind -> cents -> [(day, row)]
+    ins = defaultdict(list)                          # kind -> [(day, row)]
+    days = {}
+    for i, tx in enumerate(transactions):
+        for kind, side in roles(tx, tx["label"].lower()):
+            day = days.setdefault(i, day_of(tx))
+            if side == "out":
+                outs[kind][abs(round(tx["amount"] * 100))].append((day, i))
+            else:
+                ins[kind].append((day, i))
+
+    pairs = []
+    paired = set()
+    unpaired = {}
+    # Advances first: a repayment also looks like a refund of any expense,
+    # and a row paired once is not paired again
+    for kind in ("savings", "advance", "refund"):
+        buckets = {cents: _Bucket(entries) for cents, entries in outs[kind].items()}
+        kind_pairs = candidates = 0
+        for day, j in sorted(ins[kind]):
+            if j in paired:
+                continue
+            candidates += 1
+            tx_in = transactions[j]
+            bucket = buckets.get(abs(round(tx_in["amount"] * 100)))
+            i = bucket.take(day, WINDOWS[kind]) if bucket is not None else None
+            if i is None:
+                continue
+            paired.update((i, j))
+            kind_pairs += 1
+            pairs.append({
+                "kind": kind,
+                "amount": abs(tx_in["amount"]),
+                "days": day - days[i],
+                "out": _summary(i, transactions[i]),
+                "in": _summary(j, tx_in),
+            })
+        outs_total = sum(len(entries) for entries in outs[kind].values())
+        unpaired[kind] = {"out": outs_total - kind_pairs, "in": candidates - kind_pairs}
+    return {"pairs": pairs, "unpaired": unpaired}
+
+
+def _summary(index, tx) -> dict:
+    return {
+        "index": index, "year": tx["year"], "month": tx["month"], "date": tx.get("date"),
+        "label": tx["label"], "amount": tx["amount"],
+        "category": tx.get("category"), "subcategory": tx.get("subcategory"),
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Pair savings transfers, advances and refunds.")
+    parser.add_argument("--data-dir", default=DATA_DIR)
+    parser.add_argument("--output", help=f"pairs file (default: DATA_DIR/{OUTPUT_FILE})")
+    args = parser.parse_args(argv)
+
+    with open(os.path.join(args.data_dir, "transactions-bnp.json"), "r", encoding="utf-8") as f:
+        transactions = json.load(f)
+
+    result = pair_transactions(transactions)
+    counts = defaultdict(int)
+    for pair in result["pairs"]:
+        counts[pair["kind"]] += 1
+    for kind in WINDOWS:
+        left = result["unpaired"][kind]
+        print(f"  {kind:8s} {counts[kind]:5d} pairs, {left['out']} unpaired out, {left['in']} unpaired in")
+
+    output = args.output or os.path.join(args.data_dir, OUTPUT_FILE)
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump(result, f, ensure_ascii=False, indent=2)
+    print(f"\n  Written {output}")
+
+
+if __name__ == "__main__":
+    main()
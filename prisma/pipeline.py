@@ -0,0 +1,124 @@
+#!/usr/bin/env python3
+"""
+Extract comptes.xlsx and categorise the transactions in one process.
+
+Runs extract-excel.py and categorize.py back to back without the JSON round
+trip between them: the records extract_transactions_sheet() builds are
+categorised in memory and prisma/data/*.json is written once, at the end.
+The output is the same as running the two scripts in turn; both still work
+on their own.
+
+Usage: python3 prisma/pipeline.py [--excel FILE] [--dedup] [--fuzzy]
+                                  [--model FILE [--model-threshold P]] [--overlay FILE]
+                                  [--sqlite [FILE]] [--balances] [--data-dir DIR]
+                                  [--metrics [FILE] [--trace-memory] [--profile-stage STAGE]]
+"""
+
+import argparse
+import importlib.util
+import os
+
+import pipeline_metrics
+from balance_series import SERIES_FILE, BalanceSeries
+from categorize import (CategorizeStats, add_new_subcategories, add_rule_arguments, compile_rules,
+                        needs_category, print_distribution, process_transaction, rule_options,
+                        rule_set_version, transaction_date)
+from dedup import DuplicateIndex
+from sqlite_store import STORE_FILE, SqliteStore
+
+
+def load_extract_module():
+    """extract-excel.py, which its hyphen keeps out of reach of import."""
+    path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "extract-excel.py")
+    spec = importlib.util.spec_from_file_location("extract_excel", path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def categorize_in_memory(transactions, categories, rules, store=None) -> CategorizeStats:
+    """Categorise freshly extracted records in place, as categorize.py would."""
+    stats = CategorizeStats.for_categories(categories)
+    rules.prime_model([tx["label"] for tx in transactions if needs_category(tx)])
+    for tx in transactions:
+        hit = None
+        if needs_category(tx):
+            hit = rules.match(tx["label"], tx["amount"], transaction_date(tx))
+        process_transaction(tx, None, stats, None if hit is None else hit[1:])
+        if store is not None:
+            if hit is not None:
+                store.add(tx, hit[0], "rule")
+            else:
+                # Straight from the workbook: the category is the sheet's own
+                store.add(tx, source="sheet")
+    add_new_subcategories(categories, stats)
+    return stats
+
+
+def main(argv=None):
+    extract = load_extract_module()
+    parser = argparse.ArgumentParser(description="Extract and categorise transactions in one pass.")
+    parser.add_argument("--excel", default=extract.EXCEL_PATH,
+                        help=f"workbook to extract (default: {extract.EXCEL_PATH})")
+    parser.add_argument("--dedup", action="store_true",
+                        help=f"report rows repeated across sheets or month blocks "
+                             f"(written to {extract.DUPLICATES_FILE})")
+    add_rule_arguments(parser)
+    parser.add_argument("--sqlite", nargs="?", const="", metavar="FILE",
+                        help="also write an indexed SQLite database with rule provenance "
+                             f"(default: DATA_DIR/{STORE_FILE})")
+    parser.add_argument("--balances", action="store_true",
+                        help=f"also write the monthly surplus, carry-over and savings series "
+                             f"(DATA_DIR/{SERIES_FILE})")
+    parser.add_argument("--data-dir", default=extract.OUTPUT_DIR,
+                        help="directory to write transactions-bnp.json and categories.json to")
+    pipeline_metrics.add_arguments(parser, "pipeline")
+    args = parser.parse_args(argv)
+    metrics = pipeline_metrics.Metrics.from_args(args)
+
+    os.makedirs(args.data_dir, exist_ok=True)
+    print(f"Loading {args.excel}...")
+    with metrics.stage("load_workbook"):
+        wb = extract.openpyxl.load_workbook(args.excel, data_only=True)
+    sheet_stats = []
+    duplicates = DuplicateIndex() if args.dedup else None
+    with metrics.stage("extract") as stage:
+        transactions, categories = extract.extract_workbook(wb, sheet_stats, duplicates)
+        stage["rows"] = len(transactions)
+    metrics.add("sheets", sheet_stats)
+
+    if duplicates is not None:
+        extract.write_duplicates(duplicates, args.data_dir)
+
+    print("\n--- Categorizing ---")
+    with metrics.stage("compile_rules"):
+        rules = compile_rules(**rule_options(args))
+    store = None
+    if args.sqlite is not None:
+        store = SqliteStore(args.sqlite or os.path.join(args.data_dir, STORE_FILE))
+    with metrics.stage("categorize", rows=len(transactions)):
+        stats = categorize_in_memory(transactions, categories, rules, store)
+    print(f"  Categorized {stats.categorized} transactions")
+    if stats.eco_fixed:
+        print(f"  Fixed {stats.eco_fixed} Economies transactions missing subcategory")
+
+    print("\n--- Writing JSON files ---")
+    with metrics.stage("write_json", rows=len(transactions)):
+        extract.write_json("categories.json", categories, args.data_dir)
+        extract.write_json("transactions-bnp.json", transactions, args.data_dir)
+    if store is not None:
+        with metrics.stage("sqlite", rows=store.count):
+            store.close(categories, rule_set_version(rules))
+        print(f"  Written {store.path} ({store.count} transactions)")
+    if args.balances:
+        with metrics.stage("balances", rows=len(transactions)):
+            series = BalanceSeries.build(transactions)
+            series.save(os.path.join(args.data_dir, SERIES_FILE))
+        print(f"  Written {os.path.join(args.data_dir, SERIES_FILE)} ({series.months} months)")
+
+    print_distribution(stats)
+    metrics.write(args.data_dir, "pipeline")
+
+
+if __name__ == "__main__":
+    main()
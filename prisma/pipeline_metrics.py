@@ -0,0 +1,156 @@
+#!/usr/bin/env python3
+"""
+Per-stage timing, throughput and memory metrics for the data scripts.
+
+extract-excel.py, categorize.py and pipeline.py take --metrics [FILE]
+(default: DATA_DIR/metrics-<script>.json): each
+stage (workbook loading, sheet extraction, rule compilation,
+categorisation, JSON writing, ...) records its wall time, rows and rows/s
+and the process's peak RSS when it ends. --trace-memory adds the peak
+Python heap of each stage from tracemalloc, at the cost of slower stages.
+--profile-stage NAME runs that stage under cProfile, dumps the stats next to
+the report (same name, .prof) and lists its top functions in it.
+
+The report is JSON: the stages in order, plus what the script adds, such as
+the per-sheet breakdown of the extraction and, with categorize.py --profile,
+the per-tier rule timings (the tier wrappers slow categorisation down, so
+--metrics alone leaves them off).
+
+    python3 -m pstats prisma/data/metrics-categorize.prof
+"""
+
+import cProfile
+import json
+import os
+import pstats
+import sys
+import time
+import tracemalloc
+from contextlib import contextmanager
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+METRICS_FILE = "metrics-{script}.json"
+PROFILE_TOP = 20
+
+
+def peak_rss_mb():
+    """Peak resident set size of the process so far, or None where unknown."""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Bytes on macOS, kilobytes elsewhere
+    return round(peak / (1 << 20 if sys.platform == "darwin" else 1 << 10), 1)
+
+
+def add_arguments(parser, script: str):
+    """The --metrics options, shared by the scripts."""
+    parser.add_argument("--metrics", nargs="?", const="", metavar="FILE",
+                        help=f"write per-stage timings and memory to a JSON report "
+                             f"(default: DATA_DIR/{METRICS_FILE.format(script=script)})")
+    parser.add_argument("--trace-memory", action="store_true",
+                        help="with --metrics, also record each stage's peak Python heap (slower)")
+    parser.add_argument("--profile-stage", metavar="STAGE",
+                        help="with --metrics, run STAGE under cProfile")
+
+
+class Metrics:
+    """Collects stages; a disabled instance records nothing and costs nothing."""
+
+    def __init__(self, path: str = None, trace_memory: bool = False, profile_stage: str = None):
+        """path: the report file, "" for the default one, None to disable."""
+        self.path = path
+        enabled = self.enabled = path is not None
+        self.trace_memory = enabled and trace_memory
+        self.profile_stage = profile_stage if enabled else None
+        self.stages = []
+        self.sections = {}
+        self.profile = None
+        self.started = time.perf_counter()
+        if self.trace_memory:
+            tracemalloc.start()
+
+    @classmethod
+    def from_args(cls, args) -> "Metrics":
+        return cls(args.metrics, args.trace_memory, args.profile_stage)
+
+    @contextmanager
+    def stage(self, name: str, rows: int = None):
+        """Time the block; set entry["rows"] inside it when the count comes later."""
+        entry = {"stage": name}
+        if rows is not None:
+            entry["rows"] = rows
+        if not self.enabled:
+            yield entry
+            return
+        if self.trace_memory:
+            tracemalloc.reset_peak()
+        profiler = cProfile.Profile() if name == self.profile_stage else None
+        start = time.perf_counter()
+        if profiler is not None:
+            profiler.enable()
+        try:
+            yield entry
+        finally:
+            if profiler is not None:
+                profiler.disable()
+            seconds = time.perf_counter() - start
+            entry["seconds"] = round(seconds, 6)
+            if entry.get("rows") is not None:
+                entry["rows_per_second"] = round(entry["rows"] / seconds) if seconds else None
+            entry["peak_rss_mb"] = peak_rss_mb()
+            if self.trace_memory:
+                entry["peak_traced_mb"] = round(tracemalloc.get_traced_memory()[1] / (1 << 20), 1)
+            self.stages.append(entry)
+            if profiler is not None:
+                self.profile = (name, profiler)
+
+    def add(self, section: str, data):
+        """Attach a script-specific section (per-sheet breakdown, tier timings, ...)."""
+        if self.enabled:
+            self.sections[section] = data
+
+    def report(self, script: str, profile_path: str = None) -> dict:
+        report = {
+            "script": script,
+            "argv": sys.argv[1:],
+            "total_seconds": round(time.perf_counter() - self.started, 6),
+            "peak_rss_mb": peak_rss_mb(),
+            "stages": self.stages,
+        }
+        report.update(self.sections)
+        if self.profile_stage is not None:
+            report["profile"] = self._profile_report(profile_path)
+        return report
+
+    def _profile_report(self, path) -> dict:
+        if self.profile is None:
+            return {"stage": self.profile_stage, "error": "no such stage ran",
+                    "stages": [s["stage"] for s in self.stages]}
+        name, profiler = self.profile
+        stats = pstats.Stats(profiler)
+        if path is not None:
+            stats.dump_stats(path)
+        top = []
+        for (filename, line, function), (_, calls, own, cumulative, _) in sorted(
+                stats.stats.items(), key=lambda item: -item[1][3])[:PROFILE_TOP]:
+            top.append({"function": f"{filename}:{line}({function})", "calls": calls,
+                        "own_seconds": round(own, 6), "cumulative_seconds": round(cumulative, 6)})
+        return {"stage": name, "file": path, "top": top}
+
+    def write(self, data_dir: str, script: str):
+        """Write the report (by default into data_dir) and the cProfile dump beside it."""
+        if not self.enabled:
+            return
+        path = self.path or os.path.join(data_dir, METRICS_FILE.format(script=script))
+        profile_path = None
+        if self.profile is not None:
+            profile_path = os.path.splitext(path)[0] + ".prof"
+        report = self.report(script, profile_path)
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        print(f"\n  Metrics written to {path}"
+              + (f" (cProfile of {self.profile[0]}: {profile_path})" if profile_path else ""))
@@ -0,0 +1,208 @@
+#!/usr/bin/env python3
+"""
+Re-categorise the transactions of an app data export (Settings > Export).
+
+Streams the export (comptes-export-YYYY-MM-DD.json), categorises the
+transactions that are "Non catégorisé" or whose rule match changed since
+the last run, and writes a patch of only the (transaction id, category id,
+subcategory id) triples that differ from the export. The patch applies as a
+single bulk update (see --sql) instead of a full re-import.
+
+Decisions are journaled by transaction id (see categorize.CategorizeJournal),
+which is how a later run knows that a row's category came from a rule, and
+which rule: such rows are re-matched after a rule change, while rows whose
+category was since changed in the app are left alone.
+
+Usage: python3 prisma/recategorize_export.py EXPORT.json [--output PATCH.json]
+           [--sql FILE] [--journal FILE] [--fuzzy]
+           [--model FILE [--model-threshold P]] [--overlay FILE]
+"""
+
+import argparse
+import json
+import os
+
+from categorize import (
+    CategorizeJournal, CategorizeStats, JsonStreamReader, add_rule_arguments,
+    compile_rules, needs_category, process_transaction, rule_options, rule_set_version,
+)
+
+# Tiers of the rule ids (see CompiledRules.match) that only guess a category
+FALLBACK_TIERS = ("amount", "default")
+
+
+class ExportJournal(CategorizeJournal):
+    """Journal keyed by the app's transaction ids.
+
+    Also remembers every result ever decided per id: a row still showing one
+    of them (a patch not applied yet, say) is ours to update, anything else
+    was set in the app.
+    """
+
+    def __init__(self, path: str, version: str = None):
+        self.decided = {}
+        super().__init__(path, version)
+
+    def key(self, tx) -> str:
+        return tx["id"]
+
+    def _record(self, key, rule, cat, subcat):
+        super()._record(key, rule, cat, subcat)
+        self.decided.setdefault(key, set()).add((cat, subcat))
+
+    def set_in_app(self, record) -> bool:
+        """Whether the record's category was chosen in the app, not by a rule."""
+        decided = self.decided.get(record["id"])
+        if decided is None or needs_category(record):
+            return False
+        current = (record.get("category"), record.get("subcategory"))
+        return not any(current == _as_applied(cat, subcat, record["amount"])
+                       for cat, subcat in decided)
+
+
+def _record(tx, category_names, subcategory_names) -> dict:
+    """The export row in the shape categorize.py works on."""
+    record = {
+        "id": tx["id"],
+        "label": tx["label"],
+        "amount": float(tx["amount"]),
+        "date": tx["date"][:10] if tx.get("date") else None,
+        "year": tx["year"],
+        "month": tx["month"],
+    }
+    if tx.get("categoryId") in category_names:
+        record["category"] = category_names[tx["categoryId"]]
+        if tx.get("subCategoryId") in subcategory_names:
+            record["subcategory"] = subcategory_names[tx["subCategoryId"]]
+    return record
+
+
+def _as_applied(cat, subcat, amount) -> tuple:
+    # process_transaction gives Economies rows without a subcategory one by sign
+    if cat == "Economies" and not subcat and amount:
+        subcat = "Ajout" if amount < 0 else "Retrait"
+    return cat, subcat
+
+
+def recategorize_export(f, rules, journal) -> dict:
+    """Stream the export read from f and return the patch and its counters."""
+    category_names = category_ids = subcategory_names = subcategory_ids = None
+    stats = CategorizeStats(set(), {})
+    updates = []
+    scanned = skipped_manual = 0
+    missing = set()
+
+    reader = JsonStreamReader(f)
+    for key in reader.iter_object():
+        if key != "data":
+            reader.value()
+            continue
+        for section in reader.iter_object():
+            if section == "categories":
+                categories = reader.value()
+                category_names = {c["id"]: c["name"] for c in categories}
+                category_ids = {c["name"]: c["id"] for c in categories}
+                stats.valid_cats = set(category_ids)
+            elif section == "subCategories":
+                subcategories = reader.value()
+                subcategory_names = {s["id"]: s["name"] for s in subcategories}
+                subcategory_ids = {(s["categoryId"], s["name"]): s["id"] for s in subcategories}
+            elif section == "transactions":
+                if category_names is None or subcategory_names is None:
+                    raise ValueError("export lists transactions before its categories")
+                for tx in reader.iter_array():
+                    record = _record(tx, category_names, subcategory_names)
+                    scanned += 1
+                    if journal.set_in_app(record):
+                        # Recategorised in the app since: the user's choice wins
+                        skipped_manual += 1
+                        continue
+                    before = (record.get("category"), record.get("subcategory"))
+                    hit = journal.resolve(record, rules)
+                    decision = None if hit is None else hit[1:]
+                    process_transaction(record, None, stats, decision)
+                    after = (record.get("category"), record.get("subcategory"))
+                    if decision is None or after == before:
+                        continue
+                    cat_id = category_ids.get(after[0])
+                    sub_id = subcategory_ids.get((cat_id, after[1])) if after[1] else None
+                    if cat_id is None or (after[1] and sub_id is None):
+                        # The app has no such category: it must be created first.
+                        # Fallback results are no reason to create one
+                        if hit[0].split(":", 1)[0] not in FALLBACK_TIERS \
+                                and after[0] != "Non catégorisé":
+                            missing.add(after)
+                        continue
+                    updates.append([record["id"], cat_id, sub_id])
+            else:
+                reader.value()
+
+    return {
+        "updates": updates,
+        "stats": stats,
+        "scanned": scanned,
+        "skipped_manual": skipped_manual,
+        "missing": sorted(missing, key=lambda pair: (pair[0], pair[1] or "")),
+    }
+
+
+def _sql_literal(value) -> str:
+    return "NULL" if value is None else "'" + value.replace("'", "''") + "'"
+
+
+def write_sql(path: str, updates):
+    """One UPDATE ... FROM (VALUES ...) statement applying every triple."""
+    with open(path, "w", encoding="utf-8") as f:
+        if not updates:
+            f.write("-- nothing to update\n")
+            return
+        f.write('UPDATE "transactions" AS t\n'
+                'SET "categoryId" = p."categoryId", "subCategoryId" = p."subCategoryId", '
+                '"updatedAt" = now()\nFROM (VALUES\n')
+        f.write(",\n".join(f"  ({', '.join(_sql_literal(v) for v in triple)})"
+                           for triple in updates))
+        f.write('\n) AS p("id", "categoryId", "subCategoryId")\nWHERE t."id" = p."id";\n')
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Re-categorise an app data export into a patch.")
+    parser.add_argument("export", help="JSON file from Settings > Export")
+    parser.add_argument("--output", help="patch file (default: EXPORT.patch.json)")
+    parser.add_argument("--sql", help="also write the patch as a single SQL UPDATE")
+    parser.add_argument("--journal",
+                        help="decision journal (default: EXPORT's directory/recategorize-journal.jsonl)")
+    add_rule_arguments(parser)
+    args = parser.parse_args(argv)
+
+    output = args.output or os.path.splitext(args.export)[0] + ".patch.json"
+    journal_path = args.journal or os.path.join(
+        os.path.dirname(os.path.abspath(args.export)), "recategorize-journal.jsonl")
+
+    rules = compile_rules(**rule_options(args))
+    version = rule_set_version(rules)
+    journal = ExportJournal(journal_path, version)
+    with open(args.export, "r", encoding="utf-8") as f:
+        result = recategorize_export(f, rules, journal)
+    journal.close()
+
+    updates = result["updates"]
+    with open(output, "w", encoding="utf-8") as f:
+        # One triple per line: compact, yet diffable
+        f.write(f'{{"formatVersion": 1, "rules": "{version}", "updates": [')
+        f.write(",".join("\n  " + json.dumps(triple, ensure_ascii=False) for triple in updates))
+        f.write("\n]}\n" if updates else "]}\n")
+    print(f"  Written {output} ({len(updates)} updates)")
+    if args.sql:
+        write_sql(args.sql, updates)
+        print(f"  Written {args.sql}")
+
+    print(f"Scanned {result['scanned']} transactions: {journal.new} newly categorised, "
+          f"{journal.changed} rule matches changed, {journal.unchanged + journal.replayed} unchanged, "
+          f"{result['skipped_manual']} recategorised in the app since (left alone)")
+    for cat, subcat in result["missing"]:
+        label = f"{cat} / {subcat}" if subcat else cat
+        print(f"  missing in the app, not patched: {label}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,195 @@
+#!/usr/bin/env python3
+"""
+Detect recurring transactions ("Loyer", "Spotify", "Forfait Orange", ...)
+from the extracted history.
+
+Labels are normalised (folded, without numbers or month names, so "Loyer
+mars" and "LOYER 03/2021" meet) and grouped in a hash index. Rows are
+bucketed by month first, so every group comes out in month order without a
+sort and the whole detection stays linear in the number of transactions.
+One pass over each group then measures:
+
+- periodicity: the most common gap between the months the label occurs in
+  (1 = monthly, 3 = quarterly, 12 = yearly) and the share of gaps equal to it;
+- amount stability: Welford mean and variance of the amounts, and the most
+  frequent amount (the typical one when it covers most rows);
+- coverage: occurrences against the months the period predicts over the
+  label's lifetime.
+
+Their product is the confidence. Candidates feed the app's "recurring" flag
+(recurring-toggle-card.tsx, copy-recurring-button.tsx).
+
+Usage: python3 prisma/recurring.py [--data-dir DIR] [--min-occurrences 3]
+           [--min-confidence 0.5] [--output FILE]
+"""
+
+import argparse
+import json
+import math
+import os
+import re
+from collections import Counter
+
+from fuzzy_index import fold
+from months import month_name
+
+DATA_DIR = os.path.join(os.path.dirname(__file__), "data")
+OUTPUT_FILE = "recurring-candidates.json"
+
+# Gaps (in months) accepted as a period
+PERIODS = (1, 2, 3, 4, 6, 12)
+
+_MONTH_WORDS = {
+    "janvier", "fevrier", "mars", "avril", "mai", "juin", "juillet", "aout",
+    "septembre", "octobre", "novembre", "decembre",
+    "janv", "fevr", "fev", "avr", "juil", "sept", "oct", "nov", "dec",
+}
+_TOKEN = re.compile(r"[^\W\d_]+")
+
+
+def normalise_label(label: str) -> str:
+    """Grouping key: folded words, without numbers, dates or month names."""
+    return " ".join(w for w in _TOKEN.findall(fold(label)) if w not in _MONTH_WORDS)
+
+
+class _Series:
+    """Running statistics of one label group, fed in month order."""
+
+    __slots__ = ("labels", "categories", "months", "gaps", "count",
+                 "mean", "m2", "amounts", "latest", "first", "last")
+
+    def __init__(self):
+        self.labels = Counter()
+        self.categories = Counter()
+        self.months = 0          # distinct months seen
+        self.gaps = Counter()
+        self.count = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+        self.amounts = Counter()
+        self.latest = 0          # amount of the latest row, in cents
+        self.first = None
+        self.last = None
+
+    def add(self, ordinal, tx):
+        cents = round(tx["amount"] * 100)
+        self.count += 1
+        delta = cents - self.mean
+        self.mean += delta / self.count
+        self.m2 += delta * (cents - self.mean)
+        self.amounts[cents] += 1
+        self.latest = cents
+        self.labels[tx["label"]] += 1
+        self.categories[(tx.get("category"), tx.get("subcategory"))] += 1
+        if self.last != ordinal:
+            if self.last is not None:
+                self.gaps[ordinal - self.last] += 1
+            else:
+                self.first = ordinal
+            self.last = ordinal
+            self.months += 1
+
+
+def score(series: _Series, last_month: int):
+    """Candidate dict for one series, or None when it has no period."""
+    if not series.gaps:
+        return None
+    period, on_period = series.gaps.most_common(1)[0]
+    if period not in PERIODS:
+        return None
+    periodicity = on_period / sum(series.gaps.values())
+
+    std = math.sqrt(series.m2 / series.count) if series.count > 1 else 0.0
+    stability = max(0.0, 1 - std / abs(series.mean)) if series.mean else 0.0
+    cents, same = series.amounts.most_common(1)[0]
+    typical = cents if same * 2 > series.count else round(series.mean)
+
+    expected = (series.last - series.first) // period + 1
+    coverage = min(1.0, series.months / expected)
+    # Several rows a month is a habit (coffee, groceries), not a subscription
+    per_month = series.count / series.months
+
+    confidence = periodicity * stability * coverage / per_month
+    (category, subcategory), _ = series.categories.most_common(1)[0]
+    return {
+        "label": series.labels.most_common(1)[0][0],
+        "period": period,
+        "amount": typical / 100,
+        "latestAmount": series.latest / 100,
+        "confidence": round(confidence, 3),
+        "occurrences": series.count,
+        "first": month_name(series.first),
+        "last": month_name(series.last),
+        # Not seen for more than one period before the end of the history
+        "active": last_month - series.last <= period,
+        "category": category,
+        "subcategory": subcategory,
+    }
+
+
+def detect_recurring(transactions, min_occurrences: int = 3, min_confidence: float = 0.5) -> list:
+    """Recurring candidates, most confident first."""
+    ordinals = [tx["year"] * 12 + tx["month"] - 1 for tx in transactions
+                if tx.get("status") != "CANCELLED"]
+    if not ordinals:
+        return []
+    first_month = min(ordinals)
+    last_month = max(ordinals)
+
+    # Bucket by month, then group: each group is filled in month order
+    by_month = [[] for _ in range(last_month - first_month + 1)]
+    for tx in transactions:
+        if tx.get("status") != "CANCELLED":
+            by_month[tx["year"] * 12 + tx["month"] - 1 - first_month].append(tx)
+    groups = {}
+    for offset, rows in enumerate(by_month):
+        for tx in rows:
+            key = normalise_label(tx["label"])
+            if not key:
+                continue
+            series = groups.get(key)
+            if series is None:
+                series = groups[key] = _Series()
+            series.add(first_month + offset, tx)
+
+    candidates = []
+    for key, series in groups.items():
+        if series.months < min_occurrences:
+            continue
+        candidate = score(series, last_month)
+        if candidate is not None and candidate["confidence"] >= min_confidence:
+            candidate["key"] = key
+            candidates.append(candidate)
+    candidates.sort(key=lambda c: (-c["confidence"], -c["occurrences"]))
+    return candidates
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Detect recurring transactions from history.")
+    parser.add_argument("--data-dir", default=DATA_DIR)
+    parser.add_argument("--min-occurrences", type=int, default=3,
+                        help="minimum distinct months a label must appear in (default: 3)")
+    parser.add_argument("--min-confidence", type=float, default=0.5,
+                        help="minimum confidence to report (default: 0.5)")
+    parser.add_argument("--output", help=f"candidates file (default: DATA_DIR/{OUTPUT_FILE})")
+    args = parser.parse_args(argv)
+
+    with open(os.path.join(args.data_dir, "transactions-bnp.json"), "r", encoding="utf-8") as f:
+        transactions = json.load(f)
+
+    candidates = detect_recurring(transactions, args.min_occurrences, args.min_confidence)
+
+    print(f"Recurring candidates ({len(candidates)}):")
+    for c in candidates:
+        every = "monthly" if c["period"] == 1 else f"every {c['period']} months"
+        state = "" if c["active"] else f"  (ended {c['last']})"
+        print(f"  {c['confidence']:.2f}  {c['amount']:10.2f}  {every:16s} {c['label']}{state}")
+
+    output = args.output or os.path.join(args.data_dir, OUTPUT_FILE)
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump(candidates, f, ensure_ascii=False, indent=2)
+    print(f"\n  Written {output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,151 @@
+#!/usr/bin/env python3
+"""
+Static analysis of the categorize.py rule tables.
+
+PREFIX_RULES and CONTAINS_RULES are first-match lists: an entry can never
+fire when an earlier entry of the same tier matches every label it matches
+(an earlier prefix that is a prefix of it, an earlier pattern that is a
+substring of it, or the same pattern listed twice). Labels are lowercased
+before these tiers, so a pattern holding an uppercase letter never fires
+either. live_rules() drops all of these without changing any decision;
+CompiledRules only ever scans what it keeps.
+
+EXACT_RULES is a dict literal, so a key written twice silently keeps its
+last value. That cannot be seen at runtime: exact_key_duplicates() parses
+the source to find them.
+
+Usage: python3 prisma/rule_compiler.py [--output FILE] [--emit FILE]
+"""
+
+import argparse
+import ast
+import json
+import os
+
+
+def _earlier_prefix(pattern, seen):
+    for end in range(len(pattern) + 1):
+        if pattern[:end] in seen:
+            return pattern[:end]
+
+
+def _earlier_substring(pattern, seen):
+    for start in range(len(pattern) + 1):
+        for end in range(start, len(pattern) + 1):
+            if pattern[start:end] in seen:
+                return pattern[start:end]
+
+
+def live_rules(rules, tier: str) -> tuple:
+    """Split an ordered prefix or contains table into (live, dead).
+
+    dead holds (rule, reason, shadowing pattern or None) in table order.
+    Only earlier live patterns need checking: whatever shadows a dead rule
+    is itself shadowed by, or equal to, a live one.
+    """
+    covers = _earlier_prefix if tier == "prefix" else _earlier_substring
+    live, dead = [], []
+    seen = {}   # live pattern -> its (category, subcategory)
+    for rule in rules:
+        pattern = rule[0]
+        if pattern != pattern.lower():
+            dead.append((rule, "uppercase", None))
+            continue
+        by = covers(pattern, seen)
+        if by is None:
+            seen[pattern] = tuple(rule[1:])
+            live.append(rule)
+        elif by == pattern:
+            reason = "duplicate" if seen[by] == tuple(rule[1:]) else "duplicate-conflict"
+            dead.append((rule, reason, by))
+        else:
+            dead.append((rule, "shadowed", by))
+    return live, dead
+
+
+def exact_key_duplicates(source_path: str = None, name: str = "EXACT_RULES") -> list:
+    """Keys written more than once in the name = {...} literal of source_path.
+
+    Returns [{"key", "lines", "values", "conflict"}]; the last value is the
+    one in effect.
+    """
+    if source_path is None:
+        source_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "categorize.py")
+    with open(source_path, "r", encoding="utf-8") as f:
+        tree = ast.parse(f.read(), source_path)
+
+    entries = {}
+    for node in tree.body:
+        if (isinstance(node, ast.Assign) and isinstance(node.value, ast.Dict)
+                and any(isinstance(t, ast.Name) and t.id == name for t in node.targets)):
+            for key, value in zip(node.value.keys, node.value.values):
+                if isinstance(key, ast.Constant):
+                    entries.setdefault(key.value, []).append(
+                        (key.lineno, ast.literal_eval(value)))
+
+    return [
+        {
+            "key": key,
+            "lines": [line for line, _ in seen],
+            "values": [list(value) for _, value in seen],
+            "conflict": len({value for _, value in seen}) > 1,
+        }
+        for key, seen in entries.items() if len(seen) > 1
+    ]
+
+
+def analyse(exact_source: str = None, prefix=None, contains=None) -> dict:
+    """Minimal prefix/contains tables and the report of what was removed."""
+    import categorize
+    prefix = categorize.PREFIX_RULES if prefix is None else prefix
+    contains = categorize.CONTAINS_RULES if contains is None else contains
+
+    report = {"exact_duplicates": exact_key_duplicates(exact_source)}
+    minimal = {}
+    for tier, rules in (("prefix", prefix), ("contains", contains)):
+        live, dead = live_rules(rules, tier)
+        minimal[tier] = [list(r) for r in live]
+        report[tier] = {
+            "rules": len(rules),
+            "live": len(live),
+            "removed": [{"rule": list(rule), "reason": reason, "by": by}
+                        for rule, reason, by in dead],
+        }
+    return {"minimal": minimal, "report": report}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Find dead and duplicate categorisation rules.")
+    parser.add_argument("--output", help="also write the report as JSON")
+    parser.add_argument("--emit", help="write the minimal prefix/contains tables as JSON")
+    args = parser.parse_args(argv)
+
+    result = analyse()
+    report = result["report"]
+
+    conflicts = [d for d in report["exact_duplicates"] if d["conflict"]]
+    print(f"EXACT_RULES: {len(report['exact_duplicates'])} repeated keys, {len(conflicts)} conflicting")
+    for d in report["exact_duplicates"]:
+        flag = "CONFLICT" if d["conflict"] else "duplicate"
+        lines = ", ".join(str(line) for line in d["lines"])
+        print(f"  {flag:9s}  {d['key']!r} (lines {lines}) -> keeps {tuple(d['values'][-1])}")
+
+    for tier, title in (("prefix", "PREFIX_RULES"), ("contains", "CONTAINS_RULES")):
+        tier_report = report[tier]
+        print(f"\n{title}: {tier_report['live']} live of {tier_report['rules']}")
+        for removed in tier_report["removed"]:
+            by = f" by {removed['by']!r}" if removed["by"] is not None else ""
+            print(f"  {removed['reason']:18s}  {removed['rule'][0]!r}{by}")
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        print(f"\nWritten {args.output}")
+    if args.emit:
+        with open(args.emit, "w", encoding="utf-8") as f:
+            json.dump(result["minimal"], f, ensure_ascii=False, indent=2)
+        print(f"Written {args.emit}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,152 @@
+#!/usr/bin/env python3
+"""
+Indexed SQLite copy of the extracted data for ad-hoc queries.
+
+Tables:
+- transactions: one row per transactions-bnp.json record (id = its position
+  in the file), amounts also in integer cents, with the category's
+  provenance: the rule id that matched (as in categorize.py's match()) and
+  where the category came from ("rule", "journal", "sheet" or "unknown");
+- categories, subcategories: categories.json;
+- metadata: rule-set version and build time.
+
+Rows are loaded with executemany in batches inside a single transaction and
+the indexes are built once at the end: (year, month), (category,
+subcategory) and label, each extended with the columns monthly and category
+totals read, so those queries are answered from the index alone. The
+database is written next to its final path and renamed into place.
+
+categorize.py overwrites transactions-bnp.json, so a category already in the
+file may come from the sheet or from an earlier run: "sheet" is only
+recorded where the extract output is at hand (pipeline.py --sqlite), "journal"
+or "rule" where categorize.py --sqlite knows the decision, "unknown"
+otherwise. Run on its own, this script loads the JSON as it is, all rows
+"unknown".
+
+Usage: python3 prisma/sqlite_store.py [--data-dir DIR] [--output FILE]
+
+    sqlite3 prisma/data/transactions.sqlite \\
+        "SELECT year, month, sum(amount_cents) / 100.0 FROM transactions
+         WHERE category = 'Alimentation' GROUP BY year, month"
+"""
+
+import argparse
+import json
+import os
+import sqlite3
+import time
+
+DATA_DIR = os.path.join(os.path.dirname(__file__), "data")
+STORE_FILE = "transactions.sqlite"
+BATCH = 5000
+
+SCHEMA = """
+CREATE TABLE metadata (key TEXT PRIMARY KEY, value TEXT);
+CREATE TABLE categories (name TEXT PRIMARY KEY, color TEXT);
+CREATE TABLE subcategories (
+    category TEXT NOT NULL REFERENCES categories (name),
+    name TEXT NOT NULL,
+    PRIMARY KEY (category, name)
+);
+CREATE TABLE transactions (
+    id INTEGER PRIMARY KEY,
+    year INTEGER NOT NULL,
+    month INTEGER NOT NULL,
+    date TEXT,
+    label TEXT NOT NULL,
+    amount REAL NOT NULL,
+    amount_cents INTEGER NOT NULL,
+    status TEXT,
+    category TEXT,
+    subcategory TEXT,
+    rule TEXT,
+    source TEXT
+);
+"""
+
+INDEXES = (
+    "CREATE INDEX transactions_year_month"
+    " ON transactions (year, month, category, subcategory, amount_cents, status)",
+    "CREATE INDEX transactions_category"
+    " ON transactions (category, subcategory, year, month, amount_cents, status)",
+    "CREATE INDEX transactions_label"
+    " ON transactions (label, year, month, amount_cents, category, subcategory)",
+    "CREATE INDEX transactions_rule ON transactions (rule)",
+)
+
+_INSERT = ("INSERT INTO transactions (id, year, month, date, label, amount, amount_cents, "
+           "status, category, subcategory, rule, source) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)")
+
+
+class SqliteStore:
+    """Bulk writer: add() records in file order, then close(categories)."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self.tmp_path = path + ".tmp"
+        if os.path.exists(self.tmp_path):
+            os.remove(self.tmp_path)
+        self.conn = sqlite3.connect(self.tmp_path, isolation_level=None)
+        # A throwaway file until renamed: no journal or fsync needed
+        self.conn.execute("PRAGMA journal_mode = OFF")
+        self.conn.execute("PRAGMA synchronous = OFF")
+        self.conn.executescript(SCHEMA)
+        self.conn.execute("BEGIN")
+        self.rows = []
+        self.count = 0
+
+    def add(self, tx, rule=None, source="unknown"):
+        self.rows.append((
+            self.count, tx["year"], tx["month"], tx.get("date"), tx["label"], tx["amount"],
+            round(tx["amount"] * 100), tx.get("status"), tx.get("category"), tx.get("subcategory"),
+            rule, source,
+        ))
+        self.count += 1
+        if len(self.rows) >= BATCH:
+            self._flush()
+
+    def _flush(self):
+        self.conn.executemany(_INSERT, self.rows)
+        self.rows = []
+
+    def close(self, categories, rule_set_version: str = None):
+        self._flush()
+        self.conn.executemany("INSERT OR IGNORE INTO categories (name, color) VALUES (?, ?)",
+                              [(c["name"], c.get("color")) for c in categories])
+        self.conn.executemany("INSERT OR IGNORE INTO subcategories (category, name) VALUES (?, ?)",
+                              [(c["name"], s) for c in categories for s in c["subcategories"]])
+        self.conn.executemany("INSERT INTO metadata (key, value) VALUES (?, ?)", [
+            ("rule_set_version", rule_set_version),
+            ("built_at", time.strftime("%Y-%m-%dT%H:%M:%S")),
+            ("transactions", str(self.count)),
+        ])
+        # executescript() would commit first: keep the index builds in the load transaction
+        for statement in INDEXES:
+            self.conn.execute(statement)
+        self.conn.execute("COMMIT")
+        self.conn.execute("ANALYZE")
+        self.conn.close()
+        os.replace(self.tmp_path, self.path)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Load the extracted data into SQLite.")
+    parser.add_argument("--data-dir", default=DATA_DIR)
+    parser.add_argument("--output", help=f"database file (default: DATA_DIR/{STORE_FILE})")
+    args = parser.parse_args(argv)
+
+    with open(os.path.join(args.data_dir, "transactions-bnp.json"), "r", encoding="utf-8") as f:
+        transactions = json.load(f)
+    with open(os.path.join(args.data_dir, "categories.json"), "r", encoding="utf-8") as f:
+        categories = json.load(f)
+
+    output = args.output or os.path.join(args.data_dir, STORE_FILE)
+    store = SqliteStore(output)
+    for tx in transactions:
+        store.add(tx)
+    store.close(categories)
+    print(f"  Written {output} ({store.count} transactions)")
+
+
+if __name__ == "__main__":
+    main()
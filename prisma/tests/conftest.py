@@ -0,0 +1,60 @@
+import json
+import os
+import random
+import shutil
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import categorize
+import matcher_fuzz
+
+
+def _transactions(count=1500, seed=0):
+    rng = random.Random(seed)
+    labels = matcher_fuzz.LabelGenerator(seed)
+    rows = []
+    for _ in range(count):
+        label, amount, date = labels()
+        year, month = rng.randint(2018, 2025), rng.randint(1, 12)
+        tx = {"year": year, "month": month, "amount": amount or round(rng.uniform(-300, 200), 2),
+              "label": label, "date": f"{year}-{month:02d}-{rng.randint(1, 28):02d}"
+              if rng.random() < 0.7 else None, "status": "COMPLETED"}
+        if rng.random() < 0.2:
+            # Categorised in the sheet, some of them Economies without a subcategory
+            tx["category"] = rng.choice(["Alimentation", "Foyer", "Economies"])
+        rows.append(tx)
+    return rows
+
+
+@pytest.fixture
+def data_dir(tmp_path):
+    """Factory: a fresh copy of the same input data in a new directory."""
+    source = tmp_path / "source"
+    source.mkdir()
+    categories = sorted({cat for cat, _ in categorize.EXACT_RULES.values()} | {"Economies"})
+    (source / "categories.json").write_text(json.dumps(
+        [{"name": name, "subcategories": [], "color": "#000"} for name in categories],
+        ensure_ascii=False, indent=2), encoding="utf-8")
+    (source / "transactions-bnp.json").write_text(json.dumps(
+        _transactions(), ensure_ascii=False, indent=2), encoding="utf-8")
+    copies = []
+
+    def copy():
+        target = tmp_path / f"run{len(copies)}"
+        shutil.copytree(source, target)
+        copies.append(target)
+        return target
+    return copy
+
+
+@pytest.fixture
+def run_categorize():
+    """Run categorize.py on a data directory and return the files it wrote."""
+    def run(path, *args):
+        categorize.main(["--data-dir", str(path), *args])
+        return ((path / "transactions-bnp.json").read_bytes(),
+                (path / "categories.json").read_bytes())
+    return run
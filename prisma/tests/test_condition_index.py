@@ -0,0 +1,50 @@
+"""ConditionIndex must agree with the direct predicate on every segment."""
+
+import itertools
+
+import pytest
+
+from condition_index import ConditionIndex, matches
+
+RULES = [
+    ({"min_amount": 10, "max_amount": 20}, "ten-twenty"),
+    ({"sign": "+"}, "credit"),
+    ({"sign": "-", "from": "2024-01-01", "until": "2024-06-30"}, "debit-h1"),
+    ({"max_amount": 0}, "not-credit"),
+]
+
+
+def _reference(rules, amount, date):
+    for idx, (conditions, value) in enumerate(rules):
+        if matches(conditions, amount, date):
+            return idx, value
+    return None
+
+
+@pytest.mark.parametrize("amount", [-20.5, -0.01, 0, 0.01, 9.99, 10, 15, 20, 20.01])
+@pytest.mark.parametrize("date", [None, "2023-12-31", "2024-01-01", "2024-03-15",
+                                  "2024-06-30", "2024-07-01"])
+def test_lookup_matches_predicate_at_boundaries(amount, date):
+    assert ConditionIndex(RULES).lookup(amount, date) == _reference(RULES, amount, date)
+
+
+def test_open_sign_bound_excludes_zero():
+    index = ConditionIndex([({"sign": "+"}, "credit"), ({"sign": "-"}, "debit")])
+    assert index.lookup(0) is None
+    assert index.lookup(0.01) == (0, "credit")
+    assert index.lookup(-0.01) == (1, "debit")
+
+
+def test_date_window_never_matches_unknown_date():
+    index = ConditionIndex([({"from": "2024-01-01"}, "dated")])
+    assert index.lookup(5, "2024-01-01") == (0, "dated")
+    assert index.lookup(5, "2023-12-31") is None
+    assert index.lookup(5, None) is None
+
+
+def test_first_rule_wins_whatever_the_overlap():
+    for order in itertools.permutations(RULES):
+        index = ConditionIndex(list(order))
+        for amount in (-5, 0, 10, 15, 20, 25):
+            for date in (None, "2024-03-01", "2025-01-01"):
+                assert index.lookup(amount, date) == _reference(order, amount, date)
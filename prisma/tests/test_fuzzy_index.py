@@ -0,0 +1,52 @@
+"""DeletionIndex must stay within the per-length edit-distance bounds."""
+
+import pytest
+
+from fuzzy_index import DeletionIndex, edit_distance, fold, max_distance_for
+
+
+@pytest.mark.parametrize("length, bound", [(1, 0), (6, 0), (7, 1), (10, 1), (11, 2), (40, 2)])
+def test_max_distance_for(length, bound):
+    assert max_distance_for(length) == bound
+
+
+def test_edit_distance_counts_transpositions_once():
+    assert edit_distance("monoprix", "mnooprix", 2) == 1
+    assert edit_distance("monoprix", "monoprix", 0) == 0
+    assert edit_distance("monoprix", "mon", 2) == 3
+
+
+def test_short_keys_only_match_after_folding():
+    index = DeletionIndex([("Spar", "s"), ("Canal", "c")])
+    assert index.lookup("SPAR") == ("Spar", "s", 0)
+    assert index.lookup("Spa") is None
+    assert index.lookup("Canap") is None
+
+
+def test_bounds_follow_key_length():
+    index = DeletionIndex([("Monoprix", "m"), ("Leroy Merlin", "l")])
+    assert index.lookup("Monoprx") == ("Monoprix", "m", 1)
+    assert index.lookup("Monprx") is None
+    assert index.lookup("Leroy Mrln") == ("Leroy Merlin", "l", 2)
+    assert index.lookup("Lery Mrln") is None
+
+
+def test_index_max_distance_caps_the_length_bound():
+    index = DeletionIndex([("Leroy Merlin", "l")], max_distance=1)
+    assert index.lookup("Leroy Merln") == ("Leroy Merlin", "l", 1)
+    assert index.lookup("Leroy Mrln") is None
+
+
+def test_exclude_falls_back_to_next_key():
+    index = DeletionIndex([("Picard", "p1"), ("picard", "p2")])
+    assert fold("Picard") == fold("picard")
+    assert index.lookup("PICARD") == ("Picard", "p1", 0)
+    assert index.lookup("PICARD", exclude={"Picard"}) == ("picard", "p2", 0)
+    assert index.lookup("PICARD", exclude={"Picard", "picard"}) is None
+
+
+def test_fallback_is_searched_only_without_a_hit():
+    own = DeletionIndex([("Monoprix", "own")])
+    base = DeletionIndex([("Monoprix", "base"), ("Carrefour", "c")])
+    assert own.lookup("Monoprx", fallback=base) == ("Monoprix", "own", 1)
+    assert own.lookup("Carrefor", fallback=base) == ("Carrefour", "c", 1)
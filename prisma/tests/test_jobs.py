@@ -0,0 +1,5 @@
+"""--jobs must write the same files as the serial run."""
+
+
+def test_jobs_match_serial(data_dir, run_categorize):
+    assert run_categorize(data_dir(), "--jobs", "2") == run_categorize(data_dir())
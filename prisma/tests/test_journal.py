@@ -0,0 +1,17 @@
+"""A journaled rerun and a --replay must write the same files as the plain run."""
+
+import shutil
+
+
+def test_journal_replay_is_identical(data_dir, run_categorize):
+    journaled = data_dir()
+    expected = run_categorize(journaled, "--journal")
+    assert run_categorize(data_dir()) == expected
+
+    # A rerun with unchanged rules replays the journal and leaves the output alone
+    assert run_categorize(journaled, "--journal") == expected
+
+    # Replaying the journal on the original input rebuilds the same output without matching
+    replayed = data_dir()
+    shutil.copy(journaled / "categorize-journal.jsonl", replayed)
+    assert run_categorize(replayed, "--replay") == expected
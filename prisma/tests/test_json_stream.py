@@ -0,0 +1,59 @@
+"""JsonStreamReader must decode the same values whatever the chunk size."""
+
+import io
+import json
+
+import pytest
+
+from categorize import JsonStreamReader, iter_json_array
+
+DOCUMENT = {
+    "version": 3,
+    "transactions": [
+        {"id": 1, "amount": -1234.56, "label": "Café \"du coin\"", "tags": []},
+        {"id": 22, "amount": 1e-3, "label": "Virement", "tags": ["a", "b"]},
+        {"id": 333, "amount": 12345678, "label": "Salaire", "tags": None},
+        -0.5, 7, True, "x",
+    ],
+    "total": -98765.4321,
+}
+TEXT = json.dumps(DOCUMENT, ensure_ascii=False, indent=2)
+
+
+@pytest.mark.parametrize("chunk_size", [1, 2, 3, 5, 7, 64, 1 << 16])
+def test_array_elements_survive_every_chunk_boundary(chunk_size):
+    text = json.dumps(DOCUMENT["transactions"])
+    elements = list(iter_json_array(io.StringIO(text), chunk_size))
+    assert elements == DOCUMENT["transactions"]
+
+
+@pytest.mark.parametrize("chunk_size", [1, 2, 3, 5, 7, 64])
+def test_object_walk_matches_json_load(chunk_size):
+    reader = JsonStreamReader(io.StringIO(TEXT), chunk_size)
+    walked = {}
+    for key in reader.iter_object():
+        walked[key] = list(reader.iter_array()) if key == "transactions" else reader.value()
+    assert walked == DOCUMENT
+
+
+@pytest.mark.parametrize("number", ["123", "-1.5", "1e10", "2.5E-3", "0"])
+def test_top_level_number_split_at_every_position(number):
+    # The number runs to the end of the document and to every chunk boundary
+    for chunk_size in range(1, len(number) + 1):
+        assert JsonStreamReader(io.StringIO(number), chunk_size).value() == json.loads(number)
+
+
+def test_numbers_at_chunk_end_are_not_cut_short():
+    text = "[1234567, 89.125, 3e2]"
+    for chunk_size in range(1, len(text) + 1):
+        assert list(iter_json_array(io.StringIO(text), chunk_size)) == [1234567, 89.125, 300.0]
+
+
+def test_unterminated_array_is_an_error():
+    with pytest.raises(ValueError):
+        list(iter_json_array(io.StringIO('[1, 2'), 2))
+
+
+def test_wrong_container_is_an_error():
+    with pytest.raises(ValueError):
+        list(JsonStreamReader(io.StringIO('{"a": 1}')).iter_array())
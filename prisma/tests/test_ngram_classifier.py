@@ -0,0 +1,78 @@
+"""NgramClassifier training, persistence and abstention."""
+
+import numpy as np
+
+from ngram_classifier import NgramClassifier, row_hashes
+
+LABELS = ["Carrefour Market", "Carrefour City", "Picard", "Total Access", "Esso Station",
+          "Monoprix", "Franprix", "Shell"]
+TARGETS = [("Alimentation", "Courses"), ("Alimentation", "Courses"),
+           ("Alimentation", "Courses"), ("Transport", "Carburant"),
+           ("Transport", "Carburant"), ("Alimentation", None), ("Alimentation", None),
+           ("Transport", "Carburant")]
+ARRAYS = ("features", "indptr", "class_idx", "counts", "class_totals", "class_docs")
+
+
+def _assert_same(a, b):
+    assert a.classes == b.classes
+    for name in ARRAYS:
+        np.testing.assert_array_equal(getattr(a, name), getattr(b, name), err_msg=name)
+
+
+def test_partial_fit_in_batches_equals_one_fit():
+    whole = NgramClassifier().partial_fit(LABELS, TARGETS)
+    batched = NgramClassifier()
+    for start in range(0, len(LABELS), 3):
+        batched.partial_fit(LABELS[start:start + 3], TARGETS[start:start + 3])
+    _assert_same(batched, whole)
+
+
+def test_partial_fit_adds_new_classes():
+    model = NgramClassifier().partial_fit(LABELS[:3], TARGETS[:3])
+    assert model.classes == [("Alimentation", "Courses")]
+    model.partial_fit(["Total Wash"], [("Transport", "Lavage")])
+    assert model.classes == [("Alimentation", "Courses"), ("Transport", "Lavage")]
+    assert model.class_docs.tolist() == [3, 1]
+    assert len(model.class_totals) == 2
+
+
+def test_predict_and_abstain():
+    model = NgramClassifier().partial_fit(LABELS, TARGETS)
+    (cat, sub, confidence), unknown = model.predict(["Carrefour Express", "xqzw"])
+    assert (cat, sub) == ("Alimentation", "Courses")
+    assert 0 < confidence <= 1
+    assert unknown is None
+    assert model.predict(["Carrefour Express"], threshold=1.01) == [None]
+    assert NgramClassifier().predict(["Carrefour"]) == [None]
+
+
+def test_save_load_round_trip(tmp_path):
+    model = NgramClassifier().partial_fit(LABELS, TARGETS)
+    model.mark_trained([3, 1, 2])
+    path = tmp_path / "model.npz"
+    model.save(str(path))
+    loaded = NgramClassifier.load(str(path))
+
+    _assert_same(loaded, model)
+    assert loaded.ngram_range == model.ngram_range and loaded.alpha == model.alpha
+    assert loaded.trained_rows.tolist() == [1, 2, 3]
+    queries = ["Carrefour Express", "Station Esso", "Franprix Paris"]
+    assert loaded.predict(queries) == model.predict(queries)
+
+    # Training goes on from the loaded counts
+    loaded.partial_fit(["Total Wash"], [("Transport", "Lavage")])
+    _assert_same(loaded, NgramClassifier().partial_fit(
+        LABELS + ["Total Wash"], TARGETS + [("Transport", "Lavage")]))
+
+
+def test_row_hashes_number_identical_rows():
+    row = {"year": 2024, "month": 1, "date": None, "label": "Picard", "amount": -12.5,
+           "category": "Alimentation"}
+    recategorised = dict(row, category="Foyer")
+    hashes = row_hashes([row, dict(row), recategorised])
+    assert len(set(hashes.tolist())) == 3
+    assert row_hashes([row])[0] == hashes[0]
+
+    model = NgramClassifier()
+    model.mark_trained(hashes[:2])
+    assert model.untrained(hashes).tolist() == [False, False, True]
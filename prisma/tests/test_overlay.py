@@ -0,0 +1,22 @@
+"""A rule overlay must decide like the base rules rebuilt with its edits."""
+
+import categorize
+import matcher_fuzz
+
+
+def test_overlay_matches_rebuild():
+    overlay = categorize.compile_rules(fuzzy=False).overlay(**matcher_fuzz.SAMPLE_OVERLAY)
+    rebuilt = categorize.compile_rules(exact=overlay.exact, prefix=overlay.prefix,
+                                       contains=overlay.contains, fuzzy=False)
+    labels = matcher_fuzz.LabelGenerator(seed=1)
+    for _ in range(5000):
+        label, amount, date = labels()
+        assert overlay.match(label, amount, date) == rebuilt.match(label, amount, date), label
+
+
+def test_overlay_fuzzy_tier_matches_reference():
+    # The overlay's fuzzy tier tries its own labels before the base ones,
+    # which a rebuilt rule set cannot express: check it against the reference
+    candidate, reference = matcher_fuzz.ENGINES["overlay"]()
+    _, mismatch = matcher_fuzz.check_engine(candidate, reference, iterations=2000)
+    assert mismatch is None, str(mismatch)
@@ -0,0 +1,62 @@
+"""The combined regex tier must pick the first rule in table order."""
+
+import re
+
+import pytest
+
+import categorize
+from categorize import compile_regex_rules
+
+RULES = [
+    (r"\bremboursement\b", "Remboursement", ""),
+    (r"^cb\b", "Divers", "Carte"),
+    (r"\d{2}/\d{2}", "Divers", "Date"),
+]
+
+
+def _rules(regex):
+    return categorize.compile_rules(exact={}, prefix=[], contains=[], regex=regex,
+                                    conditional=[])
+
+
+def _reference(regex, label):
+    for pattern, cat, subcat in regex:
+        if re.search(pattern, label.lower(), re.DOTALL):
+            return (f"regex:{pattern}", cat, subcat)
+    return None
+
+
+@pytest.mark.parametrize("label", [
+    "CB 12/03 remboursement",   # every rule matches, the last one leftmost but one
+    "CB 12/03",                 # second rule leftmost, third later
+    "achat 12/03 cb",           # only the date rule
+    "remboursement",
+    "rien du tout",
+])
+def test_first_rule_in_order_wins(label):
+    rule_id, cat, subcat = _rules(RULES).match(label, -10)
+    expected = _reference(RULES, label)
+    if expected is None:
+        assert not rule_id.startswith("regex:")
+    else:
+        assert (rule_id, cat, subcat) == expected
+
+
+def test_rightmost_earlier_rule_beats_leftmost_later_rule():
+    regex = [(r"zzz", "Late", ""), (r"a", "Early", "")]
+    assert _rules(regex).match("a zzz", -1)[:2] == ("regex:zzz", "Late")
+
+
+def test_groups_map_names_to_rule_order():
+    pattern, groups = compile_regex_rules(RULES)
+    assert [groups[f"r{i}"] for i in range(len(RULES))] == list(enumerate(RULES))
+    assert pattern.search("cb 01/02").lastgroup == "r1"
+
+
+def test_empty_table_compiles_to_no_pattern():
+    assert compile_regex_rules([]) == (None, {})
+
+
+def test_named_groups_are_rejected():
+    with pytest.raises(ValueError):
+        compile_regex_rules([(r"(?P<day>\d+)", "Divers", "")])
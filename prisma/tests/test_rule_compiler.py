@@ -0,0 +1,60 @@
+"""live_rules must only drop rules that can never fire."""
+
+import textwrap
+
+from rule_compiler import exact_key_duplicates, live_rules
+
+
+def test_prefix_shadowed_by_earlier_prefix():
+    rules = [("amazon", "Shopping", ""), ("amazon prime", "Loisirs", "Streaming"),
+             ("prime", "Loisirs", "")]
+    live, dead = live_rules(rules, "prefix")
+    assert live == [rules[0], rules[2]]
+    assert dead == [(rules[1], "shadowed", "amazon")]
+
+
+def test_contains_shadowed_by_earlier_substring():
+    rules = [("uber", "Transport", ""), ("uber eats", "Alimentation", "Resto"),
+             ("eats", "Alimentation", "")]
+    live, dead = live_rules(rules, "contains")
+    assert live == [rules[0], rules[2]]
+    assert dead == [(rules[1], "shadowed", "uber")]
+
+
+def test_later_shorter_pattern_is_not_shadowed():
+    # "uber eats" first does not cover plain "uber" labels
+    rules = [("uber eats", "Alimentation", "Resto"), ("uber", "Transport", "")]
+    assert live_rules(rules, "contains") == (rules, [])
+    assert live_rules(rules, "prefix") == (rules, [])
+
+
+def test_substring_only_shadows_contains_tier():
+    rules = [("eats", "Alimentation", ""), ("uber eats", "Alimentation", "Resto")]
+    assert live_rules(rules, "prefix") == (rules, [])
+    assert live_rules(rules, "contains")[1] == [(rules[1], "shadowed", "eats")]
+
+
+def test_duplicates_and_uppercase():
+    rules = [("sncf", "Transport", "Train"), ("sncf", "Transport", "Train"),
+             ("sncf", "Voyage", ""), ("SNCF", "Transport", "Train")]
+    live, dead = live_rules(rules, "prefix")
+    assert live == [rules[0]]
+    assert dead == [(rules[1], "duplicate", "sncf"), (rules[2], "duplicate-conflict", "sncf"),
+                    (rules[3], "uppercase", None)]
+
+
+def test_exact_key_duplicates(tmp_path):
+    source = tmp_path / "rules.py"
+    source.write_text(textwrap.dedent("""\
+        EXACT_RULES = {
+            "Picard": ("Alimentation", "Courses"),
+            "Leclerc": ("Alimentation", "Courses"),
+            "Picard": ("Alimentation", "Surgelés"),
+            "Leclerc": ("Alimentation", "Courses"),
+        }
+        """), encoding="utf-8")
+    duplicates = {d["key"]: d for d in exact_key_duplicates(str(source))}
+    assert duplicates["Picard"]["lines"] == [2, 4]
+    assert duplicates["Picard"]["conflict"]
+    assert duplicates["Picard"]["values"][-1] == ["Alimentation", "Surgelés"]
+    assert not duplicates["Leclerc"]["conflict"]
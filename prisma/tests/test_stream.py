@@ -0,0 +1,5 @@
+"""--stream must write the same files as the plain batch run."""
+
+
+def test_stream_matches_batch(data_dir, run_categorize):
+    assert run_categorize(data_dir(), "--stream") == run_categorize(data_dir())